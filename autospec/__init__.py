@@ -1,5 +1,6 @@
 """Autospec, an automated specfile generation utility."""
 
-__all__ = ["abireport", "buildreq", "build", "config", "files",
-           "git", "lang", "license", "patches", "specdescription",
-           "tarball", "util", "commitmessage", "test", "patches"]
+__all__ = ["abireport", "analysiscache", "buildreq", "build", "config", "elf", "files",
+           "compress", "events", "git", "lang", "license", "loganalyzer", "patches", "rpmfile", "specdescription",
+           "srccache", "srcindex", "tarball", "timings", "util", "commitmessage", "test",
+           "patches"]
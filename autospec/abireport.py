@@ -20,17 +20,36 @@
 # a consistent ABI report for every build. We ensure that everything is
 # appropriately sorted, in that a diff only occurs when the shared libraries
 # in the package themselves actually change too.
-
+#
+# RPM payloads are streamed by the rpmfile module and ELF files are read
+# in-process by the elf module; file, objdump, readelf and nm are only used
+# for files it can't parse. The ABI of each ELF file is cached by its
+# SHA-256, and the changes to the symbols report are written to
+# results/abi_diff.json.
+
+import collections
+import concurrent.futures
+import hashlib
+import json
 import os
 import re
 import shutil
 import subprocess
 import sys
+import tempfile
 
+import elf
+import rpmfile
 import util
 
 valid_dirs = ["/usr/lib", "/usr/lib64"]
 
+# Examine files in a process pool from this many files on
+abi_pool_min_jobs = 16
+
+# Bump when elf_record changes to invalidate the ABI cache
+abi_cache_version = 1
+
 # For determining .so's
 reg = re.compile(r".* ELF (64|32)\-bit LSB shared object,")
 
@@ -61,6 +80,14 @@ def get_output(cmd):
 
 
 def get_soname(path):
+    """Return the SONAME of a file, read in-process when possible."""
+    try:
+        return elf.ElfFile.from_path(path).soname()
+    except elf.ElfError:
+        return get_soname_objdump(path)
+
+
+def get_soname_objdump(path):
     """Use objdump to find the SONAME of a file."""
     cmd = 'objdump -p "{}"|grep SONAME'.format(path)
     try:
@@ -76,6 +103,14 @@ def get_soname(path):
 
 def get_shared_dependencies(path):
     """Return the shared dependencies for a given path."""
+    try:
+        return set(elf.ElfFile.from_path(path).needed())
+    except elf.ElfError:
+        return get_shared_dependencies_readelf(path)
+
+
+def get_shared_dependencies_readelf(path):
+    """Use readelf to find the shared dependencies of a file."""
     ret = set()
     cmd = "readelf -d {}".format(path)
 
@@ -89,38 +124,31 @@ def get_shared_dependencies(path):
     return ret
 
 
-def get_all_dependencies(path):
-    """Determine all dependencies in the given path."""
+def binaries_dependencies(binaries):
+    """Return the NEEDED entries of binaries, given as (soname, NEEDED), not provided by one of them."""
     deps = set()
-
-    sonames = set()
-    examine = set()
-
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            fpath = os.path.join(root, file)
-            if not is_dynamic_binary(fpath):
-                continue
-            # Encountered a valid dynamic linked object
-            if is_file_valid(fpath):
-                # We must account for *all* internal symbols due to rpaths and
-                # overriding of LD_LIBRARY_PATH
-                soname = get_soname(fpath)
-                if soname is not None:
-                    sonames.add(soname)
-            if is_dynamic_binary(fpath):
-                examine.add(fpath)
-
-    for path in examine:
-        current_deps = get_shared_dependencies(path)
-        # Ensure we don't add a dependency on an internally provided symbol
+    # Ensure we don't add a dependency on an internally provided symbol
+    sonames = set(soname for soname, _ in binaries if soname is not None)
+    for _, current_deps in binaries:
         deps.update(set(filter(lambda s: s not in sonames, current_deps)))
-
     return deps
 
 
 def get_file_magic(path):
-    """Return the 'magic' for a given path."""
+    """Return the 'magic' for a given path, as file(1) words it for ELF files.
+
+    Files that aren't ELF give None without running file(1).
+    """
+    if not elf.is_elf(path):
+        return None
+    try:
+        return "{}: {}".format(path, elf.ElfFile.from_path(path).describe())
+    except elf.ElfError:
+        return get_file_magic_file(path)
+
+
+def get_file_magic_file(path):
+    """Use file(1) to find the 'magic' for a given path."""
     cmd = 'file "{}"'.format(path)
     try:
         line = get_output(cmd).split("\n")[0]
@@ -154,7 +182,21 @@ def is_file_valid(path):
 
 
 def dump_symbols(path):
-    """Get symbols from a file."""
+    """Get the exported symbols of a file, read in-process when possible."""
+    try:
+        return exported_symbols(elf.ElfFile.from_path(path))
+    except elf.ElfError:
+        return dump_symbols_nm(path)
+
+
+def exported_symbols(elf_file):
+    """Return the wanted dynamic symbols of an ElfFile."""
+    return set(sym_id for sym_id, sym_type in elf_file.dynamic_symbols()
+               if sym_type in wanted_symbol_types and sym_id not in ignored_symbols)
+
+
+def dump_symbols_nm(path):
+    """Use nm to get the exported symbols of a file."""
     cmd = 'nm --defined-only -g --dynamic "{}"'.format(path)
     lines = None
 
@@ -210,11 +252,13 @@ def examine_abi(download_path, name):
         util.print_fatal("Results directory does not exist, aborting")
         sys.exit(1)
 
+    old_symbols = read_symbols(os.path.join(download_path, "symbols"))
     if util.binary_in_path("abireport"):
         examine_abi_host(download_path, results_dir, name)
     else:
         util.print_warning("abireport is not installed. Using slow scanning")
         examine_abi_fallback(download_path, results_dir, name)
+    write_symbols_diff(old_symbols, download_path, results_dir)
 
 
 def examine_abi_host(download_path, results_dir, name):
@@ -237,71 +281,268 @@ def examine_abi_host(download_path, results_dir, name):
         util.print_fatal("Error invoking abireport: {}".format(e))
 
 
-def examine_abi_fallback(download_path, results_dir, name):
-    """Missing abireport so fallback to internal scanning."""
-    old_dir = os.getcwd()
+def elf_members(rpm):
+    """Generate (names, data) for the ELF regular files in the payload of an RPM.
 
-    rpms = set()
-    for item in os.listdir(results_dir):
-        namelen = len(name)
-        if item.find("-extras-", namelen) >= namelen:
+    Hardlinked files are reported once, with all of their names.
+    """
+    links = {}
+    for entry in rpmfile.iter_rpm_files(rpm):
+        if not entry.isreg():
             continue
-        if item.endswith(".rpm") and not item.endswith(".src.rpm"):
-            rpms.add(os.path.basename(item))
+        if entry.nlink > 1 and entry.size == 0:
+            # newc stores the data of hardlinked files with the last link
+            links.setdefault(entry.ino, []).append(entry.name)
+            continue
+        names = links.pop(entry.ino, []) + [entry.name]
+        if entry.read(len(elf.ELF_MAGIC)) != elf.ELF_MAGIC:
+            continue
+        yield names, elf.ELF_MAGIC + entry.read()
+
+
+def elf_members_extracted(rpm):
+    """Generate elf_members results for an RPM extracted with rpm2cpio and cpio."""
+    with tempfile.TemporaryDirectory() as extract_dir:
+        try:
+            cmd = 'rpm2cpio "{}" | cpio -imd 2>/dev/null'.format(rpm)
+            subprocess.check_call(cmd, shell=True, cwd=extract_dir)
+        except Exception as e:
+            util.print_fatal("Error extracting RPMS: {}".format(e))
+            return
+
+        for root, dirs, files in os.walk(extract_dir):
+            dirs.sort()
+            for file in sorted(files):
+                fpath = os.path.join(root, file)
+                if os.path.islink(fpath) or not elf.is_elf(fpath):
+                    continue
+                with open(fpath, "rb") as f:
+                    yield ["/" + os.path.relpath(fpath, extract_dir)], f.read()
+
+
+def rpm_elf_members(rpm):
+    """Generate elf_members results, extracting the RPM if its payload can't be streamed."""
+    try:
+        yield from elf_members(rpm)
+    except Exception as e:
+        util.print_warning("Unable to stream {}, extracting it instead: {}".format(rpm, e))
+        yield from elf_members_extracted(rpm)
 
-    if len(rpms) == 0:
-        util.print_fatal("No usable rpms found, aborting")
-        sys.exit(1)
 
-    extract_dir = os.path.abspath(os.path.join(download_path, "__extraction"))
-    purge_tree(extract_dir)
+def elf_record(data):
+    """Return the ABI of the ELF file in data as a cacheable dict.
 
+    The dict holds the file(1) style description, SONAME and NEEDED
+    entries and, for shared objects, the exported symbols; or the error
+    if the file can't be read.
+    """
     try:
-        os.makedirs(extract_dir)
-    except Exception as e:
-        util.print_fatal("Cannot create extraction tree: {}".format(e))
-        sys.exit(1)
+        elf_file = elf.ElfFile(data)
+        symbols = None
+        if elf_file.kind() == "shared object":
+            symbols = sorted(exported_symbols(elf_file))
+        return {
+            "magic": elf_file.describe(),
+            "soname": elf_file.soname(),
+            "needed": elf_file.needed(),
+            "symbols": symbols,
+        }
+    except elf.ElfError as e:
+        return {"error": str(e)}
+
+
+def elf_record_binutils(data):
+    """Return the elf_record of the ELF file in data, as read by file, objdump, readelf and nm."""
+    with tempfile.NamedTemporaryFile(prefix="abireport-", suffix=".elf") as elf_f:
+        elf_f.write(data)
+        elf_f.flush()
+        path = elf_f.name
+        magic = get_file_magic_file(path)
+        if not magic or not magic.startswith(path + ": "):
+            return {"error": "file(1) can't describe it"}
+        magic = magic[len(path) + 2:]
+        symbols = None
+        if reg.match("{}: {}".format(path, magic)):
+            symbols = sorted(dump_symbols_nm(path))
+        return {
+            "magic": magic,
+            "soname": get_soname_objdump(path),
+            "needed": sorted(get_shared_dependencies_readelf(path)),
+            "symbols": symbols,
+        }
+
+
+def abi_cache_path(key):
+    """Return the cache file of the elf_record for the file with SHA-256 key."""
+    return os.path.join(util.get_cache_dir("abi"), "{}-{}.json".format(abi_cache_version, key))
+
+
+def read_abi_cache(key):
+    """Return the cached elf_record for key, or None."""
+    path = abi_cache_path(key)
+    try:
+        with open(path) as cache_f:
+            return json.load(cache_f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        util.print_warning("Ignoring ABI cache {}: {}".format(path, e))
+        return None
 
-    os.chdir(extract_dir)
 
-    # Extract all those rpms to our current directory
+def write_abi_cache(key, record):
+    """Store the elf_record for key."""
+    path = abi_cache_path(key)
+    tmp_path = "{}.tmp-{}".format(path, os.getpid())
     try:
-        for rpm in rpms:
-            cmd = 'rpm2cpio "{}" | cpio -imd 2>/dev/null'.format(os.path.join(results_dir, rpm))
-            subprocess.check_call(cmd, shell=True)
-    except Exception as e:
-        util.print_fatal("Error extracting RPMS: {}".format(e))
+        with open(tmp_path, "w") as cache_f:
+            json.dump(record, cache_f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        util.print_warning("Unable to write ABI cache {}: {}".format(path, e))
+
+
+def examine_elf(names, record):
+    """Return the libraries (path, soname, symbols) and dynamic binary info (soname, NEEDED) of an elf_record.
+
+    The file is classified like is_dynamic_binary and is_file_valid do,
+    and only shared objects directly in valid_dirs are reported as
+    libraries.
+    """
+    if "error" in record:
+        util.print_warning("Unable to read {}: {}".format(names[0], record["error"]))
+        return [], None
+    magic = "{}: {}".format(names[0], record["magic"])
+    if not valid_dyn.match(magic):
+        return [], None
+    if not reg.match(magic):
+        return [], (None, set(record["needed"]))
+    soname = record["soname"]
+    libraries = []
+    for name in names:
+        if os.path.dirname(name) in valid_dirs:
+            libraries.append((name, soname, set(record["symbols"])))
+    return libraries, (soname, set(record["needed"]))
+
+
+def examine_rpms(rpms):
+    """Return examine_elf results for every ELF file shipped in rpms, in payload order.
+
+    Files are looked up in the ABI cache by their SHA-256, so only new
+    or changed files are analyzed. Once abi_pool_min_jobs files need
+    analyzing, the rest are analyzed in a process pool, a bounded number
+    at a time. Files the ELF reader can't parse are handed to binutils,
+    and those records are not cached.
+    """
+    workers = len(os.sched_getaffinity(0))
+    records = {}
+    members = []
+    pending = collections.deque()
+    executor = None
+
+    def store(key, record, data):
+        """Keep the record for key, falling back to binutils for unreadable files."""
+        if "error" in record:
+            records[key] = elf_record_binutils(data)
+        else:
+            records[key] = record
+            write_abi_cache(key, record)
 
-    os.chdir(download_path)
-    collected_files = set()
+    try:
+        for rpm in rpms:
+            for names, data in rpm_elf_members(rpm):
+                key = hashlib.sha256(data).hexdigest()
+                members.append((names, key))
+                if key in records:
+                    continue
+                records[key] = read_abi_cache(key)
+                if records[key] is not None:
+                    continue
+                if executor is None and workers > 1 and len(records) >= abi_pool_min_jobs:
+                    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+                if executor is None:
+                    store(key, elf_record(data), data)
+                    continue
+                pending.append((key, executor.submit(elf_record, data), data))
+                while len(pending) > workers * 2 or (pending and pending[0][1].done()):
+                    key, future, data = pending.popleft()
+                    store(key, future.result(), data)
+        while pending:
+            key, future, data = pending.popleft()
+            store(key, future.result(), data)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return [examine_elf(names, records[key]) for names, key in members]
+
+
+def read_symbols(path):
+    """Return {soname: set of symbols} from a symbols report."""
+    symbols = dict()
+    if not os.path.exists(path):
+        return symbols
+    with util.open_auto(path, "r") as report:
+        for line in report:
+            soname, sep, symbol = line.rstrip("\n").partition(":")
+            if sep:
+                symbols.setdefault(soname, set()).add(symbol)
+    return symbols
+
+
+def symbols_diff(old, new):
+    """Return {soname: {"added": [...], "removed": [...]}} for the sonames whose symbols changed."""
+    diff = dict()
+    for soname in sorted(set(old) | set(new)):
+        added = new.get(soname, set()) - old.get(soname, set())
+        removed = old.get(soname, set()) - new.get(soname, set())
+        if added or removed:
+            diff[soname] = {"added": sorted(added), "removed": sorted(removed)}
+    return diff
+
+
+def write_symbols_diff(old_symbols, download_path, results_dir):
+    """Write the changes to the symbols report to results/abi_diff.json."""
+    diff = symbols_diff(old_symbols, read_symbols(os.path.join(download_path, "symbols")))
+    for soname, changes in diff.items():
+        if changes["removed"]:
+            util.print_warning("{} no longer exports {} symbols".format(soname, len(changes["removed"])))
+    with util.open_auto(os.path.join(results_dir, "abi_diff.json"), "w") as diff_f:
+        json.dump(diff, diff_f, indent=2, sort_keys=True)
+        diff_f.write("\n")
 
-    # Places we expect to find shared libraries
-    for check_path in valid_dirs:
-        if check_path[0] == "/":
-            check_path = check_path[1:]
 
-        dirn = os.path.join(extract_dir, check_path)
-        if not os.path.isdir(dirn):
+def examine_abi_fallback(download_path, results_dir, name):
+    """Missing abireport so fallback to internal scanning."""
+    rpms = set()
+    for item in os.listdir(results_dir):
+        namelen = len(name)
+        if item.find("-extras-", namelen) >= namelen:
             continue
+        if item.endswith(".rpm") and not item.endswith(".src.rpm"):
+            rpms.add(os.path.basename(item))
 
-        for file in os.listdir(dirn):
-            f = os.path.basename(file)
+    if len(rpms) == 0:
+        util.print_fatal("No usable rpms found, aborting")
+        sys.exit(1)
 
-            clean_path = os.path.abspath(os.path.join(dirn, f))
-            if not is_file_valid(clean_path):
-                continue
-            collected_files.add(clean_path)
+    # Read the ELF files straight from the rpm payloads
+    libraries = dict()
+    binaries = []
+    for rpm_libraries, binary in examine_rpms([os.path.join(results_dir, rpm) for rpm in sorted(rpms)]):
+        for library, soname, symbols in rpm_libraries:
+            libraries[library] = (soname, symbols)
+        if binary is not None:
+            binaries.append(binary)
 
     abi_report = dict()
 
     # Now examine these libraries
-    for library in sorted(collected_files):
-        soname = get_soname(library)
+    for library in sorted(libraries):
+        soname, symbols = libraries[library]
         if not soname:
             warn = "Failed to determine soname of: {}".format(library)
             util.print_warning(warn)
             soname = os.path.basename(library)
-        symbols = dump_symbols(library)
         if symbols and len(symbols) > 0:
             if soname not in abi_report:
                 abi_report[soname] = set()
@@ -321,7 +562,7 @@ def examine_abi_fallback(download_path, results_dir, name):
         truncate_file(report_file)
 
     # Write the library report
-    lib_deps = get_all_dependencies(extract_dir)
+    lib_deps = binaries_dependencies(binaries)
     report_file = os.path.join(download_path, "used_libs")
     if len(lib_deps) > 0:
         report = util.open_auto(report_file, "w")
@@ -330,6 +571,3 @@ def examine_abi_fallback(download_path, results_dir, name):
         report.close()
     else:
         truncate_file(report_file)
-
-    os.chdir(old_dir)
-    purge_tree(extract_dir)
@@ -0,0 +1,119 @@
+#!/bin/true
+#
+# analysiscache.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Cache of the static analysis of a package (build pattern, requirements,
+# licenses and summary), keyed by the upstream file, the control files
+# read by Config.parse_config_files, the pattern files and autospec itself,
+# so reruns on unchanged sources go straight to writing the spec.
+
+import glob
+import hashlib
+import os
+import pickle
+
+import license
+import specdescription
+import util
+from util import print_debug, print_info, print_warning
+
+analysis_cache_version = 1
+
+# Config attributes set by Requirements.scan_for_configure
+config_attrs = ("default_pattern", "pattern_strength", "autoreconf", "set_gopath")
+license_attrs = ("licenses", "license_files", "hashes")
+description_attrs = ("default_summary", "default_summary_score", "default_description", "default_description_score")
+
+
+def digest_files(sh, paths):
+    """Add the names and contents of paths to sh, marking missing files."""
+    for path in paths:
+        sh.update(path.encode("utf-8", errors="surrogateescape") + b"\0")
+        try:
+            sh.update(util.get_contents(path))
+        except OSError:
+            sh.update(b"\0missing")
+        sh.update(b"\0")
+
+
+def cache_key(conf):
+    """Return the analysis cache key for conf, or None without an upstream file."""
+    upstream = os.path.join(conf.download_path, "upstream")
+    if not os.path.isfile(upstream):
+        return None
+    sh = hashlib.sha256(f"{analysis_cache_version}\0".encode("utf-8"))
+    digest_files(sh, [upstream])
+    control_files = set(conf.config_files) | {"options.conf"}
+    digest_files(sh, [os.path.join(conf.download_path, name) for name in sorted(control_files)])
+    if conf.config_file:
+        digest_files(sh, [conf.config_file])
+    autospec_dir = os.path.dirname(os.path.abspath(__file__))
+    pattern_dirs = [autospec_dir] + ([conf.failed_pattern_dir] if conf.failed_pattern_dir else [])
+    for path in pattern_dirs:
+        digest_files(sh, sorted(p for p in glob.glob(os.path.join(path, "*")) if os.path.isfile(p)))
+    return sh.hexdigest()
+
+
+def cache_path(key):
+    """Return the file holding the analysis for key."""
+    return os.path.join(util.get_cache_dir("analysis"), f"{key}.pickle")
+
+
+def save(key, conf, requirements):
+    """Store the static analysis results of conf and requirements under key."""
+    state = {
+        "config": {attr: getattr(conf, attr) for attr in config_attrs},
+        "requirements": dict(vars(requirements)),
+        "license": {attr: getattr(license, attr) for attr in license_attrs},
+        "specdescription": {attr: getattr(specdescription, attr) for attr in description_attrs},
+    }
+    path = cache_path(key)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as cache_f:
+            pickle.dump(state, cache_f)
+        os.replace(tmp_path, path)
+    except Exception as err:
+        # Unpicklable values raise TypeError or AttributeError, not only PicklingError
+        print_warning(f"Unable to write analysis cache {path}: {err}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load(key, conf, requirements):
+    """Restore the static analysis results stored under key, returning False if there are none."""
+    path = cache_path(key)
+    try:
+        with open(path, "rb") as cache_f:
+            state = pickle.load(cache_f)
+    except FileNotFoundError:
+        return False
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as err:
+        print_warning(f"Ignoring analysis cache {path}: {err}")
+        return False
+
+    for attr, value in state["config"].items():
+        setattr(conf, attr, value)
+    vars(requirements).update(state["requirements"])
+    for attr, value in state["license"].items():
+        setattr(license, attr, value)
+    for attr, value in state["specdescription"].items():
+        setattr(specdescription, attr, value)
+    print_info(f"Using cached static analysis {key}")
+    if util.debugging:
+        print_debug(f"Analysis cache: {path}")
+    print("Licenses    : ", " ".join(sorted(license.licenses)))
+    return True
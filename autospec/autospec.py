@@ -17,6 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import concurrent.futures
 import configparser
 import os
 import re
@@ -24,11 +25,14 @@ import sys
 import tempfile
 
 from abireport import examine_abi
+import analysiscache
 import build
 import buildreq
 import check
 import commitmessage
+import compress
 import config
+import events
 import files
 import git
 import license
@@ -37,6 +41,8 @@ import pkg_integrity
 import pkg_scan
 import specdescription
 import specfiles
+import srccache
+import srcindex
 import tarball
 import util
 import shutil
@@ -46,6 +52,10 @@ from util import binary_in_path, print_fatal, write_out, print_debug, print_warn
 
 sys.path.append(os.path.dirname(__file__))
 
+# Upper bound of archives_from_git entries cloned and archived at once
+archives_from_git_workers = min(8, os.cpu_count() or 1)
+
+
 def link_new_rpms_here():
     make_cmd = f"make link-new-rpms-here"
     try:
@@ -133,8 +143,11 @@ def read_old_metadata():
     )
 
 
-def save_mock_logs(path, iteration, short_circuit):
-    """Save Mock build logs to <path>/results/round<iteration>-*.log."""
+def save_mock_logs(path, iteration, short_circuit, archiver=None):
+    """Save Mock build logs to <path>/results/round<iteration>-*.log.
+
+    The saved logs are handed to archiver, which compresses older rounds.
+    """
     basedir = os.path.join(path, "results")
     loglist = [
         "build",
@@ -144,10 +157,15 @@ def save_mock_logs(path, iteration, short_circuit):
         "mock_srpm",
         "mock_build",
     ]
+    saved = []
     for log in loglist:
         src = "{}/{}.log".format(basedir, log)
         dest = "{}/{}-round{}-{}.log".format(basedir, short_circuit, iteration, log)
         os.rename(src, dest)
+        saved.append(dest)
+    if archiver:
+        archiver.add_round(saved)
+    return saved
 
 
 def write_prep(conf, workingdir, content):
@@ -266,6 +284,15 @@ def main():
     parser.add_argument(
         "-dbg", "--debug", action="store_true", dest="debug", default=False, help="Enable debugging",
     )
+    parser.add_argument(
+        "-xc", "--extract_cache", action="store", dest="extract_cache", default=None, help="Cache extracted sources across runs, using at most SIZE (e.g. 20G)",
+    )
+    parser.add_argument(
+        "-nac", "--no_analysis_cache", action="store_true", dest="no_analysis_cache", default=False, help="Redo the static analysis even if sources and control files are unchanged",
+    )
+    parser.add_argument(
+        "-krl", "--keep_round_logs", action="store", dest="keep_round_logs", type=int, default=2, help="Number of most recent build rounds whose logs are kept uncompressed",
+    )
     parser.add_argument(
         "-fbrpm", "--force_build_srpm", action="store_true", dest="force_build_srpm", default=False, help="Force building srpm",
     )
@@ -453,6 +480,47 @@ def main():
             )
 
 
+def archive_from_git(package_path, arch_url, arch_branch, arch_submodule, arch_forcefullclone, redownload_archive, conf):
+    """Find or create the tarball for one archives_from_git entry."""
+    download_file_full_path = ""
+    arch_name = os.path.splitext(os.path.basename(arch_url))[0]
+    filename_re = re.compile(r"^{}{}".format(re.escape(arch_name), r"-.*\.tar\.gz"))
+    for filename in os.scandir(package_path):
+        if filename.is_file() and filename_re.search(filename.name):
+            download_file_full_path = "file://{}".format(os.path.abspath(os.path.join(package_path, filename.name)))
+            if util.debugging:
+                print_debug(f"archive found: {arch_name} - {download_file_full_path}")
+            break
+    if not download_file_full_path or redownload_archive is True:
+        if util.debugging:
+            print_debug(f"Download archive: {arch_name} - {arch_url}")
+        download_file_full_path = git.git_archive_all(path=package_path, name=arch_name, url=arch_url, branch=arch_branch, force_module=str_to_bool(arch_submodule), force_fullclone=str_to_bool(arch_forcefullclone), conf=conf)
+    return download_file_full_path
+
+
+def archives_from_git_all(package_path, arch_url, arch_branch, arch_submodule, arch_forcefullclone, redownload_archive, conf):
+    """Run archive_from_git for every archives_from_git entry, in a thread pool.
+
+    The results are returned in the order of arch_url. A failing entry does
+    not stop the others, autospec exits once they are all finished.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(archives_from_git_workers, len(arch_url)))) as executor:
+        futures = []
+        for index, new_arch_url in enumerate(arch_url, start=0):
+            futures.append(executor.submit(archive_from_git, package_path, new_arch_url, arch_branch[index], arch_submodule[index], arch_forcefullclone[index], redownload_archive, conf))
+    arch_results = []
+    failed = False
+    for index, future in enumerate(futures):
+        try:
+            arch_results.append(future.result())
+        except (Exception, SystemExit) as err:
+            print_fatal(f"Unable to archive {arch_url[index]} (branch {arch_branch[index]}): {err}")
+            failed = True
+    if failed:
+        sys.exit(1)
+    return arch_results
+
+
 def package(
     args, url, name, archives, archives_from_git, workingdir, download_from_git, branch, redownload_from_git, redownload_archive, force_module, force_fullclone, mock_dir, short_circuit, do_file_restart,
 ):
@@ -549,82 +617,29 @@ def package(
             arch_forcefullclone.append(ffc)
             if util.debugging:
                 print_debug(f"FOR ZIP {arch_url[-1]} - {arch_destination[-1]} - {arch_branch[-1]} - {arch_submodule[-1]} - {arch_forcefullclone[-1]}")
-        for index, new_arch_url in enumerate(arch_url, start=0):
-            found_file = False
-            fileslist = []
-            download_file_full_path = ""
-            arch_name = os.path.splitext(os.path.basename(new_arch_url))[0]
-            arch_name_re_escaped = re.escape(arch_name)
-            filename_re = re.compile(r"^{}{}".format(arch_name_re_escaped, r"-.*\.tar\.gz"))
+        if os.path.basename(os.getcwd()) == name:
+            package_path = "./"
+        else:
+            package_path = f"packages/{name}"
+        if util.debugging:
+            print_debug(f"archive package_path: {package_path}")
+        arch_results = archives_from_git_all(package_path, arch_url, arch_branch, arch_submodule, arch_forcefullclone, redownload_archive, conf)
+        for index, download_file_full_path in enumerate(arch_results):
             if util.debugging:
-                print_debug(f"arch_name: {arch_name}")
-            if os.path.basename(os.getcwd()) == name:
-                package_path = "./"
-                if util.debugging:
-                    print_debug(f"archive package_path 1: {package_path}")
-                for filename in os.scandir(package_path):
-                    if filename.is_file():
-                        if filename_re.search(filename.name):
-                            found_file = True
-                            download_file_full_path = "file://{}".format(os.path.abspath(f"{package_path}{filename.name}"))
-                            if util.debugging:
-                                print_debug(f"filename: {filename.name}")
-                                print_debug(f"Index: {index}")
-                                print_debug(f"Destination: {arch_destination[index]} - Branch: {arch_branch[index]}")
-                                print_debug(f"archive found 1: {arch_name} - {download_file_full_path}")
-                            break
-                if not found_file or redownload_archive is True:
-                    if util.debugging:
-                        print_debug(f"Index: {index}")
-                        print_debug(f"Destination: {arch_destination[index]} - Branch: {arch_branch[index]}")
-                        print_debug(f"Fazer download archive 1: {arch_name} - {new_arch_url}")
-                    download_file_full_path = git.git_archive_all(path=package_path, name=arch_name, url=new_arch_url, branch=arch_branch[index], force_module=str_to_bool(arch_submodule[index]), force_fullclone=str_to_bool(arch_forcefullclone[index]), conf=conf)
-                if util.debugging:
-                    print_debug(f"archive download_file_full_path 1: {download_file_full_path}")
-                if download_file_full_path in archives or arch_destination[index] in archives:
-                    print_info(f"\nAlready in archives: {archives}")
-                else:
-                    archives.append(download_file_full_path)
-                    archives.append(arch_destination[index])
-                    print_info(f"\nAdding to archives: {archives}")
-                new_archives_from_git.append(arch_url[index])
-                new_archives_from_git.append(arch_destination[index])
-                new_archives_from_git.append(arch_branch[index])
-                new_archives_from_git.append(arch_submodule[index])
-                new_archives_from_git.append(arch_forcefullclone[index])
+                print_debug(f"Index: {index}")
+                print_debug(f"Destination: {arch_destination[index]} - Branch: {arch_branch[index]}")
+                print_debug(f"archive download_file_full_path: {download_file_full_path}")
+            if download_file_full_path in archives or arch_destination[index] in archives:
+                print_info(f"\nAlready in archives: {archives}")
             else:
-                package_path = f"packages/{name}"
-                if util.debugging:
-                    print_debug(f"archive package_path 2: {package_path}")
-                for filename in os.scandir(package_path):
-                    if filename.is_file():
-                        if filename_re.search(filename.name):
-                            found_file = True
-                            download_file_full_path = "file://{}".format(os.path.abspath(f"{package_path}{filename.name}"))
-                            if util.debugging:
-                                print_debug(f"Index: {index}")
-                                print_debug(f"Destination: {arch_destination[index]} - Branch: {arch_branch[index]}")
-                                print_debug(f"archive found 2: {arch_name} - {download_file_full_path}")
-                            break
-                if not found_file or redownload_archive is True:
-                    if util.debugging:
-                        print_debug(f"Index: {index}")
-                        print_debug(f"Destination: {arch_destination[index]} - Branch: {arch_branch[index]}")
-                        print_debug(f"Fazer download archive 2: {arch_name} - {new_arch_url}")
-                    download_file_full_path = git.git_archive_all(path=package_path, name=arch_name, url=new_arch_url, branch=arch_branch[index], force_module=str_to_bool(arch_submodule[index]), force_fullclone=str_to_bool(arch_forcefullclone[index]), conf=conf)
-                if util.debugging:
-                    print_debug(f"archive download_file_full_path 2: {download_file_full_path}")
-                if download_file_full_path in archives or arch_destination[index] in archives:
-                    print_info(f"\nAlready in archives: {archives}")
-                else:
-                    archives.append(download_file_full_path)
-                    archives.append(arch_destination[index])
-                    print_info(f"\nAdding to archives: {archives}")
-                new_archives_from_git.append(arch_url[index])
-                new_archives_from_git.append(arch_destination[index])
-                new_archives_from_git.append(arch_branch[index])
-                new_archives_from_git.append(arch_submodule[index])
-                new_archives_from_git.append(arch_forcefullclone[index])
+                archives.append(download_file_full_path)
+                archives.append(arch_destination[index])
+                print_info(f"\nAdding to archives: {archives}")
+            new_archives_from_git.append(arch_url[index])
+            new_archives_from_git.append(arch_destination[index])
+            new_archives_from_git.append(arch_branch[index])
+            new_archives_from_git.append(arch_submodule[index])
+            new_archives_from_git.append(arch_forcefullclone[index])
         if util.debugging:
             print_debug(f"new_archives_from_git: {new_archives_from_git}\n")
 
@@ -641,7 +656,14 @@ def package(
         print_debug(f"url 4: {url}")
         print_debug(f"archives 4: {archives}")
         print_debug(f"new_archives_from_git 4: {new_archives_from_git}")
-    content = tarball.Content(url, name, args.version, archives, conf, workingdir, giturl, download_from_git, branch, new_archives_from_git, force_module, force_fullclone)
+    source_cache = None
+    if args.extract_cache:
+        try:
+            source_cache = srccache.SourceCache(srccache.parse_size(args.extract_cache))
+        except ValueError as err:
+            print_fatal(f"{err}")
+            sys.exit(1)
+    content = tarball.Content(url, name, args.version, archives, conf, workingdir, giturl, download_from_git, branch, new_archives_from_git, force_module, force_fullclone, source_cache)
     content.process(filemanager)
     conf.create_versions(content.multi_version)
     conf.content = content  # hack to avoid recursive dependency on init
@@ -673,13 +695,19 @@ def package(
         exit(0)
 
     if short_circuit == "prep" or short_circuit is None:
-        requirements.scan_for_configure(_dir, content.name, conf)
-        #specdescription.scan_for_description(content.name, _dir, conf.license_translations, conf.license_blacklist)
-        # Start one directory higher so we scan *all* versions for licenses
-        license.scan_for_licenses(os.path.dirname(_dir), conf, content.name)
-        #commitmessage.scan_for_changes(conf.download_path, _dir, conf.transforms)
+        analysis_key = None if args.no_analysis_cache else analysiscache.cache_key(conf)
+        if not analysis_key or not analysiscache.load(analysis_key, conf, requirements):
+            # One walk of the tree (including all versions) serves every scanner
+            source_index = srcindex.SourceIndex(os.path.dirname(_dir))
+            requirements.scan_for_configure(_dir, content.name, conf, source_index)
+            #specdescription.scan_for_description(content.name, _dir, conf.license_translations, conf.license_blacklist, source_index)
+            # Start one directory higher so we scan *all* versions for licenses
+            license.scan_for_licenses(os.path.dirname(_dir), conf, content.name, source_index)
+            #commitmessage.scan_for_changes(conf.download_path, _dir, conf.transforms, source_index)
+            if analysis_key:
+                analysiscache.save(analysis_key, conf, requirements)
         conf.add_sources(archives, content)
-        #check.scan_for_tests(_dir, conf, requirements, content)
+        #check.scan_for_tests(_dir, conf, requirements, content, source_index)
 
     #
     # Now, we have enough to write out a specfile, and try to build it.
@@ -709,6 +737,8 @@ def package(
     if short_circuit == "install":
         #util.call(f"sudo rm -rf {mock_dir}/clear-{content.name}/root/builddir/build/RPMS/")
         shutil.rmtree(f"{mock_build_dir}/RPMS/", ignore_errors=True)
+    log_archiver = compress.LogArchiver(args.keep_round_logs)
+    events.open_sink(os.path.join(package.results_folder, "events.jsonl"), content.name)
     while 1:
         package.package(filemanager=filemanager, mockconfig=args.mock_config, mockopts=args.mock_opts, config=conf, requirements=requirements, content=content, mock_dir=mock_dir, short_circuit=short_circuit, do_file_restart=do_file_restart, force_build_srpm=args.force_build_srpm, cleanup=args.cleanup)
         if (short_circuit != package.short_circuit):
@@ -726,7 +756,10 @@ def package(
         if filemanager.clean_directories(mock_chroot):
             # directories added to the blacklist, need to re-run
             package.must_restart += 1
+            package.restart_causes["directories excluded"] += 1
+            events.emit("directories_excluded", chroot=mock_chroot)
             print_info(f"filemanager.clean_directories({mock_chroot})")
+        package.emit_round_end()
 
         if do_file_restart:
             if package.round > 20 or (package.must_restart == 0 and package.file_restart == 0):
@@ -742,7 +775,11 @@ def package(
             if package.round > 20 or (package.must_restart == 0 and package.file_restart == 0):
                 break
 
-        save_mock_logs(conf.download_path, package.round, short_circuit)
+        save_mock_logs(conf.download_path, package.round, short_circuit, log_archiver)
+
+    log_archiver.wait()
+    package.timings.report(package.results_folder)
+    events.close()
 
     #if short_circuit is None or short_circuit == "install":
         #check.check_regression(conf.download_path, conf.config_opts["skip_tests"])
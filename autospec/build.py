@@ -19,11 +19,19 @@
 # Actually build the package
 #
 
+import collections
 import os
 import re
 import shutil
 import sys
 import subprocess
+import time
+import check
+import compress
+import events
+import loganalyzer
+import logcheck
+import timings
 import util
 from util import call, write_out, print_fatal, print_debug, print_info, scantree
 
@@ -61,15 +69,6 @@ def cleanup_req(s: str) -> str:
     s = s.strip()
     return s
 
-#def check_for_warning_pattern(line):
-    #"""Print warning if a line matches against a warning list."""
-    #warning_patterns = [
-        #"march=native"
-    #]
-    #for pat in warning_patterns:
-        #if pat in line:
-            #util.print_warning("Build log contains: {}".format(pat))
-
 def get_mock_cmd():
     """Set mock command to use sudo as needed."""
     # Some distributions (e.g. Fedora) use consolehelper to run mock,
@@ -80,6 +79,136 @@ def get_mock_cmd():
         #return 'sudo PYTHONMALLOC=malloc MIMALLOC_PAGE_RESET=0 MIMALLOC_LARGE_OS_PAGES=1 LD_PRELOAD=/usr/lib64/libmimalloc.so /home/boni/.local/pypy-venv/bin/python3 --jit max_unroll_recursion=16,disable_unrolling=300 /home/boni/.local/pypy-venv/bin/mock'
         return 'sudo PYTHONMALLOC=malloc MIMALLOC_PAGE_RESET=0 MIMALLOC_LARGE_OS_PAGES=1 LD_PRELOAD=/usr/lib64/libmimalloc.so /home/boni/.local/pypy-venv/bin/mock'
 
+class BuildreqPatterns(loganalyzer.LogConsumer):
+    """Detect dropped patches and missing build requirements in a build log."""
+
+    def __init__(self, build, config, requirements):
+        """Report to build and add the buildreqs found to requirements."""
+        self.build = build
+        self.config = config
+        self.requirements = requirements
+        self.patch_name = ""
+        self.prep = build.short_circuit == "prep"
+        self.scan_buildreqs = build.short_circuit not in ("prep", "binary")
+
+    def feed(self, line):
+        """Handle a line of the build log."""
+        build = self.build
+        config = self.config
+        requirements = self.requirements
+        if self.prep:
+            if patch_name_match := build.patch_name_line.search(line):
+                self.patch_name = patch_name_match.groups()[0]
+            if self.patch_name:
+                if build.patch_fail_line.search(line):
+                    dropped = config.remove_backport_patch(self.patch_name)
+                    if dropped:
+                        events.emit("patch_dropped", patch=self.patch_name)
+                        build.must_restart += dropped
+                        build.restart_causes["patch dropped"] += dropped
+        if self.scan_buildreqs:
+            before = build.must_restart
+            for pat in config.pkgconfig_pats:
+                build.simple_pattern_pkgconfig(line, *pat, config.config_opts.get('32bit'), requirements)
+
+            for pat in config.simple_pats:
+                build.simple_pattern(line, *pat, requirements)
+
+            for pat in config.failed_pats:
+                build.failed_pattern(line, config, requirements, *pat)
+
+            for pat in config.failed_exit_pats:
+                build.failed_exit_pattern(line, config, requirements, *pat)
+
+            if build.must_restart != before:
+                build.restart_causes["buildreq added"] += build.must_restart - before
+
+
+class BuildResults(loganalyzer.LogConsumer):
+    """Collect the %files listing, missing files and the build outcome of a build log."""
+
+    def __init__(self, build, returncode, filemanager, config, content):
+        """Report to build and push the files found to filemanager."""
+        self.build = build
+        self.returncode = returncode
+        self.filemanager = filemanager
+        self.config = config
+        self.content = content
+        # Search for files to add to the %files section.
+        # * infiles == 0 before we reach the files listing
+        # * infiles == 1 for the "Installed (but unpackaged) file(s) found" header
+        #     and for the entirety of the files listing
+        # * infiles == 2 after the files listing has ended
+        self.infiles = 0
+        # %prep=1 %build=2 %install=3 %clean=4
+        self.executing = 0
+        self.match = f"File not found: /builddir/build/BUILDROOT/{content.name}-{content.version}-{content.release}.x86_64"
+
+    def feed(self, line):
+        """Handle a line of the build log."""
+        filemanager = self.filemanager
+        content = self.content
+        if self.infiles == 1:
+            for search in ["RPM build errors", "Childreturncodewas",
+                           "Child returncode", "Empty %files file"]:
+                if search in line:
+                    self.infiles = 2
+            for start in ["Building", "Child return code was"]:
+                if line.startswith(start):
+                    self.infiles = 2
+
+        if self.infiles == 0 and "Installed (but unpackaged) file(s) found:" in line:
+            filemanager.fix_broken_pkg_config_versioning(content.name)
+            if self.config.config_opts["altcargo1"] or self.config.config_opts["altcargo_pgo"]:
+                filemanager.write_cargo_find_install_assets(content.name)
+            self.infiles = 1
+        elif self.infiles == 1:
+            # exclude blank lines from consideration...
+            file = line.strip()
+            if file and file[0] == "/":
+                build = self.build
+                before = build.must_restart + build.file_restart
+                filemanager.push_file(file, content.name)
+                if build.must_restart + build.file_restart != before:
+                    build.restart_causes["files found"] += 1
+
+        if line.startswith("Sorry: TabError: inconsistent use of tabs and spaces in indentation"):
+            print(line)
+            self.returncode = 99
+
+        if self.match in line:
+            missing_file = line.split(self.match)[1].strip()
+            build = self.build
+            before = build.must_restart + build.file_restart
+            filemanager.remove_file(missing_file)
+            if build.must_restart + build.file_restart != before:
+                build.restart_causes["file removed"] += 1
+
+        if self.returncode == 0:
+            if self.executing == 0:
+                if line.startswith("Executing(%prep)"):
+                    self.executing = 1
+                elif line.startswith("Executing(%build)"):
+                    self.executing = 2
+                elif line.startswith("Executing(%install)"):
+                    self.executing = 3
+                elif line.startswith("Executing(%clean)"):
+                    self.executing = 4
+            elif line.startswith("Child return code was: 0"):
+                short_circuit = self.build.short_circuit
+                if short_circuit == "prep":
+                    print("RPM short circuit prep successful")
+                elif short_circuit == "build":
+                    print("RPM short circuit build successful")
+                elif short_circuit == "install":
+                    print("RPM short circuit install successful")
+                elif short_circuit == "binary":
+                    print("RPM binary successful")
+                elif short_circuit is None:
+                    print("RPM build successful")
+                self.build.success = 1
+
+
 class Build(object):
     """Manage package builds."""
 
@@ -94,6 +223,8 @@ class Build(object):
         self.mock_dir = ""
         self.short_circuit = ""
         self.do_file_restart = True
+        self.restart_causes = collections.Counter()
+        self.timings = timings.BuildTimings()
         self.patch_name_line = re.compile(r'^Patch #[0-9]+ \((.*)\):$')
         self.patch_fail_line = re.compile(r'^Skipping patch.$')
         self.missing_pat = re.compile(r"^.*No matching package to install: '(.*)'$")
@@ -170,23 +301,12 @@ class Build(object):
         system_pgo_dir_src = "/var/tmp/pgo"
         system_pgo_dir_dst = f"{config.download_path}/pgo.tar.gz"
         system_gitignore = f"{config.download_path}/.gitignore"
-        tar_cmd = f"tar --directory={root_dir_src} --create --file=- var/tmp/pgo/ | pigz -9 -p 20 > {system_pgo_dir_dst}"
         if os.path.isdir(system_pgo_dir_src):
             if any(os.scandir(system_pgo_dir_src)):
-                if os.path.isfile(system_pgo_dir_dst):
-                    os.remove(system_pgo_dir_dst)
                 try:
-                    process = subprocess.run(
-                        tar_cmd,
-                        check=True,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        universal_newlines=True,
-                    )
-                except subprocess.CalledProcessError as err:
-                    print_fatal(f"Unable to archive {system_pgo_dir_src} in {system_pgo_dir_dst} from {tar_cmd}: {err}")
+                    compress.archive_tree(system_pgo_dir_src, os.path.relpath(system_pgo_dir_src, root_dir_src), system_pgo_dir_dst)
+                except (OSError, subprocess.CalledProcessError, RuntimeError) as err:
+                    print_fatal(f"Unable to archive {system_pgo_dir_src} in {system_pgo_dir_dst}: {err}")
                     sys.exit(1)
 
                 append_new_gitrule = True
@@ -281,20 +401,22 @@ class Build(object):
         pat = re.compile(pattern)
         match = pat.search(line)
         if match:
-            if self.short_circuit is None:
-                self.must_restart += requirements.add_pkgconfig_buildreq(pkgconfig, conf32, cache=True)
-            else:
-                requirements.add_pkgconfig_buildreq(pkgconfig, conf32, cache=True)
+            with events.matching(pattern):
+                if self.short_circuit is None:
+                    self.must_restart += requirements.add_pkgconfig_buildreq(pkgconfig, conf32, cache=True)
+                else:
+                    requirements.add_pkgconfig_buildreq(pkgconfig, conf32, cache=True)
 
     def simple_pattern(self, line, pattern, req, requirements):
         """Check for simple patterns and restart the build as needed."""
         pat = re.compile(pattern)
         match = pat.search(line)
         if match:
-            if self.short_circuit is None:
-                self.must_restart += requirements.add_buildreq(req, cache=True)
-            else:
-                requirements.add_buildreq(req, cache=True)
+            with events.matching(pattern):
+                if self.short_circuit is None:
+                    self.must_restart += requirements.add_buildreq(req, cache=True)
+                else:
+                    requirements.add_buildreq(req, cache=True)
 
     def failed_exit_pattern(self, line, config, requirements, pattern, verbose, buildtool=None):
         pat = re.compile(pattern)
@@ -309,6 +431,11 @@ class Build(object):
         match = pat.search(line)
         if not match:
             return
+        with events.matching(pattern):
+            self.failed_match(match, config, requirements, buildtool)
+
+    def failed_match(self, match, config, requirements, buildtool=None):
+        """Add the buildreq named by a failed pattern match."""
         s = match.group(1)
         # standard configure cleanups
         s = cleanup_req(s)
@@ -376,6 +503,7 @@ class Build(object):
         except Exception:
             if s.strip() and s not in self.warned_about and s[:2] != '--':
                 util.print_warning(f"Unknown pattern match: {s}")
+                events.emit("unknown_pattern", match=s)
                 self.warned_about.add(s)
 
     def parse_buildroot_log(self, filename, returncode):
@@ -400,13 +528,8 @@ class Build(object):
         requirements.verbose = 1
         self.must_restart = 0
         self.file_restart = 0
-        infiles = 0
-        patch_name = ""
         lsof_cmd = f"lsof -w -Fa {filename} | grep 'a[uw -]'"
         build_log_ready = False
-        match = f"File not found: /builddir/build/BUILDROOT/{content.name}-{content.version}-{content.release}.x86_64"
-        # %prep=1 %build=2 %install=3 %clean=4
-        executing = 0
 
         # Flush the build-log to disk, before reading it
         util.call("sync")
@@ -419,86 +542,13 @@ class Build(object):
             print_info("Waiting for build.log to be ready...")
             continue
         util.call("sync")
-        with util.open_auto(filename, "r") as buildlog:
-            loglines = buildlog.readlines()
-        for line in loglines:
-            if self.short_circuit == "prep":
-                if patch_name_match := self.patch_name_line.search(line):
-                    patch_name = patch_name_match.groups()[0]
-                if patch_name:
-                    if self.patch_fail_line.search(line):
-                        self.must_restart += config.remove_backport_patch(patch_name)
-            if (self.short_circuit != "prep" and self.short_circuit != "binary"):
-                for pat in config.pkgconfig_pats:
-                    self.simple_pattern_pkgconfig(line, *pat, config.config_opts.get('32bit'), requirements)
-
-                for pat in config.simple_pats:
-                    self.simple_pattern(line, *pat, requirements)
-
-                for pat in config.failed_pats:
-                    self.failed_pattern(line, config, requirements, *pat)
-
-                for pat in config.failed_exit_pats:
-                    self.failed_exit_pattern(line, config, requirements, *pat)
-
-            # check_for_warning_pattern(line)
-
-            # Search for files to add to the %files section.
-            # * infiles == 0 before we reach the files listing
-            # * infiles == 1 for the "Installed (but unpackaged) file(s) found" header
-            #     and for the entirety of the files listing
-            # * infiles == 2 after the files listing has ended
-            if infiles == 1:
-                for search in ["RPM build errors", "Childreturncodewas",
-                               "Child returncode", "Empty %files file"]:
-                    if search in line:
-                        infiles = 2
-                for start in ["Building", "Child return code was"]:
-                    if line.startswith(start):
-                        infiles = 2
-
-            if infiles == 0 and "Installed (but unpackaged) file(s) found:" in line:
-                filemanager.fix_broken_pkg_config_versioning(content.name)
-                if config.config_opts["altcargo1"] or config.config_opts["altcargo_pgo"]:
-                    filemanager.write_cargo_find_install_assets(content.name)
-                infiles = 1
-            elif infiles == 1:
-                # exclude blank lines from consideration...
-                file = line.strip()
-                if file and file[0] == "/":
-                    filemanager.push_file(file, content.name)
-                    #print(file)
-
-            if line.startswith("Sorry: TabError: inconsistent use of tabs and spaces in indentation"):
-                print(line)
-                returncode = 99
-
-            if match in line:
-                missing_file = line.split(match)[1].strip()
-                filemanager.remove_file(missing_file)
-
-            if returncode == 0:
-                if executing == 0:
-                    if line.startswith("Executing(%prep)"):
-                        executing = 1
-                    elif line.startswith("Executing(%build)"):
-                        executing = 2
-                    elif line.startswith("Executing(%install)"):
-                        executing = 3
-                    elif line.startswith("Executing(%clean)"):
-                        executing = 4
-                elif line.startswith("Child return code was: 0"):
-                    if self.short_circuit == "prep":
-                        print("RPM short circuit prep successful")
-                    elif self.short_circuit == "build":
-                        print("RPM short circuit build successful")
-                    elif self.short_circuit == "install":
-                        print("RPM short circuit install successful")
-                    elif self.short_circuit == "binary":
-                        print("RPM binary successful")
-                    elif self.short_circuit is None:
-                        print("RPM build successful")
-                    self.success = 1
+        consumers = [BuildreqPatterns(self, config, requirements),
+                     BuildResults(self, returncode, filemanager, config, content),
+                     loganalyzer.WarningPatterns(),
+                     logcheck.ConfigureMisses(config.download_path, strict=False)]
+        if not config.config_opts.get("skip_tests"):
+            consumers.append(check.TestResults(config.download_path))
+        loganalyzer.analyze_log(filename, consumers)
 
         if self.success == 1 and self.short_circuit == "build" and config.config_opts.get("altflags_pgo_ext"):
             if config.config_opts.get("altflags_pgo_ext_phase"):
@@ -506,6 +556,13 @@ class Build(object):
             else:
                 self.copy_to_system_pgo(self.mock_dir, content.name, config)
 
+    def emit_round_end(self):
+        """Emit the outcome of the current round and what it asks to restart for."""
+        timing = self.timings.rounds[-1]
+        events.emit("round_end", duration=round(time.time() - timing["started"], 3), success=self.success,
+                    must_restart=self.must_restart, file_restart=self.file_restart, causes=dict(self.restart_causes),
+                    short_circuit=self.short_circuit)
+
     def package(self, filemanager, mockconfig, mockopts, config, requirements, content, mock_dir, short_circuit, do_file_restart, force_build_srpm, cleanup=False):
         """Run main package build routine."""
         self.do_file_restart = do_file_restart
@@ -513,6 +570,9 @@ class Build(object):
         self.short_circuit = short_circuit
         self.round += 1
         self.success = 0
+        self.restart_causes = collections.Counter()
+        timing = self.timings.start_round(self.round, self.short_circuit, self.restart_causes)
+        events.start_round(self.round)
 
         print(f"Package {content.name} round {self.round}")
 
@@ -531,6 +591,7 @@ class Build(object):
                 shutil.rmtree(self.rpms_folder, ignore_errors=True)
                 os.makedirs(self.rpms_folder)
 
+            srpm_start = self.timings.clock()
             cmd_args_buildsrpm = [
                 self.mock_cmd,
                 f"--root={mockconfig}",
@@ -552,6 +613,7 @@ class Build(object):
             os.rename(self.results_root_log, self.results_srpm_root_log)
             os.rename(self.results_build_log, self.results_srpm_build_log)
             util.call("sync")
+            timing["srpm"] = self.timings.clock() - srpm_start
             util.print_warning("Teste 1")
         #srcrpm = f"results/{content.name}-{content.version}-{content.release}.src.rpm"
         srcrpm = f"{self.results_folder}/{content.name}-{content.version}-{content.release}.src.rpm"
@@ -579,10 +641,19 @@ class Build(object):
                 cmd_args_build.append("--short-circuit=binary")
                 print_info("Will --short-circuit=binary")
 
-        ret = util.call(" ".join(cmd_args_build),
-                        logfile=self.results_mock_build_log,
-                        check=False,
-                        cwd=config.download_path)
+        timing["short_circuit"] = self.short_circuit
+        build_clock, root_clock, followers = self.timings.follow(self.results_build_log, self.results_root_log)
+        mock_start = self.timings.clock()
+        try:
+            ret = util.call(" ".join(cmd_args_build),
+                            logfile=self.results_mock_build_log,
+                            check=False,
+                            cwd=config.download_path)
+        finally:
+            for follower in followers:
+                follower.stop()
+        timing["mock"] = self.timings.clock() - mock_start
+        self.timings.record_mock(timing, build_clock, root_clock)
 
         if self.short_circuit == "prep":
             self.write_normal_bashrc(self.mock_dir, content.name, config)
@@ -598,10 +669,13 @@ class Build(object):
             util.print_fatal("Mock command failed, results log does not exist. User may not have correct permissions.")
             exit(1)
 
+        parse_start = self.timings.clock()
         if not self.parse_buildroot_log(self.results_root_log, ret):
+            timing["parse"] = self.timings.clock() - parse_start
             return
 
         self.parse_build_results(self.results_build_log, ret, filemanager, config, requirements, content)
+        timing["parse"] = self.timings.clock() - parse_start
         if filemanager.has_banned:
             util.print_fatal("Content in banned paths found, aborting build")
             exit(1)
@@ -20,13 +20,17 @@
 #
 
 import ast
+import concurrent.futures
 import configparser
+import events
+import hashlib
 import json
 import os
 import re
 
 import pypidata
 import specdescription
+import srcindex
 import toml
 import util
 
@@ -49,7 +53,12 @@ def old_python_module(req):
 
 
 def clean_python_req(req):
-    """Strip version information from req."""
+    """Strip version information from req and normalize it to its pypi name."""
+    return normalize_python_req(strip_python_req(req))
+
+
+def strip_python_req(req):
+    """Strip version information, markers and extras from req."""
     if not req:
         return ""
     if req[0] == "#":
@@ -89,7 +98,11 @@ def clean_python_req(req):
     if i >= 0:
         ret = ret[:i]
 
-    ret = ret.strip()
+    return ret.strip()
+
+
+def normalize_python_req(ret):
+    """Translate a stripped python requirement to its pypi name, or "" for junk."""
     # use the dictionary to translate funky names to our current pgk names
     ret = util.translate(ret)
     if ret:
@@ -218,6 +231,536 @@ def parse_go_mod(path):
     return reqs
 
 
+# Build file parsers used by scan_for_configure. They only read the file and
+# return the list of actions to take, which Requirements.apply_actions
+# replays. That keeps them free of shared state, so scan_for_configure can
+# run them in a process pool and still apply the results in walk order.
+configure_ac_pat_reqs = [(r"AC_CHECK_FUNC\([tgetent]", ["ncurses-devel"]),
+                         ("PROG_INTLTOOL", ["intltool"]),
+                         ("GETTEXT_PACKAGE", ["gettext", "perl(XML::Parser)"]),
+                         ("AM_GLIB_GNU_GETTEXT", ["gettext", "perl(XML::Parser)"]),
+                         ("GTK_DOC_CHECK", ["gtk-doc", "gtk-doc-dev", "libxslt-bin", "docbook-xml"]),
+                         ("AC_PROG_SED", ["sed"]),
+                         ("AC_PROG_GREP", ["grep"])]
+configure_ac_literals_re = re.compile("|".join(re.escape(pat) for pat, _ in configure_ac_pat_reqs))
+configure_ac_token_re = re.compile(r"[()\n]")
+pkg_check_modules_re = re.compile(r"PKG_CHECK_MODULES\((.*?)\)")
+xdt_check_package_re = re.compile(r"XDT_CHECK_PACKAGE\((.*?)\)")
+pkg_check_exists_re = re.compile(r"PKG_CHECK_EXISTS\((.*?)\)")
+
+# Parse jobs below this count are not worth starting worker processes for
+parse_pool_min_jobs = 64
+
+# Lookup tables needed by the parse jobs, set once per worker process
+parse_context = {}
+
+# Parse results are cached by file content; bump the version whenever a
+# parser changes what it returns. Smaller files are cheaper to parse than
+# to look up.
+parse_cache_version = 2
+parse_cache_min_size = 512
+
+# Python parse jobs return, and cache, the stripped requirement names; the
+# translate.dic and pypi name lookups are applied after the cache, so they
+# are never frozen in it
+python_parse_jobs = ("requirements", "pyproject", "setup_cfg", "setup_py")
+
+# The parse_context entries each kind of parse job depends on
+parse_job_context = {
+    "configure_ac": ("conf32",),
+    "cmake": ("cmake_modules", "conf32"),
+    "catkin": ("conf32",),
+    "rakefile": ("gems",),
+    "qmake": ("qt_modules",),
+}
+
+
+def configure_ac_line_actions(line, conf32):
+    """Return the actions for a single configure.ac statement."""
+    actions = []
+    # ignore comments
+    if line.startswith('#'):
+        return actions
+
+    if configure_ac_literals_re.search(line):
+        for pat, reqs in configure_ac_pat_reqs:
+            if pat in line:
+                for req in reqs:
+                    actions.append(("buildreq", req))
+
+    if "_CHECK_" not in line:
+        return actions
+    line = line.strip()
+
+    # XFCE uses an equivalent to PKG_CHECK_MODULES, handle them both the same
+    for style in (pkg_check_modules_re, xdt_check_package_re):
+        match = style.search(line)
+        L = []
+        if match:
+            L = match.group(1).split(",")
+        if len(L) > 1:
+            rqlist = L[1].strip()
+            for req in parse_modules_list(rqlist):
+                actions.append(("pkgconfig", req, conf32))
+
+    # PKG_CHECK_EXISTS(MODULES, action-if-found, action-if-not-found)
+    match = pkg_check_exists_re.search(line)
+    if match:
+        L = match.group(1).split(",")
+        rqlist = L[0].strip()
+        for req in parse_modules_list(rqlist):
+            actions.append(("pkgconfig", req, conf32))
+    return actions
+
+
+def split_configure_ac(text):
+    """Split configure.ac text into statements.
+
+    A newline ends a statement only outside parentheses; the lines of a
+    multi-line statement are joined without the newlines.
+    """
+    statements = []
+    parts = []
+    depth = 0
+    start = 0
+    for match in configure_ac_token_re.finditer(text):
+        c = match.group()
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            if depth > 0:
+                depth -= 1
+        else:
+            parts.append(text[start:match.start()])
+            start = match.end()
+            if depth == 0:
+                statements.append("".join(parts))
+                parts = []
+    parts.append(text[start:])
+    statements.append("".join(parts))
+    return statements
+
+
+def configure_ac_actions(filename, conf32):
+    """Return the actions for a configure.ac file."""
+    actions = []
+    with util.open_auto(filename, "r") as f:
+        text = f.read()
+    for statement in split_configure_ac(text):
+        actions.extend(configure_ac_line_actions(statement, conf32))
+    return actions
+
+
+def cmake_actions(filename, cmake_modules, conf32):
+    """Return the actions for a .cmake or CMakeLists.txt file."""
+    findpackage = re.compile(r"^[^#]*find_package\((\w+)\b.*\)", re.I)
+    pkgconfig = re.compile(r"^[^#]*pkg_check_modules\s*\(\w+ (.*)\)", re.I)
+    pkg_search_modifiers = {'REQUIRED', 'QUIET', 'NO_CMAKE_PATH',
+                            'NO_CMAKE_ENVIRONMENT_PATH', 'IMPORTED_TARGET'}
+    extractword = re.compile(r'(?:"([^"]+)"|(\S+))(.*)')
+
+    actions = []
+    with util.open_auto(filename, "r") as f:
+        lines = f.readlines()
+    for line in lines:
+        match = findpackage.search(line)
+        if match:
+            module = match.group(1)
+            try:
+                pkg = cmake_modules[module]
+                actions.append(("buildreq", pkg))
+            except Exception:
+                pass
+
+        match = pkgconfig.search(line)
+        if match:
+            rest = match.group(1)
+            while rest:
+                wordmatch = extractword.search(rest)
+                if not wordmatch:
+                    break
+                rest = wordmatch.group(3)
+                if wordmatch.group(2) in pkg_search_modifiers:
+                    continue
+                # Only one of the two groups can match at a time
+                module = wordmatch.group(1)
+                if not module:
+                    module = wordmatch.group(2)
+                # We have a match, so strip out any version info
+                for m in parse_modules_list(module, is_cmake=True):
+                    actions.append(("pkgconfig", m, conf32))
+    return actions
+
+
+def catkin_actions(cmakelists_file, conf32):
+    """Return the actions for the catkin dependencies of a CMakeLists.txt file."""
+    actions = []
+    with util.open_auto(cmakelists_file, "r") as f:
+        lines = f.readlines()
+    pat = re.compile(r"^find_package.*\(.*(catkin)(?: REQUIRED *)?(?:COMPONENTS (?P<comp>.*))?\)$")
+    catkin = False
+    for line in lines:
+        match = pat.search(line)
+        if not match:
+            continue
+
+        # include catkin's required components
+        comp = match.group("comp")
+        if comp:
+            for curr in comp.split(" "):
+                actions.append(("pkgconfig", curr, conf32))
+
+        catkin = True
+
+    if catkin:
+        for curr in ["catkin", "catkin_pkg", "empy", "googletest"]:
+            actions.append(("buildreq", curr))
+        actions.append(("catkin",))
+    return actions
+
+
+def rakefile_actions(filename, gems):
+    """Return the actions for a Rakefile."""
+    actions = []
+    with util.open_auto(filename, "r") as f:
+        lines = f.readlines()
+
+    pat = re.compile(r"^require '(.*)'$")
+    for line in lines:
+        match = pat.search(line)
+        if match:
+            s = match.group(1)
+            if s != "rubygems" and s in gems:
+                actions.append(("print", "Rakefile-dep: " + gems[s]))
+                actions.append(("buildreq", gems[s]))
+            else:
+                actions.append(("print", "Rakefile-new: rubygem-" + s))
+    return actions
+
+
+def qmake_actions(filename, qt_modules):
+    """Return the actions for a qmake .pro file."""
+    actions = []
+    with util.open_auto(filename, "r") as f:
+        lines = f.readlines()
+
+    pat = re.compile(r"(QT|QT_PRIVATE|QT_FOR_CONFIG).*=\s*(.*)\s*")
+    for line in lines:
+        match = pat.search(line)
+        if not match:
+            continue
+        s = match.group(2)
+        for module in s.split():
+            module = re.sub('-private$', '', module)
+            try:
+                pc = qt_modules[module]
+                actions.append(("buildreq", 'pkgconfig({})'.format(pc)))
+            except Exception:
+                pass
+    return actions
+
+
+def resolve_python_actions(actions):
+    """Return the actions of a python parse job with their requirement names normalized to pypi(name)."""
+    resolved = []
+    for action in actions:
+        if dep := normalize_python_req(action[1]):
+            resolved.append((action[0], f"pypi({dep})", *action[2:]))
+    return resolved
+
+
+def python_requirements_actions(descfile, raw=False):
+    """Return the actions for a requirements.txt file, with stripped requirement names if raw."""
+    actions = []
+    with util.open_auto(descfile, "r") as f:
+        lines = f.readlines()
+
+    for line in lines:
+        if '[' in line:
+            break
+        clean_line = strip_python_req(line)
+        if 'pytest' in line:
+            continue
+        if clean_line:
+            actions.append(("buildreq_requires", clean_line, {"override": True, "subpkg": "python3"}))
+    return actions if raw else resolve_python_actions(actions)
+
+
+def pyproject_actions(filename, raw=False):
+    """Return the actions for the build-system requires of a pyproject.toml file, with stripped names if raw."""
+    actions = []
+    with util.open_auto(filename) as pfile:
+        pyproject = toml.loads(pfile.read())
+    if not (buildsys := pyproject.get("build-system")):
+        return actions
+
+    if not (requires := buildsys.get("requires")):
+        return actions
+
+    for require in requires:
+        if dep := strip_python_req(require):
+            actions.append(("buildreq", dep))
+    return actions if raw else resolve_python_actions(actions)
+
+
+def setup_cfg_actions(filename, raw=False):
+    """Return the actions for the install requirements of a setup.cfg file, with stripped names if raw."""
+    actions = []
+    setup_f = configparser.ConfigParser(interpolation=None, allow_no_value=True)
+    setup_f.read(filename)
+    if 'options' in setup_f.sections() and (install_reqs := setup_f['options'].get('install_requires')):
+        for req in install_reqs.splitlines():
+            if dep := strip_python_req(req):
+                actions.append(("buildreq", dep))
+                actions.append(("requires", dep, {"subpkg": "python3"}))
+    return actions if raw else resolve_python_actions(actions)
+
+
+def setup_py_dep_action(dep, req):
+    """Return the action for a setup.py dependency, added to requires for install_requires."""
+    if req:
+        return ("buildreq_requires", dep, {"subpkg": "python3"})
+    return ("buildreq", dep)
+
+
+def setup_py_actions(filename, raw=False):
+    """Return the actions for the install_requires and setup_requires of a setup.py file.
+
+    See Requirements.add_setup_py_requires for the handled patterns. With
+    raw, the requirement names are only stripped.
+    """
+    actions = []
+    multiline = False
+    with util.open_auto(filename) as f:
+        lines = f.readlines()
+
+    for line in lines:
+        if not multiline and ("install_requires" in line or "setup_requires" in line):
+            req = "install_requires" in line
+            # find the value for *_requires
+            line = line.split("=", 1)
+            if len(line) == 2:
+                line = line[1].strip()
+            else:
+                # skip because this could be a conditionally extended list
+                # we only want to automatically detect the core packages
+                continue
+
+            # easy, one-line case
+            if line.startswith("[") and "]" in line:
+                # remove the leading [ and split off everthing after the ]
+                line = line[1:].split("]")[0]
+                for item in line.split(','):
+                    item = item.strip()
+                    try:
+                        # eval the string and add requirements
+                        if dep := strip_python_req(ast.literal_eval(item)):
+                            actions.append(setup_py_dep_action(dep, req))
+
+                    except Exception:
+                        # do not fail, the line contained a variable and
+                        # had to be skipped
+                        pass
+
+                continue
+
+            # more complicated, multi-line list.
+            # this sets the py_dep_string with the current line, which
+            # is the beginning of a multi-line list.
+            elif line.startswith("["):
+                multiline = True
+                line = line.lstrip("[")
+
+            # if the line doesn't start with '[' it is the case where
+            # there is (should be) a single dependency as a string
+            else:
+                line = line.strip()
+                try:
+                    if dep := strip_python_req(ast.literal_eval(line)):
+                        actions.append(setup_py_dep_action(dep, req))
+
+                except Exception:
+                    # Do not fail, just keep looking
+                    pass
+
+                continue
+
+        # if multiline was set above when a multi-line list was
+        # detected, for each line until the end bracket is found attempt to
+        # add the line as a buildreq
+        if multiline:
+            # if end bracket found, reset the flag
+            if "]" in line:
+                multiline = False
+                line = line.split("]")[0]
+
+            try:
+                dep = ast.literal_eval(line.split('#')[0].strip(' ,\n'))
+                if dep := strip_python_req(dep):
+                    actions.append(setup_py_dep_action(dep, req))
+
+            except Exception:
+                # do not fail, the line contained a variable and had to
+                # be skipped
+                pass
+    return actions if raw else resolve_python_actions(actions)
+
+
+def set_parse_context(context):
+    """Store the lookup tables used by run_parse_job."""
+    global parse_context
+    parse_context = context
+
+
+def run_parse_job(job):
+    """Run the build file parser for job, a (kind, filename) pair.
+
+    Python parse jobs return stripped requirement names, see resolve_python_actions.
+    """
+    kind, filename = job
+    if kind == "configure_ac":
+        return configure_ac_actions(filename, parse_context["conf32"])
+    if kind == "cmake":
+        return cmake_actions(filename, parse_context["cmake_modules"], parse_context["conf32"])
+    if kind == "catkin":
+        return catkin_actions(filename, parse_context["conf32"])
+    if kind == "rakefile":
+        return rakefile_actions(filename, parse_context["gems"])
+    if kind == "qmake":
+        return qmake_actions(filename, parse_context["qt_modules"])
+    if kind == "requirements":
+        return python_requirements_actions(filename, raw=True)
+    if kind == "pyproject":
+        return pyproject_actions(filename, raw=True)
+    if kind == "setup_cfg":
+        return setup_cfg_actions(filename, raw=True)
+    if kind == "setup_py":
+        return setup_py_actions(filename, raw=True)
+    raise ValueError(f"Unknown parse job {kind}")
+
+
+def parse_cache_key(kind, filename, context_digest):
+    """Return the parse cache key for filename, or None if it should not be cached."""
+    try:
+        size = os.path.getsize(filename)
+        if size == 0 or size < parse_cache_min_size:
+            return None
+        sha = util.get_sha1sum(filename)
+    except OSError:
+        return None
+    return hashlib.sha1(f"{parse_cache_version}:{kind}:{context_digest}:{sha}".encode()).hexdigest()
+
+
+def parse_cache_path(key):
+    """Return the file holding the cached parse result for key."""
+    return os.path.join(util.get_cache_dir("parse"), key[:2], f"{key}.json")
+
+
+def read_parse_cache(key):
+    """Return the cached parse result for key, or None."""
+    try:
+        with open(parse_cache_path(key), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_parse_cache(key, result):
+    """Store the parse result for key."""
+    path = parse_cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        util.write_out(tmp_path, json.dumps(result))
+        os.replace(tmp_path, path)
+    except OSError as err:
+        util.print_warning(f"Unable to cache parse result in {path}: {err}")
+
+
+def context_digests(context):
+    """Return the digest of the context each kind of parse job depends on."""
+    digests = {}
+    for kind, names in parse_job_context.items():
+        digests[kind] = hashlib.sha1(json.dumps([context.get(n) for n in names], sort_keys=True).encode()).hexdigest()
+    return digests
+
+
+def run_parse_jobs(jobs, context):
+    """Run all parse jobs and map each job to its actions.
+
+    Results for files parsed before are replayed from the parse cache; the
+    rest are parsed, in worker processes when there are many.
+    """
+    set_parse_context(context)
+    digests = context_digests(context)
+    results = {}
+    keys = {}
+    pending = []
+    for job in jobs:
+        key = parse_cache_key(job[0], job[1], digests.get(job[0], ""))
+        actions = read_parse_cache(key) if key else None
+        if actions is None:
+            keys[job] = key
+            pending.append(job)
+        else:
+            results[job] = [tuple(action) for action in actions]
+
+    parsed = None
+    workers = len(os.sched_getaffinity(0))
+    if workers > 1 and len(pending) >= parse_pool_min_jobs:
+        chunksize = max(1, len(pending) // (workers * 4))
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=set_parse_context, initargs=(context,)) as executor:
+                parsed = dict(zip(pending, executor.map(run_parse_job, pending, chunksize=chunksize)))
+        except (OSError, concurrent.futures.process.BrokenProcessPool) as err:
+            util.print_warning(f"Parsing build files serially: {err}")
+    if parsed is None:
+        parsed = {job: run_parse_job(job) for job in pending}
+
+    for job, actions in parsed.items():
+        if keys[job]:
+            write_parse_cache(keys[job], actions)
+    results.update(parsed)
+    for job in results:
+        if job[0] in python_parse_jobs:
+            results[job] = resolve_python_actions(results[job])
+    return results
+
+
+def cargo_toml_info(filename):
+    """Return whether Cargo.toml has a bin section, and its dependency names."""
+    key = parse_cache_key("cargo", filename, "")
+    info = read_parse_cache(key) if key else None
+    if info is None:
+        with util.open_auto(filename, "r") as ctoml:
+            cargo = toml.loads(ctoml.read())
+        info = [bool(cargo.get("bin")), list(cargo.get("dependencies") or [])]
+        if key:
+            write_parse_cache(key, info)
+    return info[0], info[1]
+
+
+def planned_parse_jobs(steps, pattern, strength):
+    """Return the parse jobs that replaying steps will need, in order.
+
+    Pattern votes are simulated like Config.set_build_pattern so that jobs
+    only wanted for a given build pattern are skipped when it won't be set.
+    """
+    jobs = []
+    seen = set()
+    for step in steps:
+        if step[0] == "pattern":
+            if step[2] > strength:
+                pattern, strength = step[1], step[2]
+        elif step[0] == "parse":
+            if not step[3] or pattern in step[3]:
+                job = (step[1], step[2])
+                if job not in seen:
+                    seen.add(job)
+                    jobs.append(job)
+    return jobs
+
+
 def _get_desc_field(field, desc):
     """Get a field value from an R package DESCRIPTION file.
 
@@ -368,6 +911,7 @@ class Requirements(object):
             new = False
         if self.verbose and new:
             print("  Adding buildreq:", req)
+            events.emit("buildreq_added", req=req)
 
         self.buildreqs.add(req)
         if cache and new:
@@ -431,69 +975,44 @@ class Requirements(object):
         req = "pkgconfig(" + preq + ")"
         return self.add_buildreq(req, cache)
 
+    def add_catkin_cmake_flags(self):
+        """Keep CMAKE_PREFIX_PATH consistent with CMAKE_INSTALL_PREFIX for catkin packages."""
+        # catkin find_package() function will always rely on CMAKE_PREFIX_PATH
+        # make sure we keep it consistent with CMAKE_INSTALL_PREFIX otherwise
+        # it'll never be able to find its modules
+        for flags in (self.extra_cmake, self.extra_cmake_special, self.extra_cmake_special2,
+                      self.cmake_macro, self.cmake_macro_32, self.cmake_macro_special,
+                      self.extra_cmake_special_pgo):
+            flags.add("-DCMAKE_PREFIX_PATH=/usr")
+            flags.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
+            flags.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
+
+    def apply_actions(self, actions, packages):
+        """Apply the actions returned by a build file parser, in order."""
+        for action in actions:
+            kind = action[0]
+            if kind == "buildreq":
+                self.add_buildreq(action[1])
+            elif kind == "pkgconfig":
+                self.add_pkgconfig_buildreq(action[1], action[2])
+            elif kind == "buildreq_requires":
+                if self.add_buildreq(action[1]):
+                    self.add_requires(action[1], packages, **action[2])
+            elif kind == "requires":
+                self.add_requires(action[1], packages, **action[2])
+            elif kind == "print":
+                print(action[1])
+            elif kind == "catkin":
+                self.add_catkin_cmake_flags()
+
     def configure_ac_line(self, line, conf32):
         """Parse configure_ac line and add appropriate buildreqs."""
-        # print("----\n", line, "\n----")
-        # ignore comments
-        if line.startswith('#'):
-            return
-
-        pat_reqs = [(r"AC_CHECK_FUNC\([tgetent]", ["ncurses-devel"]),
-                    ("PROG_INTLTOOL", ["intltool"]),
-                    ("GETTEXT_PACKAGE", ["gettext", "perl(XML::Parser)"]),
-                    ("AM_GLIB_GNU_GETTEXT", ["gettext", "perl(XML::Parser)"]),
-                    ("GTK_DOC_CHECK", ["gtk-doc", "gtk-doc-dev", "libxslt-bin", "docbook-xml"]),
-                    ("AC_PROG_SED", ["sed"]),
-                    ("AC_PROG_GREP", ["grep"])]
-
-        for pat, reqs in pat_reqs:
-            if pat in line:
-                for req in reqs:
-                    self.add_buildreq(req)
-
-        line = line.strip()
-
-        # XFCE uses an equivalent to PKG_CHECK_MODULES, handle them both the same
-        for style in [r"PKG_CHECK_MODULES\((.*?)\)", r"XDT_CHECK_PACKAGE\((.*?)\)"]:
-            match = re.search(style, line)
-            L = []
-            if match:
-                L = match.group(1).split(",")
-            if len(L) > 1:
-                rqlist = L[1].strip()
-                for req in parse_modules_list(rqlist):
-                    self.add_pkgconfig_buildreq(req, conf32)
-
-        # PKG_CHECK_EXISTS(MODULES, action-if-found, action-if-not-found)
-        match = re.search(r"PKG_CHECK_EXISTS\((.*?)\)", line)
-        if match:
-            L = match.group(1).split(",")
-            rqlist = L[0].strip()
-            for req in parse_modules_list(rqlist):
-                self.add_pkgconfig_buildreq(req, conf32)
+        self.apply_actions(configure_ac_line_actions(line, conf32), None)
 
     def parse_configure_ac(self, filename, config):
         """Parse the configure.ac file for build requirements."""
-        buf = ""
-        depth = 0
-        # print("Configure parse: ", filename)
         config.set_build_pattern("configure_ac", 1)
-        f = util.open_auto(filename, "r")
-        while 1:
-            c = f.read(1)
-            if not c:
-                break
-            if c == "(":
-                depth += 1
-            if c == ")" and depth > 0:
-                depth -= 1
-            if c != "\n":
-                buf += c
-            if c == "\n" and depth == 0:
-                self.configure_ac_line(buf, config.config_opts.get('32bit'))
-                buf = ""
-        self.configure_ac_line(buf, config.config_opts.get('32bit'))
-        f.close()
+        self.apply_actions(configure_ac_actions(filename, config.config_opts.get('32bit')), config.os_packages)
 
     def parse_cargo_toml(self, filename, config):
         """Update build requirements using Cargo.toml.
@@ -577,14 +1096,13 @@ class Requirements(object):
             self.add_buildreq("ocperftools")
             self.add_buildreq("linux-tools")
             self.add_buildreq("pmu-tools")
-        with util.open_auto(filename, "r") as ctoml:
-            cargo = toml.loads(ctoml.read())
-        if cargo.get("bin") or os.path.exists(os.path.join(os.path.dirname(filename), "src/main.rs")):
+        has_bin, dependencies = cargo_toml_info(filename)
+        if has_bin or os.path.exists(os.path.join(os.path.dirname(filename), "src/main.rs")):
             self.cargo_bin = True
-        if not cargo.get("dependencies"):
+        if not dependencies:
             return
         if not config.config_opts["altcargo1"] and not config.config_opts["altcargo_pgo"]:
-            for cdep in cargo["dependencies"]:
+            for cdep in dependencies:
                 if self.add_buildreq(cdep):
                     self.add_requires(cdep, config.os_packages)
 
@@ -689,116 +1207,27 @@ class Requirements(object):
 
     def rakefile(self, filename, gems):
         """Scan Rakefile for build requirements."""
-        with util.open_auto(filename, "r") as f:
-            lines = f.readlines()
-
-        pat = re.compile(r"^require '(.*)'$")
-        for line in lines:
-            match = pat.search(line)
-            if match:
-                s = match.group(1)
-                if s != "rubygems" and s in gems:
-                    print("Rakefile-dep: " + gems[s])
-                    self.add_buildreq(gems[s])
-                else:
-                    print("Rakefile-new: rubygem-" + s)
+        self.apply_actions(rakefile_actions(filename, gems), None)
 
     def parse_cmake(self, filename, cmake_modules, conf32):
         """Scan a .cmake or CMakeLists.txt file for what's it's actually looking for."""
-        findpackage = re.compile(r"^[^#]*find_package\((\w+)\b.*\)", re.I)
-        pkgconfig = re.compile(r"^[^#]*pkg_check_modules\s*\(\w+ (.*)\)", re.I)
-        pkg_search_modifiers = {'REQUIRED', 'QUIET', 'NO_CMAKE_PATH',
-                                'NO_CMAKE_ENVIRONMENT_PATH', 'IMPORTED_TARGET'}
-        extractword = re.compile(r'(?:"([^"]+)"|(\S+))(.*)')
-
-        with util.open_auto(filename, "r") as f:
-            lines = f.readlines()
-        for line in lines:
-            match = findpackage.search(line)
-            if match:
-                module = match.group(1)
-                try:
-                    pkg = cmake_modules[module]
-                    self.add_buildreq(pkg)
-                except Exception:
-                    pass
-
-            match = pkgconfig.search(line)
-            if match:
-                rest = match.group(1)
-                while rest:
-                    wordmatch = extractword.search(rest)
-                    if not wordmatch:
-                        break
-                    rest = wordmatch.group(3)
-                    if wordmatch.group(2) in pkg_search_modifiers:
-                        continue
-                    # Only one of the two groups can match at a time
-                    module = wordmatch.group(1)
-                    if not module:
-                        module = wordmatch.group(2)
-                    # We have a match, so strip out any version info
-                    for m in parse_modules_list(module, is_cmake=True):
-                        self.add_pkgconfig_buildreq(m, conf32)
+        self.apply_actions(cmake_actions(filename, cmake_modules, conf32), None)
 
     def qmake_profile(self, filename, qt_modules):
         """Scan .pro file for build requirements."""
-        with util.open_auto(filename, "r") as f:
-            lines = f.readlines()
-
-        pat = re.compile(r"(QT|QT_PRIVATE|QT_FOR_CONFIG).*=\s*(.*)\s*")
-        for line in lines:
-            match = pat.search(line)
-            if not match:
-                continue
-            s = match.group(2)
-            for module in s.split():
-                module = re.sub('-private$', '', module)
-                try:
-                    pc = qt_modules[module]
-                    self.add_buildreq('pkgconfig({})'.format(pc))
-                except Exception:
-                    pass
+        self.apply_actions(qmake_actions(filename, qt_modules), None)
 
     def grab_python_requirements(self, descfile, packages):
         """Add python requirements from requirements.txt file."""
-        with util.open_auto(descfile, "r") as f:
-            lines = f.readlines()
-
-        for line in lines:
-            if '[' in line:
-                break
-            clean_line = clean_python_req(line)
-            if 'pytest' in line:
-                continue
-            if clean_line:
-                if self.add_buildreq(f"pypi({clean_line})"):
-                    self.add_requires(f"pypi({clean_line})", packages, override=True, subpkg="python3")
+        self.apply_actions(python_requirements_actions(descfile), packages)
 
     def add_pyproject_requires(self, filename):
         """Detect build requirements listed in pyproject.toml in the build-system's requires lists."""
-        with util.open_auto(filename) as pfile:
-            pyproject = toml.loads(pfile.read())
-        if not (buildsys := pyproject.get("build-system")):
-            return
-
-        if not (requires := buildsys.get("requires")):
-            return
-
-        for require in requires:
-            if dep := clean_python_req(require):
-                self.add_buildreq(f"pypi({dep})")
+        self.apply_actions(pyproject_actions(filename), None)
 
     def add_setup_cfg_requires(self, filename, packages):
         """Detect install requirements listed in setup.cfg in the build-system's requires lists."""
-        setup_f = configparser.ConfigParser(interpolation=None, allow_no_value=True)
-        setup_f.read(filename)
-        if 'options' in setup_f.sections() and (install_reqs := setup_f['options'].get('install_requires')):
-            for req in install_reqs.splitlines():
-                if dep := clean_python_req(req):
-                    req = f"pypi({dep})"
-                    self.add_buildreq(req)
-                    self.add_requires(req, packages, subpkg="python3")
+        self.apply_actions(setup_cfg_actions(filename), packages)
 
     def add_setup_py_requires(self, filename, packages):
         """Detect build requirements listed in setup.py in the install_requires and setup_requires lists.
@@ -821,261 +1250,175 @@ class Requirements(object):
 
         Does not evaluate variables for security purposes
         """
-        multiline = False
-        with util.open_auto(filename) as f:
-            lines = f.readlines()
-
-        for line in lines:
-            if not multiline and ("install_requires" in line or "setup_requires" in line):
-                req = "install_requires" in line
-                # find the value for *_requires
-                line = line.split("=", 1)
-                if len(line) == 2:
-                    line = line[1].strip()
-                else:
-                    # skip because this could be a conditionally extended list
-                    # we only want to automatically detect the core packages
-                    continue
-
-                # easy, one-line case
-                if line.startswith("[") and "]" in line:
-                    # remove the leading [ and split off everthing after the ]
-                    line = line[1:].split("]")[0]
-                    for item in line.split(','):
-                        item = item.strip()
-                        try:
-                            # eval the string and add requirements
-                            if dep := clean_python_req(ast.literal_eval(item)):
-                                dep = f"pypi({dep})"
-                                if self.add_buildreq(dep) and req:
-                                    self.add_requires(dep, packages, subpkg="python3")
-
-                        except Exception:
-                            # do not fail, the line contained a variable and
-                            # had to be skipped
-                            pass
-
-                    continue
-
-                # more complicated, multi-line list.
-                # this sets the py_dep_string with the current line, which
-                # is the beginning of a multi-line list.
-                elif line.startswith("["):
-                    multiline = True
-                    line = line.lstrip("[")
-
-                # if the line doesn't start with '[' it is the case where
-                # there is (should be) a single dependency as a string
-                else:
-                    line = line.strip()
-                    try:
-                        if dep := clean_python_req(ast.literal_eval(line)):
-                            dep = f"pypi({dep})"
-                            if self.add_buildreq(dep) and req:
-                                self.add_requires(dep, packages, subpkg="python3")
-
-                    except Exception:
-                        # Do not fail, just keep looking
-                        pass
-
-                    continue
-
-            # if multiline was set above when a multi-line list was
-            # detected, for each line until the end bracket is found attempt to
-            # add the line as a buildreq
-            if multiline:
-                # if end bracket found, reset the flag
-                if "]" in line:
-                    multiline = False
-                    line = line.split("]")[0]
-
-                try:
-                    dep = ast.literal_eval(line.split('#')[0].strip(' ,\n'))
-                    if dep := clean_python_req(dep):
-                        dep = f"pypi({dep})"
-                        if self.add_buildreq(dep) and req:
-                            self.add_requires(dep, packages, subpkg="python3")
-
-                except Exception:
-                    # do not fail, the line contained a variable and had to
-                    # be skipped
-                    pass
+        self.apply_actions(setup_py_actions(filename), packages)
 
     def parse_catkin_deps(self, cmakelists_file, conf32):
         """Determine requirements for catkin packages."""
-        f = util.open_auto(cmakelists_file, "r")
-        lines = f.readlines()
-        pat = re.compile(r"^find_package.*\(.*(catkin)(?: REQUIRED *)?(?:COMPONENTS (?P<comp>.*))?\)$")
-        catkin = False
-        for line in lines:
-            match = pat.search(line)
-            if not match:
-                continue
-
-            # include catkin's required components
-            comp = match.group("comp")
-            if comp:
-                for curr in comp.split(" "):
-                    self.add_pkgconfig_buildreq(curr, conf32)
-
-            catkin = True
+        self.apply_actions(catkin_actions(cmakelists_file, conf32), None)
 
-        # catkin find_package() function will always rely on CMAKE_PREFIX_PATH
-        # make sure we keep it consistent with CMAKE_INSTALL_PREFIX otherwise
-        # it'll never be able to find its modules
-        if catkin:
-            for curr in ["catkin", "catkin_pkg", "empy", "googletest"]:
-                self.add_buildreq(curr)
-
-            self.extra_cmake.add("-DCMAKE_PREFIX_PATH=/usr")
-            self.extra_cmake.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
-            self.extra_cmake.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
-            self.extra_cmake_special.add("-DCMAKE_PREFIX_PATH=/usr")
-            self.extra_cmake_special.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
-            self.extra_cmake_special.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
-            self.extra_cmake_special2.add("-DCMAKE_PREFIX_PATH=/usr")
-            self.extra_cmake_special2.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
-            self.extra_cmake_special2.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
-            self.cmake_macro.add("-DCMAKE_PREFIX_PATH=/usr")
-            self.cmake_macro.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
-            self.cmake_macro.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
-            self.cmake_macro_32.add("-DCMAKE_PREFIX_PATH=/usr")
-            self.cmake_macro_32.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
-            self.cmake_macro_32.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
-            self.cmake_macro_special.add("-DCMAKE_PREFIX_PATH=/usr")
-            self.cmake_macro_special.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
-            self.cmake_macro_special.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
-            self.extra_cmake_special_pgo.add("-DCMAKE_PREFIX_PATH=/usr")
-            self.extra_cmake_special_pgo.add("-DCATKIN_BUILD_BINARY_PACKAGE=ON")
-            self.extra_cmake_special_pgo.add("-DSETUPTOOLS_DEB_LAYOUT=OFF")
-
-    def scan_for_configure(self, dirn, tname, config):
-        """Scan the package directory for build files to determine build pattern."""
-        if config.default_pattern == "distutils36":
-            self.add_buildreq("buildreq-distutils36")
-        elif config.default_pattern == "distutils3":
-            self.add_buildreq("buildreq-distutils3")
-            self.add_buildreq("pypi(setuptools)")
-        elif config.default_pattern == "golang":
-            self.add_buildreq("buildreq-golang")
-        elif config.default_pattern == "cmake":
-            self.add_buildreq("buildreq-cmake")
-        elif config.default_pattern == "configure":
-            self.add_buildreq("buildreq-configure")
-        elif config.default_pattern == "qmake":
-            self.add_buildreq("buildreq-qmake")
-        elif config.default_pattern == "cpan":
-            self.add_buildreq("buildreq-cpan")
-        elif config.default_pattern == "scons":
-            self.add_buildreq("buildreq-scons")
-        elif config.default_pattern == "R":
-            self.add_buildreq("buildreq-R")
-            self.parse_r_description(os.path.join(dirn, "DESCRIPTION"), config.os_packages)
-        elif config.default_pattern == "phpize":
-            self.add_buildreq("buildreq-php")
-        elif config.default_pattern == "nginx":
-            self.add_buildreq("buildreq-nginx")
-        elif config.default_pattern == "waf":
-            self.add_buildreq("buildreq-configure")
+    def plan_configure_scan(self, dirn, config, index=None):
+        """Walk dirn and return the steps scan_for_configure applies, in walk order.
 
-        count = 0
-        for dirpath, _, files in os.walk(dirn):
+        Steps are build pattern votes, buildreqs, and build files to parse.
+        Parsing is deferred so the files can be parsed concurrently, and
+        files only parsed for a given build pattern carry that condition,
+        which is checked when the step is applied.
+        """
+        steps = []
+        for dirpath, _, files in srcindex.walk(dirn, index):
             default_score = 2 if dirpath == dirn else 1
 
             if any(f.endswith(".go") for f in files):
-                self.add_buildreq("buildreq-golang")
-                config.set_build_pattern("golang", default_score)
+                steps.append(("buildreq", "buildreq-golang"))
+                steps.append(("pattern", "golang", default_score))
 
             if "go.mod" in files:
                 if "Makefile" not in files and "makefile" not in files:
                     # Go packages usually have make build systems so far
                     # so only use go directly if we can't find a Makefile
-                    config.set_build_pattern("golang", default_score)
-                self.add_buildreq("buildreq-golang")
-                if config.default_pattern == "golang-mod" or config.default_pattern == "godep":
-                    config.set_gopath = False
-                    mod_path = os.path.join(dirpath, "go.mod")
-                    reqs = parse_go_mod(mod_path)
-                    for req in reqs:
-                        # req[0] is a SCM url segment in the form, repo/XXX/dependency-name
-                        # req[1] is the version of the dependency
-                        pkg = "go-" + req[0].replace("/", "-")
-                        self.add_buildreq(pkg)
-                        if config.default_pattern == "godep":
-                            self.add_requires(pkg, config.os_packages)
+                    steps.append(("pattern", "golang", default_score))
+                steps.append(("buildreq", "buildreq-golang"))
+                steps.append(("go_mod", os.path.join(dirpath, "go.mod")))
 
             if "CMakeLists.txt" in files and "configure.ac" not in files:
-                self.add_buildreq("buildreq-cmake")
-                config.set_build_pattern("cmake", default_score)
+                steps.append(("buildreq", "buildreq-cmake"))
+                steps.append(("pattern", "cmake", default_score))
 
                 srcdir = os.path.abspath(os.path.join(dirn, "clr-build", config.cmake_srcdir or ".."))
                 if os.path.samefile(dirpath, srcdir):
-                    self.parse_catkin_deps(os.path.join(srcdir, "CMakeLists.txt"), config.config_opts.get('32bit'))
+                    steps.append(("parse", "catkin", os.path.join(srcdir, "CMakeLists.txt"), None))
 
             if "configure" in files and os.access(dirpath + '/configure', os.X_OK):
-                config.set_build_pattern("configure", default_score)
+                steps.append(("pattern", "configure", default_score))
             elif any(is_qmake_pro(f) for f in files):
-                self.add_buildreq("buildreq-qmake")
-                config.set_build_pattern("qmake", default_score)
+                steps.append(("buildreq", "buildreq-qmake"))
+                steps.append(("pattern", "qmake", default_score))
 
             if "requires.txt" in files:
                 req_path = os.path.join(dirpath, "requires.txt")
                 if not python_req_in_filtered_path(req_path):
-                    self.grab_python_requirements(req_path, config.os_packages)
+                    steps.append(("parse", "requirements", req_path, None))
 
             if "pyproject.toml" in files:
                 req_path = os.path.join(dirpath, "pyproject.toml")
                 if not python_req_in_filtered_path(req_path):
-                    self.add_buildreq("buildreq-distutils3")
-                    self.add_pyproject_requires(req_path)
+                    steps.append(("buildreq", "buildreq-distutils3"))
+                    steps.append(("parse", "pyproject", req_path, None))
                     if "setup.cfg" in files:
-                        self.add_setup_cfg_requires(dirpath + '/setup.cfg', config.os_packages)
-                    config.set_build_pattern("pyproject", default_score)
+                        steps.append(("parse", "setup_cfg", dirpath + '/setup.cfg', None))
+                    steps.append(("pattern", "pyproject", default_score))
             elif "setup.py" in files:
                 req_path = os.path.join(dirpath, "setup.py")
                 if not python_req_in_filtered_path(req_path):
-                    self.add_buildreq("buildreq-distutils3")
-                    self.add_setup_py_requires(req_path, config.os_packages)
-                    config.set_build_pattern("distutils3", default_score)
+                    steps.append(("buildreq", "buildreq-distutils3"))
+                    steps.append(("parse", "setup_py", req_path, None))
+                    steps.append(("pattern", "distutils3", default_score))
 
             if "Makefile.PL" in files or "Build.PL" in files:
-                config.set_build_pattern("cpan", default_score)
-                self.add_buildreq("buildreq-cpan")
+                steps.append(("pattern", "cpan", default_score))
+                steps.append(("buildreq", "buildreq-cpan"))
 
             if "SConstruct" in files:
-                self.add_buildreq("buildreq-scons")
-                config.set_build_pattern("scons", default_score)
+                steps.append(("buildreq", "buildreq-scons"))
+                steps.append(("pattern", "scons", default_score))
 
             if "requirements.txt" in files:
                 req_path = os.path.join(dirpath, "requirements.txt")
                 if not python_req_in_filtered_path(req_path):
-                    self.grab_python_requirements(req_path, config.os_packages)
+                    steps.append(("parse", "requirements", req_path, None))
 
             if "meson.build" in files:
-                self.add_buildreq("buildreq-meson")
-                config.set_build_pattern("meson", default_score)
+                steps.append(("buildreq", "buildreq-meson"))
+                steps.append(("pattern", "meson", default_score))
 
             for name in files:
                 if name.lower() == "cargo.toml" and dirpath == dirn:
-                    self.parse_cargo_toml(os.path.join(dirpath, name), config)
+                    steps.append(("pattern", "cargo", 1))
+                    steps.append(("cargo", os.path.join(dirpath, name)))
                 if name.lower().startswith("configure."):
-                    self.parse_configure_ac(os.path.join(dirpath, name), config)
-                if name.lower().startswith("rakefile") and config.default_pattern == "ruby":
-                    self.rakefile(os.path.join(dirpath, name), config.gems)
-                if name.endswith(".pro") and config.default_pattern == "qmake":
-                    self.qmake_profile(os.path.join(dirpath, name), config.qt_modules)
+                    steps.append(("pattern", "configure_ac", 1))
+                    steps.append(("parse", "configure_ac", os.path.join(dirpath, name), None))
+                if name.lower().startswith("rakefile"):
+                    steps.append(("parse", "rakefile", os.path.join(dirpath, name), ("ruby",)))
+                if name.endswith(".pro"):
+                    steps.append(("parse", "qmake", os.path.join(dirpath, name), ("qmake",)))
                 if name.lower() == "makefile":
-                    config.set_build_pattern("make", default_score)
+                    steps.append(("pattern", "make", default_score))
                 if name.lower() == "autogen.sh":
-                    config.set_build_pattern("autogen", default_score)
+                    steps.append(("pattern", "autogen", default_score))
                 if name.lower() == "cmakelists.txt":
-                    config.set_build_pattern("cmake", default_score)
-                if (name.lower() == "cmakelists.txt" or name.endswith(".cmake")) \
-                   and config.default_pattern == "cmake":
-                    self.parse_cmake(os.path.join(dirpath, name), config.cmake_modules, config.config_opts.get('32bit'))
+                    steps.append(("pattern", "cmake", default_score))
+                if name.lower() == "cmakelists.txt" or name.endswith(".cmake"):
+                    steps.append(("parse", "cmake", os.path.join(dirpath, name), ("cmake",)))
 
             if "build.tcl" in files:
-                config.set_build_pattern("buildtcl_script", default_score)
+                steps.append(("pattern", "buildtcl_script", default_score))
+        return steps
+
+    def scan_for_configure(self, dirn, tname, config, index=None):
+        """Scan the package directory for build files to determine build pattern."""
+        if config.default_pattern == "distutils36":
+            self.add_buildreq("buildreq-distutils36")
+        elif config.default_pattern == "distutils3":
+            self.add_buildreq("buildreq-distutils3")
+            self.add_buildreq("pypi(setuptools)")
+        elif config.default_pattern == "golang":
+            self.add_buildreq("buildreq-golang")
+        elif config.default_pattern == "cmake":
+            self.add_buildreq("buildreq-cmake")
+        elif config.default_pattern == "configure":
+            self.add_buildreq("buildreq-configure")
+        elif config.default_pattern == "qmake":
+            self.add_buildreq("buildreq-qmake")
+        elif config.default_pattern == "cpan":
+            self.add_buildreq("buildreq-cpan")
+        elif config.default_pattern == "scons":
+            self.add_buildreq("buildreq-scons")
+        elif config.default_pattern == "R":
+            self.add_buildreq("buildreq-R")
+            self.parse_r_description(os.path.join(dirn, "DESCRIPTION"), config.os_packages)
+        elif config.default_pattern == "phpize":
+            self.add_buildreq("buildreq-php")
+        elif config.default_pattern == "nginx":
+            self.add_buildreq("buildreq-nginx")
+        elif config.default_pattern == "waf":
+            self.add_buildreq("buildreq-configure")
+
+        count = 0
+        steps = self.plan_configure_scan(dirn, config, index)
+        context = {
+            "conf32": config.config_opts.get('32bit'),
+            "cmake_modules": config.cmake_modules,
+            "qt_modules": config.qt_modules,
+            "gems": config.gems,
+        }
+        results = run_parse_jobs(planned_parse_jobs(steps, config.default_pattern, config.pattern_strength), context)
+        for step in steps:
+            kind = step[0]
+            if kind == "pattern":
+                config.set_build_pattern(step[1], step[2])
+            elif kind == "parse":
+                _, parser, path, patterns = step
+                if patterns and config.default_pattern not in patterns:
+                    continue
+                if (parser, path) not in results:
+                    results.update(run_parse_jobs([(parser, path)], context))
+                self.apply_actions(results[(parser, path)], config.os_packages)
+            elif kind == "go_mod":
+                if config.default_pattern == "golang-mod" or config.default_pattern == "godep":
+                    config.set_gopath = False
+                    reqs = parse_go_mod(step[1])
+                    for req in reqs:
+                        # req[0] is a SCM url segment in the form, repo/XXX/dependency-name
+                        # req[1] is the version of the dependency
+                        pkg = "go-" + req[0].replace("/", "-")
+                        self.add_buildreq(pkg)
+                        if config.default_pattern == "godep":
+                            self.add_requires(pkg, config.os_packages)
+            elif kind == "cargo":
+                self.parse_cargo_toml(step[1], config)
+            else:
+                self.apply_actions([step], config.os_packages)
 
         can_reconf = os.path.exists(os.path.join(dirn, "configure.ac"))
         if not can_reconf:
@@ -1099,7 +1442,7 @@ class Requirements(object):
                 if config.alias:
                     tname = config.alias
                 pypi_name = pypidata.get_pypi_name(tname)
-                pypi_json = pypidata.get_pypi_metadata(pypi_name)
+                pypi_json = pypidata.get_pypi_metadata(pypi_name, dirn)
             if pypi_json:
                 try:
                     package_pypi = json.loads(pypi_json)
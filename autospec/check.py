@@ -23,6 +23,8 @@ import os
 import re
 
 import count
+import loganalyzer
+import srcindex
 import util
 
 tests_config = ""
@@ -39,6 +41,11 @@ def check_regression(pkg_dir, skip_tests, test_round):
         log_path = os.path.join(pkg_dir, 'results', f"round{test_round}-build.log")
         result = count.parse_log(log_path)
 
+    write_testresults(pkg_dir, result)
+
+
+def write_testresults(pkg_dir, result):
+    """Print the count module result and write it to the testresults file."""
     titles = [('Package', 'package name', 1),
               ('Total', 'total tests', 1),
               ('Pass', 'total passing', 1),
@@ -57,7 +64,25 @@ def check_regression(pkg_dir, skip_tests, test_round):
     util.write_out(os.path.join(pkg_dir, "testresults"), res_str)
 
 
-def scan_for_tests(src_dir, config, requirements, content):
+class TestResults(loganalyzer.LogConsumer):
+    """Count the test results of a build log and write them to testresults."""
+
+    def __init__(self, pkg_dir):
+        """Write the results to pkg_dir."""
+        self.pkg_dir = pkg_dir
+        self.counter = count.TestLogCounter()
+        self.feed = self.counter.parse_line
+
+    def finish(self):
+        """Write the test results, unless the log holds no test output."""
+        self.counter.finish()
+        result = self.counter.string_out()
+        if len(result) == 0 or result[0:2] == ',0':
+            return
+        write_testresults(self.pkg_dir, result)
+
+
+def scan_for_tests(src_dir, config, requirements, content, index=None):
     """Scan source directory for test files and set tests_config accordingly."""
     global tests_config
 
@@ -130,7 +155,7 @@ def scan_for_tests(src_dir, config, requirements, content):
         testsuites["makecheck"] += "\ncd ../build-openmpi;\n" + make_check_openmpi
         testsuites["cmake"] += "\ncd ../clr-build-openmpi;\n" + cmake_check_openmpi
 
-    files = os.listdir(src_dir)
+    files = index.listdir(src_dir) if index else os.listdir(src_dir)
 
     if config.default_pattern == "cmake":
         makefile_path = os.path.join(src_dir, "CMakeLists.txt")
@@ -175,7 +200,7 @@ def scan_for_tests(src_dir, config, requirements, content):
         makefile_path = os.path.join(src_dir, "meson.build")
         if not os.path.isfile(makefile_path):
             return
-        for dirpath, _, files in os.walk(src_dir):
+        for dirpath, _, files in srcindex.walk(src_dir, index):
             for f in files:
                 if f == "meson.build":
                     with util.open_auto(os.path.join(dirpath, f)) as fp:
@@ -0,0 +1,336 @@
+#!/bin/true
+#
+# compress.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Reproducible tarball creation. The tar stream is generated in-process
+# with sorted members and normalized metadata, then compressed with a
+# codec, level and thread count chosen from the archive size and host.
+# Identical trees therefore give byte-identical archives on hosts with the
+# same compressors installed, and an archive whose tree digest has not
+# changed is left alone.
+
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+
+import util
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MiB = 1024 * 1024
+
+# (input size upper bound, level) pairs per codec; small trees get the
+# strongest setting since it costs little, large trees trade ratio for time
+levels = {
+    "gzip": [(16 * MiB, 9), (256 * MiB, 6), (None, 4)],
+    "zstd": [(16 * MiB, 19), (256 * MiB, 12), (None, 6)],
+    "xz": [(16 * MiB, 9), (256 * MiB, 6), (None, 3)],
+}
+
+suffixes = [
+    (".tar.gz", "gzip"),
+    (".tgz", "gzip"),
+    (".tar.zst", "zstd"),
+    (".tar.xz", "xz"),
+]
+
+# Bumped whenever the tar layout changes, so cached digests are invalidated
+archive_format = 1
+
+# Special files tarfile can store, besides directories, regular files and symlinks
+tar_types = (stat.S_IFIFO, stat.S_IFCHR, stat.S_IFBLK)
+
+# Rotated round logs are written once and rarely read, favour speed
+log_level = 3
+
+
+def codec_for(filename):
+    """Return the codec implied by the archive filename."""
+    for suffix, codec in suffixes:
+        if filename.endswith(suffix):
+            return codec
+    return "gzip"
+
+
+def pick_level(codec, size):
+    """Return the compression level for codec given the uncompressed size."""
+    for bound, level in levels[codec]:
+        if bound is None or size < bound:
+            return level
+
+
+def pick_threads():
+    """Return the number of compression threads to use on this host."""
+    return os.cpu_count() or 1
+
+
+def source_date_epoch():
+    """Return the timestamp stored for every archive member."""
+    try:
+        return int(os.environ.get("SOURCE_DATE_EPOCH", 0))
+    except ValueError:
+        return 0
+
+
+def walk_tree(src_dir, exclude=()):
+    """Return the sorted relative paths under src_dir and their total size.
+
+    Entries whose name is in exclude are skipped at any depth, together with
+    everything below them, like tar --exclude. Sockets and other file types
+    tar cannot store are skipped with a warning, as tar does.
+    """
+    paths = []
+    size = 0
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(os.path.join(src_dir, rel_dir)) as entries:
+            for entry in entries:
+                if entry.name in exclude:
+                    continue
+                rel_path = os.path.join(rel_dir, entry.name)
+                st = entry.stat(follow_symlinks=False)
+                if stat.S_ISDIR(st.st_mode):
+                    pending.append(rel_path)
+                elif stat.S_ISREG(st.st_mode):
+                    size += st.st_size
+                elif not stat.S_ISLNK(st.st_mode) and stat.S_IFMT(st.st_mode) not in tar_types:
+                    util.print_warning(f"{os.path.join(src_dir, rel_path)}: file type not supported by tar, ignored")
+                    continue
+                paths.append(rel_path)
+    paths.sort()
+    return paths, size
+
+
+def tree_digest(src_dir, paths):
+    """Return a SHA-256 over the names, modes, link targets and contents of paths."""
+    sh = hashlib.sha256()
+    for rel_path in paths:
+        full_path = os.path.join(src_dir, rel_path)
+        st = os.lstat(full_path)
+        sh.update(f"{rel_path}\0{stat.S_IMODE(st.st_mode):o}\0{stat.S_IFMT(st.st_mode):o}\0".encode("utf-8", "surrogateescape"))
+        if stat.S_ISLNK(st.st_mode):
+            sh.update(os.readlink(full_path).encode("utf-8", "surrogateescape"))
+        elif stat.S_ISREG(st.st_mode):
+            with open(full_path, "rb") as f:
+                for chunk in iter(lambda: f.read(MiB), b""):
+                    sh.update(chunk)
+        sh.update(b"\0")
+    return sh.hexdigest()
+
+
+def normalize_member(tarinfo, mtime):
+    """Strip host specific metadata from a tar member."""
+    tarinfo.mtime = mtime
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ""
+    tarinfo.mode = stat.S_IMODE(tarinfo.mode)
+    if tarinfo.isdir() or tarinfo.isreg() and tarinfo.mode & 0o111:
+        tarinfo.mode = (tarinfo.mode & ~0o777) | 0o755
+    elif not tarinfo.issym():
+        tarinfo.mode = (tarinfo.mode & ~0o777) | 0o644
+    return tarinfo
+
+
+def write_tar(fileobj, src_dir, arcname, paths, mtime):
+    """Stream a deterministic tar of paths under src_dir into fileobj."""
+    with tarfile.open(fileobj=fileobj, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+        root = tar.gettarinfo(src_dir, arcname)
+        tar.addfile(normalize_member(root, mtime))
+        for rel_path in paths:
+            full_path = os.path.join(src_dir, rel_path)
+            tarinfo = normalize_member(tar.gettarinfo(full_path, os.path.join(arcname, rel_path)), mtime)
+            if tarinfo.isreg():
+                with open(full_path, "rb") as f:
+                    tar.addfile(tarinfo, f)
+            else:
+                tar.addfile(tarinfo)
+
+
+def external_compressor(codec, level, threads):
+    """Return the argv of a multi-threaded compressor for codec, if installed.
+
+    Only compressors whose output does not depend on the thread count are
+    used, so archives stay reproducible across hosts of different sizes.
+    Their output differs from the in-process compressors though (pigz and
+    gzip, zstd and zstandard), so archives are only byte-identical between
+    hosts with the same compressors installed.
+    """
+    if codec == "gzip" and util.binary_in_path("pigz"):
+        return ["pigz", f"-{level}", "-n", "-p", str(threads), "-c"]
+    if codec == "zstd" and not zstandard and util.binary_in_path("zstd"):
+        return ["zstd", f"-{level}", f"-T{threads}", "-q", "-c"]
+    return None
+
+
+def compress_stream(dest_f, codec, level, threads, write):
+    """Compress the bytes written by write(fileobj) into dest_f."""
+    argv = external_compressor(codec, level, threads)
+    if argv:
+        process = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=dest_f)
+        try:
+            write(process.stdin)
+        finally:
+            process.stdin.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, argv)
+    elif codec == "gzip":
+        with gzip.GzipFile(filename="", mode="wb", fileobj=dest_f, compresslevel=level, mtime=0) as out:
+            write(out)
+    elif codec == "xz":
+        with lzma.LZMAFile(dest_f, mode="wb", preset=level) as out:
+            write(out)
+    elif codec == "zstd" and zstandard:
+        params = zstandard.ZstdCompressionParameters.from_level(level, threads=threads)
+        cctx = zstandard.ZstdCompressor(compression_params=params)
+        with cctx.stream_writer(dest_f, closefd=False) as out:
+            write(out)
+    else:
+        raise RuntimeError(f"No {codec} compressor available")
+
+
+def digest_record_path(dest):
+    """Return the cache file recording the tree digest dest was built from."""
+    key = hashlib.sha1(os.path.abspath(dest).encode("utf-8")).hexdigest()
+    return os.path.join(util.get_cache_dir("archives"), f"{key}.json")
+
+
+def read_digest_record(dest):
+    """Return the recorded tree digest of dest, or None if it is stale."""
+    try:
+        with open(digest_record_path(dest), "r") as f:
+            record = json.load(f)
+        st = os.stat(dest)
+    except (OSError, ValueError):
+        return None
+    if record.get("size") != st.st_size or record.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return record.get("tree")
+
+
+def write_digest_record(dest, tree):
+    """Record the tree digest dest was built from."""
+    st = os.stat(dest)
+    record = {"tree": tree, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    util.write_out(digest_record_path(dest), json.dumps(record))
+
+
+def archive_tree(src_dir, arcname, dest, exclude=(), tree_id=None):
+    """Create a reproducible compressed tarball of src_dir at dest.
+
+    Members are stored under arcname, sorted, with fixed ownership, mode
+    and mtime. tree_id identifies the tree contents (e.g. a git tree hash);
+    without it a digest of the tree is computed. Returns False when dest was
+    already built from the same tree and was left untouched.
+    """
+    paths, size = walk_tree(src_dir, exclude)
+    codec = codec_for(dest)
+    level = pick_level(codec, size)
+    threads = pick_threads()
+    mtime = source_date_epoch()
+    if tree_id is None:
+        tree_id = tree_digest(src_dir, paths)
+    tree = f"{archive_format}:{codec}:{level}:{mtime}:{arcname}:{','.join(sorted(exclude))}:{tree_id}"
+    if os.path.isfile(dest) and read_digest_record(dest) == tree:
+        util.print_info(f"{dest} is up to date")
+        return False
+
+    if util.debugging:
+        util.print_debug(f"archive {src_dir} -> {dest}: {codec} -{level}, {threads} threads, {size} bytes")
+    tmp_dest = f"{dest}.tmp"
+    try:
+        with open(tmp_dest, "wb") as dest_f:
+            compress_stream(dest_f, codec, level, threads, lambda out: write_tar(out, src_dir, arcname, paths, mtime))
+        shutil.move(tmp_dest, dest)
+    except BaseException:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+        raise
+    write_digest_record(dest, tree)
+    return True
+
+
+def compress_log(path):
+    """Replace the log at path with path.zst, returning the new path."""
+    dest = f"{path}.zst"
+    tmp_dest = f"{dest}.tmp"
+    try:
+        with open(path, "rb") as src_f, open(tmp_dest, "wb") as dest_f:
+            compress_stream(dest_f, "zstd", log_level, 1, lambda out: shutil.copyfileobj(src_f, out, MiB))
+        os.replace(tmp_dest, dest)
+    except BaseException:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+        raise
+    os.remove(path)
+    return dest
+
+
+class LogArchiver(object):
+    """Compress the logs of past build rounds in a background thread.
+
+    The logs of the keep most recent rounds stay uncompressed; older
+    rounds are queued for compression as new rounds are added.
+    """
+
+    def __init__(self, keep=2):
+        """Keep the logs of the last keep rounds uncompressed."""
+        self.keep = max(0, keep)
+        self.rounds = []
+        self.executor = None
+        self.futures = []
+        self.warned = False
+
+    def add_round(self, paths):
+        """Record the logs of a finished round and compress the rounds beyond the last keep."""
+        self.rounds.append(list(paths))
+        while len(self.rounds) > self.keep:
+            for path in self.rounds.pop(0):
+                self.submit(path)
+
+    def submit(self, path):
+        """Queue path for compression."""
+        if not zstandard and not util.binary_in_path("zstd"):
+            if not self.warned:
+                util.print_warning("zstd is not available, round logs are kept uncompressed")
+                self.warned = True
+            return
+        if not self.executor:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.futures.append(self.executor.submit(compress_log, path))
+
+    def wait(self):
+        """Wait for the queued logs to be compressed, warning about any that failed."""
+        for future in self.futures:
+            try:
+                future.result()
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as err:
+                util.print_warning(f"Unable to compress log: {err}")
+        self.futures = []
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
@@ -17,113 +17,20 @@
 #
 
 import argparse
+import concurrent.futures
+import csv
+import json
+import os
 import re
-import util
+import sys
 
-testcount = {}
-testpass = {}
-testfail = {}
-testxfail = {}
-testskip = {}
-
-total_tests = 0
-total_tests = 0
-total_pass = 0
-total_fail = 0
-total_xfail = 0
-total_skip = 0
-
-counted_tests = 0
-counted_pass = 0
-counted_fail = 0
-counted_xfail = 0
-counted_skip = 0
-
-name = ''
-
-
-def zero_test_data():
-    """Zero test results."""
-    global total_tests
-    global total_pass
-    global total_fail
-    global total_xfail
-    global total_skip
-    global counted_tests
-    global counted_pass
-    global counted_fail
-    global counted_xfail
-    global counted_skip
-    total_tests = 0
-    total_pass = 0
-    total_fail = 0
-    total_xfail = 0
-    total_skip = 0
-    counted_tests = 0
-    counted_pass = 0
-    counted_fail = 0
-    counted_xfail = 0
-    counted_skip = 0
-
-def sanitize_counts():
-    """Validate test counts are within sane bounds."""
-    global total_tests
-    global total_pass
-    global total_fail
-    global total_xfail
-    global total_skip
-    global counted_tests
-    global counted_pass
-    global counted_fail
-    global counted_xfail
-    global counted_skip
-    if total_tests > 0 and total_pass == 0:
-        total_pass = total_tests - total_fail - total_skip - total_xfail
-
-    if total_tests < total_pass and total_pass > 0:
-        total_tests = total_pass + total_fail + total_skip + total_xfail
-
-    if counted_tests > 0 and counted_pass == 0:
-        counted_pass = counted_tests - counted_fail - counted_skip - counted_xfail
-
-    if counted_tests < counted_pass and counted_pass > 0:
-        counted_tests = counted_pass + counted_fail + counted_skip + counted_xfail
-
-    if (total_pass + total_fail + total_skip + total_xfail) < total_tests:
-        total_pass += total_tests - (total_pass + total_fail + total_skip + total_xfail)
-
-    if (total_pass + total_fail + total_skip + total_xfail) > total_tests:
-        total_tests = total_pass + total_fail + total_skip + total_xfail
-
-
-def collect_output():
-    """Sum test results."""
-    if not testcount.get(name):
-        testcount[name] = 0 if not testcount.get(name) else testcount[name]
-    if not testpass.get(name):
-        testpass[name] = 0
-    if not testfail.get(name):
-        testfail[name] = 0
-    if not testxfail.get(name):
-        testxfail[name] = 0
-    if not testskip.get(name):
-        testskip[name] = 0
-
-    if counted_tests > total_tests:
-        testcount[name] += counted_tests
-        testpass[name] += counted_pass
-        testfail[name] += counted_fail
-        testxfail[name] += counted_xfail
-        testskip[name] += counted_skip
+import util
 
-    else:
-        testcount[name] += total_tests
-        testpass[name] += total_pass
-        testfail[name] += total_fail
-        testxfail[name] += total_xfail
-        testskip[name] += total_skip
+# Columns of the aggregated results of many packages
+result_fields = ("package", "log", "name", "total", "pass", "fail", "skip", "xfail")
 
-    zero_test_data()
+count_fields = ("total_tests", "total_pass", "total_fail", "total_xfail", "total_skip",
+                "counted_tests", "counted_pass", "counted_fail", "counted_xfail", "counted_skip")
 
 
 def convert_int(intstr):
@@ -134,1131 +41,856 @@ def convert_int(intstr):
         return 0
 
 
-def parse_meson_test(lines):
-    """Parse output of meson tests logs."""
-    global total_pass
-    global total_xfail
-    global total_fail
-    global total_skip
-    for line in lines:
+def tally(*fields, amount=1):
+    """Return a rule action adding amount to the fields counts."""
+    def action(counts, match):
+        for field in fields:
+            counts[field] += amount
+    return action
+
+
+def totals(*fields):
+    """Return a rule action adding each group of the match to its field.
+
+    A field may be None to ignore the group, or a tuple of fields to add
+    the group to all of them.
+    """
+    def action(counts, match):
+        for group_fields, value in zip(fields, match.groups()):
+            if group_fields is None:
+                continue
+            if isinstance(group_fields, str):
+                group_fields = (group_fields,)
+            for field in group_fields:
+                counts[field] += convert_int(value)
+    return action
+
+
+def count_pytest(counts, match):
+    """Add the counts of a pytest summary line."""
+    for part in match.string.split(","):
+        if (m := re.search(r"([0-9]+) failed", part)):
+            counts["total_fail"] += convert_int(m.group(1))
+        elif (m := re.search(r"([0-9]+) passed", part)):
+            counts["total_pass"] += convert_int(m.group(1))
+        elif (m := re.search(r"([0-9]+) skipped", part)):
+            counts["total_skip"] += convert_int(m.group(1))
+        elif (m := re.search(r"([0-9]+) xfailed", part)):
+            counts["total_xfail"] += convert_int(m.group(1))
+        elif (m := re.search(r"([0-9]+) xpassed", part)):
+            counts["total_pass"] += convert_int(m.group(1))
+        elif (m := re.search(r"([0-9]+) pytest-warnings", part)):
+            # FIXME: should "pytest-warnings" count toward the test total
+            # and fail count? They are ignored at the moment...
+            pass
+        elif (m := re.search(r"([0-9]+) warnings", part)):
+            counts["total_fail"] += convert_int(m.group(1))
+        elif (m := re.search(r"([0-9]+) error", part)):
+            counts["total_fail"] += convert_int(m.group(1))
+
+
+def count_ran_skipped_failed(counts, match):
+    """Add the counts of a mercurial summary line."""
+    ran, skipped, failed = (convert_int(group) for group in match.groups())
+    counts["total_fail"] += failed
+    counts["total_skip"] += skipped
+    counts["total_pass"] += ran - skipped - failed
+
+
+def count_testdone(counts, match):
+    """Set the counts of a curl summary line."""
+    passed, tests = convert_int(match.group(1)), convert_int(match.group(2))
+    counts["total_tests"] += tests
+    counts["total_pass"] += passed
+    counts["total_fail"] = tests - passed
+
+
+def count_checks_failed(counts, match):
+    """Add the counts of an expat summary line."""
+    checks, failed = convert_int(match.group(1)), convert_int(match.group(2))
+    counts["total_pass"] += checks - failed
+    counts["total_fail"] += failed
+
+
+def count_tap_not_ok(counts, match):
+    """Count a failed TAP test, or an expected failure for TODO tests."""
+    if re.search(r"# TODO\b", match.string):
+        counts["counted_xfail"] += 1
+    else:
+        counts["counted_fail"] += 1
+
+
+def count_failed_out_of(counts, match):
+    """Add the counts of a ctest summary line."""
+    failed, tests = convert_int(match.group(1)), convert_int(match.group(2))
+    counts["total_fail"] += failed
+    counts["total_tests"] += tests
+    counts["total_pass"] += tests - failed
+
+
+def count_tests_run_errors(counts, match):
+    """Add the counts of a sudo summary line."""
+    tests, errors = convert_int(match.group(1)), convert_int(match.group(2))
+    counts["total_tests"] += tests
+    counts["total_fail"] += errors
+    counts["total_pass"] += tests - errors
+
+
+def count_failed_case(counts, match):
+    """Turn the last btrfs-progs test counted as passing into a failure."""
+    counts["total_fail"] += 1
+    counts["total_pass"] = max(0, counts["total_pass"] - 1)
+
+
+def count_attempted(counts, match):
+    """Add the counts of an xdg-utils summary line."""
+    failed, passed, attempted = (convert_int(group) for group in match.groups())
+    counts["total_fail"] += failed
+    counts["total_pass"] += passed
+    counts["total_skip"] += attempted - (passed + failed)
+
+
+def count_valgrind(counts, match):
+    """Add the counts of a valgrind summary line."""
+    tests = convert_int(match.group(1))
+    failed = sum(convert_int(group) for group in match.groups()[1:])
+    counts["total_tests"] += tests
+    counts["total_fail"] += failed
+    counts["total_pass"] += tests - failed
+
+
+def set_tests_passed_failed(counts, match):
+    """Set the counts from a libconfig summary line."""
+    counts["total_tests"] = convert_int(match.group(1))
+    counts["total_pass"] = convert_int(match.group(2))
+    counts["total_fail"] = convert_int(match.group(3))
+
+
+# Test log patterns, tried in order on every line until one matches:
+# (literal the line must contain, pattern, only counted inside %check, action)
+parse_rules = [
+    # ACL package
+    # [22] $ rm -Rf d -- ok-
+    # 17 commands (17 passed, 0 failed)-
+    ("-- ok", r"\[[0-9]+\].*\-\- ok", False, tally("counted_pass")),
+    (" commands (", r"[0-9]+ commands \(([0-9]+) passed, ([0-9]+) failed\)", False, totals("total_pass", "total_fail")),
+
+    # alembic package
+    # Ran 678 tests in 5.175s
+    # OK (SKIP=15)
+    ("Ran ", "Ran ([0-9]+) tests? in", False, totals("total_tests")),
+    ("OK (SKIP=", r"OK \(SKIP=([0-9]+)\)", False, totals("total_skip")),
+    ("OK (skipped=", r"OK \(skipped=([0-9]+)\)", False, totals("total_skip")),
+
+    # anyjson
+    # test_implementations.test_default_serialization ... ok
+    # note: configure false positive
+    ("... ok", r"\.\.\. ok$", True, tally("counted_pass")),
+    ("... skipped", r"\.\.\. skipped$", True, tally("counted_skip")),
+
+    # apr
+    # testatomic          :  SUCCESS
+    (":  SUCCESS", r":  SUCCESS$", True, tally("counted_pass")),
+
+    # for packages using pytest...
+    ("== ", r"== .*[0-9]+ x?(?:failed|passed|skipped|warnings|pytest-warnings|error) in [0-9.]+(?:s| seconds)", True,
+     count_pytest),
+
+    # mercurial
+    # running 59 tests using 8 parallel processes
+    # # Ran 55 tests, 4 skipped, 0 failed.
+    ("# Ran ", r"^# Ran ([0-9]+) tests\, ([0-9]+) skipped\, ([0-9]+) failed.", True, count_ran_skipped_failed),
+
+    # augeas
+    # TOTAL: 215
+    # PASS:  212
+    # SKIP:  3
+    # XFAIL: 0
+    # FAIL:  0
+    # XPASS: 0
+    # ERROR: 0
+    ("# TOTAL: ", r"# TOTAL: +([0-9]+)", True, totals("total_tests")),
+    ("# PASS: ", r"# PASS: +([0-9]+)", True, totals("total_pass")),
+    ("# SKIP: ", r"# SKIP: +([0-9]+)", True, totals("total_skip")),
+    ("# FAIL: ", r"# FAIL: +([0-9]+)", True, totals("total_fail")),
+    ("# XFAIL: ", r"# XFAIL: +([0-9]+)", True, totals("total_xfail")),
+    ("# XPASS: ", r"# XPASS: +([0-9]+)", True, totals("total_pass")),
+
+    # autoconf
+    # 493 tests behaved as expected.
+    # 10 tests were skipped.
+    # 495: AC_FUNC_STRNLEN                                 ok
+    # 344: Erlang                                          skipped (erlang.at:30)
+    # 26: autoupdating macros recursively                 expected failure (tools.at:945)
+    (" tests behaved as expected", r"^([0-9]+) tests behaved as expected", True, totals("total_pass")),
+    (" tests were skipped", r"^([0-9]+) tests were skipped", True, totals("total_skip")),
+    ("ok", r"^[0-9]+\:.*ok$", True, tally("counted_pass")),
+    ("skipped (", r"^[0-9]+\:.*skipped \(", True, tally("counted_skip")),
+    ("expected failure (", r"^[0-9]+\:.*expected failure \(", True, tally("counted_xfail")),
+
+    # bison
+    # 470 tests were successful.
+    (" tests were successful", r"^([0-9]+) tests were successful", True, totals("total_pass")),
+
+    # binutils
+    # of expected passes            1144
+    # of expected failures          57
+    # of untested testcases         1
+    # of unsupported tests          12
+    ("# of expected passes", r"^# of expected passes.*\t([0-9]+)", True, totals("total_pass")),
+    ("# of expected failures", r"^# of expected failures.*\t([0-9]+)", True, totals("total_xfail")),
+    ("# of unexpected failures", r"^# of unexpected failures.*\t([0-9]+)", True, totals("total_fail")),
+    ("# of unsupported tests", r"^# of unsupported tests.*\t([0-9]+)", True, totals("total_skip")),
+
+    # ccache
+    # PASSED: 448 assertions, 88 tests, 10 suites
+    ("PASSED: ", r"PASSED: [0-9]+ assertions, ([0-9]+) tests, [0-9]+ suites", True, totals("total_pass")),
+
+    # rubygem-rack
+    # 701 tests, 2292 assertions, 0 failures, 0 errors
+    (" assertions, ", r"([0-9]+) tests, [0-9]+ assertions, ([0-9]+) failures, ([0-9])+ errors", True,
+     totals("total_pass", "total_fail", "total_fail")),
+
+    # curl
+    # TESTDONE: 686 tests out of 686 reported OK: 100%
+    ("TESTDONE: ", r"TESTDONE: ([0-9]+) tests out of ([0-9]+) reported OK: ", True, count_testdone),
+
+    # gcc
+    # All 4 tests passed
+    # PASS: test-strtol-16.
+    (" tests passed", r"All ([0-9]+) tests passed", True, totals(("total_tests", "total_pass"))),
+    ("PASS: ", r"^PASS\: [A-Za-z]+", True, tally("counted_pass")),
+    ("FAIL: ", r"^FAIL\: [A-Za-z]+", True, tally("counted_fail")),
+
+    # gdbm
+    # All 22 tests were successful.
+    (" tests were successful", r"All ([0-9]+) tests were successful.", True, totals(("total_tests", "total_pass"))),
+
+    # glibc
+    # 3 FAIL
+    # 2182 PASS
+    # 1 UNRESOLVED
+    # 199 XFAIL
+    # 3 XPASS
+    (" FAIL", r"^\s*([0-9]+) FAIL$", True, totals("total_fail")),
+    (" PASS", r"^\s*([0-9]+) PASS$", True, totals("total_pass")),
+    (" XFAIL", r"^\s*([0-9]+) XFAIL$", True, totals("total_xfail")),
+    (" XPASS", r"^\s*([0-9]+) XPASS$", True, totals("total_pass")),
+
+    # libxml2
+    # Total 2908 tests, no errors
+    # Total: 1171 functions, 291083 tests, 0 errors
+    (" tests, no errors", r"Total ([0-9]+) tests, no errors", True, totals("total_pass")),
+    ("Total: ", r"Total: ([0-9]+) functions, ([0-9]+) tests, 0 errors", True, totals("total_pass")),
+
+    # zlib
+    # *** zlib shared test OK ***
+    (" test OK ***", r"\*\*\* .* test OK \*\*\*", True, tally("counted_pass")),
+
+    # e2fsprogs
+    # 153 tests succeeded     0 tests failed
+    (" tests succeeded", r"([0-9]+) tests succeeded\s*([0-9]+) tests failed", True, totals("total_pass", "total_fail")),
+
+    # expect
+    # all.tcl:        Total   29      Passed  29      Skipped 0       Failed  0
+    ("Skipped", r".*:\s*Total\s+([0-9]+)\s+Passed\s+([0-9]+)\s+Skipped\s+([0-9]+)\s+Failed\s+([0-9]+)", True,
+     totals("total_tests", "total_pass", "total_skip", "total_fail")),
+
+    # expat
+    # 100%: Checks: 50, Failed: 0
+    ("%: Checks: ", r"[0-9]+%: Checks: ([0-9]+), Failed: ([0-9]+)", True, count_checks_failed),
+
+    # flex
+    # Tests succeeded: 47
+    # Tests FAILED: 0
+    ("Tests succeeded: ", r"^Tests succeeded: ([0-9]+)", True, totals("total_pass")),
+    ("Tests FAILED: ", r"^Tests FAILED: ([0-9]+)", True, totals("total_fail")),
+
+    # this one catches the generic TAP format!
+    #  perl-Capture-tiny
+    # ok 580 - tee_merged|sys|stderr|short - got STDERR
+    ("ok ", r"^ok [0-9]+ \-", True, tally("counted_pass")),
+    ("not ok ", r"^not ok [0-9]+ \-", True, count_tap_not_ok),
+    ("ok ", r"^ok [0-9]+$", True, tally("counted_pass")),
+    ("not ok ", r"^not ok [0-9]+$", True, tally("counted_fail")),
+
+    # tcpdump
+    #    0 tests failed
+    # 154 tests passed
+    (" failed", r"^\s*([0-9]+) tests? failed$", True, totals("total_fail")),
+    (" passed", r"^\s*([0-9]+) tests? passed$", True, totals("total_pass")),
+
+    # R packages
+    # * checking top-level files ... OK
+    ("... OK", r"\* .* \.\.\. OK", True, tally("counted_pass")),
+    ("... PASSED", r"\* .* \.\.\. PASSED\.", True, tally("counted_pass")),
+    ("... SKIPPED", r"\* .* \.\.\. SKIPPED", True, tally("counted_skip")),
+
+    # python
+    # 365 tests OK.
+    # 22 tests skipped:
+    (" tests skipped:", r"^([0-9]+) tests skipped:$", True, totals("total_skip")),
+    (" tests OK", r"^([0-9]+) tests OK.$", True, totals("total_pass")),
+
+    # jemalloc
+    # Test suite summary: pass: 30/33, skip: 3/33, fail: 0/33
+    ("Test suite summary: ",
+     r"Test suite summary: pass: ([0-9]+)\/([0-9]+), skip: ([0-9]+)\/([0-9]+), fail: ([0-9]+)\/([0-9]+)", True,
+     totals("total_pass", "total_tests", "total_skip", None, "total_fail")),
+
+    # util-linux
+    #   All 160 tests PASSED
+    (" tests PASSED", r"  All ([0-9]+) tests PASSED$", True, totals("total_pass")),
+
+    # nss
+    # cert.sh: #101: Import chain-2-serverCA-ec CA -t u,u,u for localhost.localdomain (ext.)  - PASSED
+    # Passed:             13036
+    # Failed:             6
+    # Failed with core:   0
+    # Unknown status:     0
+    ("  - PASSED", r"^[a-z]+.sh: #[0-9]+: .*  - PASSED$", True, tally("counted_pass")),
+    ("  - FAILED", r"^[a-z]+.sh: #[0-9]+: .*  - FAILED$", True, tally("counted_fail")),
+    ("Passed:", r"^Passed:\s+([0-9]+)$", True, totals("total_pass")),
+    ("Failed:", r"^Failed:\s+([0-9]+)$", True, totals("total_fail")),
+    ("Failed with core:", r"^Failed with core:\s+([0-9]+)$", True, totals("total_fail")),
+
+    # rsync
+    #      34 passed
+    #      5 skipped
+    (" passed", r"^\s+([0-9]+) passed$", True, totals("total_pass")),
+    (" skipped", r"^\s+([0-9]+) skipped$", True, totals("total_skip")),
+
+    # mariadb
+    # 100% tests passed, 0 tests failed out of 53
+    (" tests failed out of ", r"tests passed, ([0-9]+) tests failed out of ([0-9]+)", True, count_failed_out_of),
+
+    # python-runtime-tests
+    # FAILED (KNOWNFAIL=6, SKIP=18, errors=6)
+    # FAILED (failures=1)
+    # FAILED (failures=1, errors=499, skipped=48)
+    # OK (KNOWNFAIL=5, SKIP=15)
+    ("FAILED (KNOWNFAIL=", r"FAILED \(KNOWNFAIL=([0-9]+), SKIP=([0-9]+), errors=([0-9]+)\)", True,
+     totals("total_xfail", "total_skip", "total_fail")),
+    ("FAILED (failures=", r"FAILED \(failures=([0-9]+), errors=([0-9]+), skipped=([0-9]+)\)", True,
+     totals("total_fail", "total_xfail", "total_skip")),
+    ("FAILED (failures=", r"FAILED \(failures=([0-9]+), errors=([0-9]+)\)", True, totals("total_fail", "total_xfail")),
+    ("FAILED (failures=", r"FAILED \(failures=([0-9]+)\)", True, totals("total_fail")),
+    ("FAILED (errors=", r"FAILED \(errors=([0-9]+)\)", True, totals("total_xfail")),
+    ("OK (KNOWNFAIL=", r"OK \(KNOWNFAIL=([0-9]+), SKIP=([0-9]+)\)", True, totals("total_xfail", "total_skip")),
+
+    # qpid-python
+    # Totals: 318 tests, 200 passed, 112 skipped, 0 ignored, 6 failed
+    ("Totals: ", r"Totals: ([0-9]+) tests, ([0-9]+) passed, ([0-9]+) skipped, ([0-9]+) ignored, ([0-9]+) failed", True,
+     totals("total_tests", "total_pass", "total_skip", "total_xfail", "total_fail")),
+
+    # PyYAML
+    # TESTS: 2577
+    ("TESTS: ", r"^TESTS: ([0-9]+)$", True, totals("total_tests")),
+
+    # sudo
+    # visudo: 7/7 tests passed; 0/7 tests failed
+    # check_symbols: 7 tests run, 0 errors, 100% success rate
+    (" tests passed; ", r"[a-z_]+\:\s+([0-9]+)\/[0-9]+ tests passed; ([0-9]+)\/[0-9]+ tests failed", True,
+     totals("total_pass", "total_fail")),
+    (" tests run, ", r"[a-z_]+\: ([0-9]+) tests run, ([0-9]+) errors", True, count_tests_run_errors),
+
+    # R
+    # running code in 'reg-examples1.R' ... OK
+    # Status: 1 ERROR, 1 WARNING, 4 NOTEs
+    # OK: 749 SKIPPED: 4 FAILED: 2
+    ("running code in '", r"running code in '.*\.R' \.\.. OK", True, tally("counted_pass")),
+    ("Status: ", r"Status: ([0-9]+) ERROR, ([0-9]+) WARNING, ([0-9]+) NOTEs", True, totals("total_fail")),
+    (" SKIPPED: ", r"OK: ([0-9]+) SKIPPED: ([0-9]+) FAILED: ([0-9]+)", True,
+     totals("total_pass", "total_skip", "total_fail")),
+
+    # onig
+    # OK: // 'a'
+    ("OK: ", r"^OK\: ", True, tally("counted_pass")),
+
+    # php
+    # Number of tests : 13526              9794
+    # Tests skipped   : 3732 ( 27.6%) --------
+    # Tests warned    :    0 (  0.0%) (  0.0%)
+    # Tests failed    :   12 (  0.1%) (  0.1%)
+    # Expected fail   :   31 (  0.2%) (  0.3%)
+    # Tests passed    : 9751 ( 72.1%) ( 99.6%)
+    ("Number of tests : ", r"^Number of tests : ([0-9]+)", True, totals("total_tests")),
+    ("Tests skipped   :", r"^Tests skipped   :\s+([0-9]+) \(", True, totals("total_skip")),
+    ("Tests failed    :", r"^Tests failed    :\s+([0-9]+) \(", True, totals("total_fail")),
+    ("Expected fail   :", r"^Expected fail   :\s+([0-9]+) \(", True, totals("total_xfail")),
+    ("Tests passed    :", r"^Tests passed    :\s+([0-9]+) \(", True, totals("total_pass")),
+
+    # rubygem / rake
+    # 174 runs, 469 assertions, 0 failures, 0 errors, 0 skips
+    (" runs, ", r"([0-9]+) runs, ([0-9]+) assertions, ([0-9]+) failures, ([0-9]+) errors, ([0-9]+) skips", True,
+     totals("total_tests", None, "total_fail", None, "total_skip")),
+
+    # cryptsetup
+    #  [OK]
+    (" [OK]", r" \[OK\]$", True, tally("counted_pass")),
+
+    # lzo
+    #  test passed.
+    (" test passed", r" test passed.$", True, tally("counted_pass")),
+
+    # lsof
+    # LTnlink ... OK
+    # LTnfs ... ERROR!!!
+    (" ... OK", r"^LT[a-zA-Z0-9]+ \.\.\. OK$", True, tally("counted_pass")),
+    (" ... ERROR!!!", r"^LT[a-zA-Z0-9]+ \.\.\. ERROR\!\!\!", True, tally("counted_fail")),
+
+    # libaio
+    # Pass: 11  Fail: 1
+    ("  Fail: ", r"^Pass: ([0-9]+)  Fail: ([0-9]+)$", True, totals("total_pass", "total_fail")),
+
+    # gawk
+    ("ALL TESTS PASSED", r"^ALL TESTS PASSED$", True, tally("total_pass")),
+
+    # gptfdisk
+    # **SUCCESS** ...
+    ("**SUCCESS**", r"^\*\*SUCCESS\*\*", True, tally("counted_pass")),
+
+    # boost
+    # **passed** ...
+    # 8 errors detected.
+    ("**passed**", r"^\*\*passed\*\*", True, tally("counted_pass")),
+    (" detected", r"([0-9]+) errors? detected\.?", True, totals("total_fail")),
+    (" detected", r"([0-9]+) failures? detected\.?", True, totals("total_fail")),
+
+    # make
+    # 534 Tests in 118 Categories Complete ... No Failures
+    (" Categories Complete ", r"([0-9]+) Tests in ([0-9]+) Categories Complete ... No Failures", True,
+     totals(("total_tests", "total_pass"))),
+
+    # icu4c ---[OK]
+    ("---[OK]", r"---\[OK\]", True, tally("counted_pass")),
+
+    # libxslt
+    # Pass 1
+    ("Pass ", r"^Pass [0-9]+$", True, tally("counted_pass")),
+
+    # bash
+    # < Failed 126 of 1378 Unicode tests
+    (" Failed ", r"^[<,>] Failed ([0-9]+) of ([0-9]+)", True, totals("total_fail", "total_tests")),
+
+    # crudini
+    # Test 95 OK (line 460)
+    ("Test ", r"^Test [0-9]+ OK", True, tally("counted_pass")),
+    ("Test ", r"^Test [0-9]+ (?!^OK)[A-Z]+", True, tally("counted_fail")),
+
+    # discount
+    # Reddit-style automatic links ......................... OK
+    ("... ", r"[A-Za-z\-\s]+ \.\.\.+ (OK|GOOD)$", True, tally("counted_pass")),
+    ("... ", r"[A-Za-z\-\s]+ \.\.\.+ (?!^OK)[A-Z]+$", True, tally("counted_fail")),
+
+    # libjpeg-turbo
+    # JPEG -> RGB Top-Down  2/1 ... Passed.
+    # JPEG -> RGB Top-Down  15/8 ... Passed.
+    # JPEG -> RGB Top-Down  7/4 ... Passed.
+    (" ... Passed", r"[A-Za-z0-9\ \>\<\/]+ \.\.\. Passed\.", True, tally("counted_pass")),
+
+    # LVM2
+    # valgrind pool awareness ... fail
+    # dfa matching ... fail
+    # dfa with non-print regex chars ... pass
+    # bitset iteration ... pass
+    (" ... pass", r"[a-z\ ]+\ \.\.\.\ pass", True, tally("counted_pass")),
+    (" ... fail", r"[a-z\ ]+\ \.\.\.\ fail", True, tally("counted_fail")),
+
+    # openblas
+    #  Real BLAS Test Program Results
+    #  Test of subprogram number  1             SDOT
+    #                                     ----- PASS -----
+    #  Test of subprogram number  2            SAXPY
+    #                                     ----- PASS -----
+    ("--- PASS ---", r"\ \ +\-\-\-+\ PASS\ \-\-\-+", True, tally("counted_pass")),
+    ("--- FAIL ---", r"\ \ +\-\-\-+\ FAIL\ \-\-\-+", True, tally("counted_fail")),
+
+    # rubygem-hashie
+    # Finished in 0.07221 seconds (files took 0.28356 seconds to load)
+    # 545 examples, 0 failures, 1 pending
+    (" pending", r"([0-9]+) examples?, ([0-9]+) failures?, ([0-9]+) pending", True,
+     totals("total_pass", "total_fail", "total_skip")),
+
+    # rubygem-warden
+    # Finished in 0.08928 seconds (files took 0.1046 seconds to load)
+    # 215 examples, 14 failures
+    (" example", r"([0-9]+) examples?, ([0-9]+) failures?", True, totals("total_pass", "total_fail")),
+
+    # rubygem-ansi
+    # Executed 12 tests with 7 passing, 5 errors.
+    (" passing, ", r"Executed ([0-9]+) tests with ([0-9+]) passing, ([0-9]+) errors\.", True,
+     totals("total_tests", "total_pass", "total_fail")),
+
+    # vim
+    # Executed 9 tests
+    ("Executed ", r"Executed ([0-9]+) tests$", True, totals("total_tests")),
+
+    # rubygem-formatador
+    #   9 succeeded in 0.00375661 seconds
+    (" succeeded in ", r"([0-9]+) succeeded in [0-9]+\.[0-9]+ seconds", True, totals("total_pass")),
+
+    # ./pigz -kf pigz.c ; ./pigz -t pigz.c.gz
+    # ./pigz -kfb 32 pigz.c ; ./pigz -t pigz.c.gz
+    ("./pigz", r".*\.\/pigz.+(\.\/pigz).+", True, tally("total_pass", amount=2)),
+    ("./pigz", r".*\.\/pigz.+", True, tally("total_pass")),
+
+    # netifaces
+    # Interface lo:
+    # Interface enp2s0:
+    ("Interface ", r"^Interface [a-zA-Z0-9]+\:", True, tally("total_pass")),
+
+    # btrfs-progs
+    # [TEST]   001-bad-file-extent-bytenr
+    # [NOTRUN] Need to validate root privileges
+    # test failed for case
+    ("    [TEST]   ", r"    \[TEST\]   .*", True, tally("total_pass")),
+    ("test failed for case", r"test failed for case.*", True, count_failed_case),
+    ("    [NOTRUN] ", r"    \[NOTRUN\] .*", True, tally("total_skip")),
+
+    # chrpath
+    # success: chrpath changed rpath to larger path.
+    # error: chrpath unable to change rpath to larger path.
+    ("success: chrpath ", r"success\: chrpath .*", True, tally("total_pass")),
+    ("error: chrpath ", r"error: chrpath .*", True, tally("total_fail")),
+    ("warning: chrpath ", r"warning: chrpath .*", True, tally("total_fail")),
+
+    # yajl
+    # 58/58 tests successful
+    (" tests successful", r"([0-9]+)\/([0-9]+) tests successful", True, totals("total_pass", "total_tests")),
+
+    # xmlsec1
+    #     Checking required transforms                            OK
+    #     Verify existing signature                             Fail
+    #     Checking required transforms                          Skip
+    #     Checking required key data                               OK
+    (" OK", r"^    [\w ]+\ +OK$", True, tally("total_pass")),
+    (" Fail", r"^    [\w ]+\ +Fail$", True, tally("total_fail")),
+    (" Skip", r"^    [\w ]+\ +Skip$", True, tally("total_skip")),
+
+    # xdg-utils
+    # TOTAL: 4 tests failed, 90 of 116 tests passed. (140 attempted)
+    ("TOTAL: ", r"TOTAL\: ([0-9]+) tests? failed\, ([0-9]+) of [0-9]+ tests? passed\. \(([0-9]+) attempted\)", True,
+     count_attempted),
+
+    # slang
+    # Testing argv processing ...Ok
+    # ./utf8.sl:14:check_sprintf:Test Error
+    ("...Ok", r"^Testing [\w ]+\.\.\.Ok$", True, tally("total_pass")),
+    (":Test Error", r":Test Error", True, tally("total_fail")),
+
+    # go & golang
+    # ok  	golang.org/x/text/encoding/htmlindex	0.002s
+    # --- FAIL: TestParents (0.00s)
+    # FAIL	golang.org/x/text/internal	0.002s
+    # --- PASS: TestApp_Command (0.00s)
+    ("ok", r"^ok\s+[\w_]+[A-Za-z0-9\.\?_\-]*", True, tally("total_tests", "total_pass")),
+    ("FAIL", r"(---\s+)?(?<!X)FAIL:?\s*", True, tally("total_tests", "total_fail")),
+    ("PASS", r"---\s+PASS|PASS\s+ ", True, tally("total_tests", "total_pass")),
+
+    # valgrind
+    # == 5 tests, 0 stderr failures, 1 stdout failure, 0 stderrB failures, 0 stdoutB failures, 0 post failures ==
+    # == 55 tests, 48 stderr failures, 6 stdout failures, 0 stderrB failures, 0 stdoutB failures, 0 post failures ==
+    (" stderr failure", r"\=\= ([0-9]+) tests?\, ([0-9]+) stderr failures?\, ([0-9]+) stdout failures?\, "
+     r"([0-9]+) stderrB failures?\, ([0-9]+) stdoutB failures?\, ([0-9]+) post failures? \=\=", True, count_valgrind),
+
+    # zsh
+    # **************************************
+    # 46 successful test scripts, 0 failures, 1 skipped
+    # **************************************
+    (" successful test scripts, ", r"([0-9]+) successful test scripts\, ([0-9]+) failures\, ([0-9]+) skipped", True,
+     totals("total_pass", "total_fail", "total_skip")),
+
+    # glog
+    # Passed 3 tests
+    ("Passed ", r"Passed ([0-9]+) tests", True, totals("total_pass")),
+
+    # hdf5
+    # Testing h5repack h5repack_szip.h5 -f dset_szip:GZIP=1                  -SKIP-
+    # Verifying h5dump output -f GZIP=1 -m 1024                             *FAILED*
+    # Testing h5repack --metadata_block_size=8192                            PASSED
+    # Verifying h5diff output h5repack_layout.h5 out-meta_long.h5repack_layo PASSED
+    ("PASSED", r"^Testing .+\ +PASSED$", True, tally("total_pass")),
+    ("PASSED", r"^Verifying .+\ +PASSED$", True, tally("total_pass")),
+    ("-SKIP-", r"^Testing .+\ +\-SKIP\-$", True, tally("total_skip")),
+    ("-SKIP-", r"^Verifying .+\ +\-SKIP\-$", True, tally("total_skip")),
+
+    # libconfig
+    # 3 tests; 3 passed, 0 failed
+    (" tests; ", r"^([0-9]+) tests; ([0-9]+) passed\, ([0-9]+) failed", True, set_tests_passed_failed),
+
+    # libogg
+    # testing page spill expansion... 0, (0),  granule:0 1, (1),  granule:4103 2, (2),  granule:5127 ok.
+    # Testing search for capture... ok.
+    # Testing recapture... ok.
+    (" ok.", r"^[T,t]esting .*\ ok\.$", True, tally("counted_pass")),
+
+    # libvorbis
+    #     vorbis_1ch_q-0.5_44100.ogg : ok
+    #     vorbis_2ch_q-0.5_44100.ogg : ok
+    (".ogg : ok", r"^\ \ \ \ vorbis_.*\.ogg\ \:\ ok$", True, tally("counted_pass")),
+
+    # pth
+    # OK - ALL TESTS SUCCESSFULLY PASSED.
+    ("OK - ALL TESTS SUCCESSFULLY PASSED.", r"^OK\ \-\ ALL\ TESTS\ SUCCESSFULLY\ PASSED\.$", True, tally("counted_pass")),
+]
+
+compiled_rules = [(literal, re.compile(pattern), check_only, action)
+                  for literal, pattern, check_only, action in parse_rules]
+rules_outside_check = [rule for rule in compiled_rules if not rule[2]]
+
+# A line containing none of these can't match any rule
+any_literal = re.compile("|".join(re.escape(literal) for literal in set(rule[0] for rule in compiled_rules)))
+any_literal_outside_check = re.compile("|".join(re.escape(literal) for literal in set(rule[0] for rule in rules_outside_check)))
+
+zero_lines = ["Executing(%check)",
+              "+ make check",
+              "##### Testing packages."]
+
+package_line = re.compile(r"CLR-XTEST: Package: (.*)")
+
+
+class TestLogCounter(object):
+    """Test result counts parsed from test logs, per package."""
+
+    def __init__(self, name=''):
+        """Start counting tests for package name."""
+        self.name = name
+        self.testcount = {}
+        self.testpass = {}
+        self.testfail = {}
+        self.testxfail = {}
+        self.testskip = {}
+        self.counts = dict.fromkeys(count_fields, 0)
+        self.incheck = False
+        self.in_meson = False
+
+    def zero_test_data(self):
+        """Zero test results."""
+        self.counts = dict.fromkeys(count_fields, 0)
+
+    def sanitize_counts(self):
+        """Validate test counts are within sane bounds."""
+        c = self.counts
+        if c["total_tests"] > 0 and c["total_pass"] == 0:
+            c["total_pass"] = c["total_tests"] - c["total_fail"] - c["total_skip"] - c["total_xfail"]
+
+        if c["total_tests"] < c["total_pass"] and c["total_pass"] > 0:
+            c["total_tests"] = c["total_pass"] + c["total_fail"] + c["total_skip"] + c["total_xfail"]
+
+        if c["counted_tests"] > 0 and c["counted_pass"] == 0:
+            c["counted_pass"] = c["counted_tests"] - c["counted_fail"] - c["counted_skip"] - c["counted_xfail"]
+
+        if c["counted_tests"] < c["counted_pass"] and c["counted_pass"] > 0:
+            c["counted_tests"] = c["counted_pass"] + c["counted_fail"] + c["counted_skip"] + c["counted_xfail"]
+
+        summed = c["total_pass"] + c["total_fail"] + c["total_skip"] + c["total_xfail"]
+        if summed < c["total_tests"]:
+            c["total_pass"] += c["total_tests"] - summed
+
+        summed = c["total_pass"] + c["total_fail"] + c["total_skip"] + c["total_xfail"]
+        if summed > c["total_tests"]:
+            c["total_tests"] = summed
+
+    def collect_output(self):
+        """Sum test results."""
+        for results in (self.testcount, self.testpass, self.testfail, self.testxfail, self.testskip):
+            results.setdefault(self.name, 0)
+
+        c = self.counts
+        prefix = "counted" if c["counted_tests"] > c["total_tests"] else "total"
+        self.testcount[self.name] += c[prefix + "_tests"]
+        self.testpass[self.name] += c[prefix + "_pass"]
+        self.testfail[self.name] += c[prefix + "_fail"]
+        self.testxfail[self.name] += c[prefix + "_xfail"]
+        self.testskip[self.name] += c[prefix + "_skip"]
+
+        self.zero_test_data()
+
+    def parse_meson_line(self, line):
+        """Parse a line of the summary of meson tests."""
+        c = self.counts
         lsplit = line.rstrip().split()
         if len(lsplit) == 2:
             val = lsplit[-1]
             if re.search(r'^ok:', line, flags=re.I):
-                total_pass += convert_int(val)
+                c["total_pass"] += convert_int(val)
             elif re.search(r'^fail:', line, flags=re.I):
-                total_fail += convert_int(val)
+                c["total_fail"] += convert_int(val)
             elif re.search(r'^skip(ped)?:', line, flags=re.I):
-                total_skip += convert_int(val)
+                c["total_skip"] += convert_int(val)
             elif re.search(r'^timeout:', line, flags=re.I):
                 # Count timeouts as failures.
-                total_fail += convert_int(val)
+                c["total_fail"] += convert_int(val)
         elif len(lsplit) == 3:
             val = lsplit[-1]
             if re.search(r'^expected fail:', line, flags=re.I):
-                total_xfail += convert_int(val)
-        else:
-            continue
-
-
-def parse_log(log, pkgname=''):
-    """Parse output of test logs."""
-    global total_tests
-    global total_pass
-    global total_fail
-    global total_xfail
-    global total_skip
-    global counted_tests
-    global counted_pass
-    global counted_fail
-    global counted_xfail
-    global counted_skip
-    global name
-
-    name = pkgname
-    incheck = False
-    with util.open_auto(log, 'r') as logf:
-        lines = logf.readlines()
-
-    zero_lines = ["Executing(%check)",
-                  "+ make check",
-                  "##### Testing packages."]
-
-    for idx, line in enumerate(lines):
+                c["total_xfail"] += convert_int(val)
+
+    def parse_line(self, line):
+        """Count the test results reported by a log line."""
+        if self.in_meson:
+            # meson prints its summary last, nothing else is counted
+            self.parse_meson_line(line)
+            return
+        raw_line = line
         line = line.rstrip()
 
         for zline in zero_lines:
             if zline in line:
-                if incheck:
-                    zero_test_data()
+                if self.incheck:
+                    self.zero_test_data()
                 else:
-                    incheck = True
+                    self.incheck = True
 
         if "meson test" in line:
-            zero_test_data()
-            parse_meson_test(lines[idx:])
-            break
-
-        match = re.search(r"CLR-XTEST: Package: (.*)", line)
-        if match:
-            name = match.group(1)
-            sanitize_counts()
-            collect_output()
-
-        # ACL package
-        # [22] $ rm -Rf d -- ok-
-        # 17 commands (17 passed, 0 failed)-
-        if re.search(r"\[[0-9]+\].*\-\- ok", line):
-            counted_pass += 1
-            continue
-
-        match = re.search(r"[0-9]+ commands \(([0-9]+) passed, ([0-9]+) failed\)", line)
-        if match:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            continue
-
-        # alembic package
-        # Ran 678 tests in 5.175s
-        # OK (SKIP=15)
-        match = re.search("Ran ([0-9]+) tests? in", line)
-        if match:
-            total_tests += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"OK \(SKIP=([0-9]+)\)", line)
-        if match:
-            total_skip += convert_int(match.group(1))
-            continue
+            self.zero_test_data()
+            self.in_meson = True
+            self.parse_meson_line(raw_line)
+            return
+
+        if "CLR-XTEST: Package: " in line:
+            self.name = package_line.search(line).group(1)
+            self.sanitize_counts()
+            self.collect_output()
+
+        if self.incheck:
+            rules, prefilter = compiled_rules, any_literal
         else:
-            match = re.search(r"OK \(skipped=([0-9]+)\)", line)
-            if match:
-                total_skip += convert_int(match.group(1))
-                continue
-
-        # anyjson
-        # test_implementations.test_default_serialization ... ok
-        # note: configure false positive
-        if re.search(r"\.\.\. ok$", line) and incheck:
-            counted_pass += 1
-            continue
-
-        if re.search(r"\.\.\. skipped$", line) and incheck:
-            counted_skip += 1
-            continue
-
-        # apr
-        # testatomic          :  SUCCESS
-        if re.search(r":  SUCCESS$", line) and incheck:
-            counted_pass += 1
-            continue
-
-        # for packages using pytest...
-        match = re.search(r"== .*[0-9]+ x?(?:failed|passed|skipped|warnings|pytest-warnings|error) in [0-9.]+(?:s| seconds)", line)
-        if match and incheck:
-            parts = line.split(",")
-            for part in parts:
-                if (m := re.search(r"([0-9]+) failed", part)):
-                    total_fail += convert_int(m.group(1))
-                elif (m := re.search(r"([0-9]+) passed", part)):
-                    total_pass += convert_int(m.group(1))
-                elif (m := re.search(r"([0-9]+) skipped", part)):
-                    total_skip += convert_int(m.group(1))
-                elif (m := re.search(r"([0-9]+) xfailed", part)):
-                    total_xfail += convert_int(m.group(1))
-                elif (m := re.search(r"([0-9]+) xpassed", part)):
-                    total_pass += convert_int(m.group(1))
-                elif (m := re.search(r"([0-9]+) pytest-warnings", part)):
-                    # FIXME: should "pytest-warnings" count toward the test total
-                    # and fail count? They are ignored at the moment...
-                    pass
-                elif (m := re.search(r"([0-9]+) warnings", part)):
-                    total_fail += convert_int(m.group(1))
-                elif (m := re.search(r"([0-9]+) error", part)):
-                    total_fail += convert_int(m.group(1))
-            continue
-
-        # mercurial
-        # running 59 tests using 8 parallel processes
-        # # Ran 55 tests, 4 skipped, 0 failed.
-        match = re.search(r"^# Ran ([0-9]+) tests\, ([0-9]+) skipped\, ([0-9]+) failed.", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(3))
-            total_skip += convert_int(match.group(2))
-            total_pass += (convert_int(match.group(1)) - convert_int(match.group(2)) - convert_int(match.group(3)))
-            continue
-
-        # augeas
-        # TOTAL: 215
-        # PASS:  212
-        # SKIP:  3
-        # XFAIL: 0
-        # FAIL:  0
-        # XPASS: 0
-        # ERROR: 0
-        match = re.search(r"# TOTAL: +([0-9]+)", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"# PASS: +([0-9]+)", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"# SKIP: +([0-9]+)", line)
-        if match and incheck:
-            total_skip += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"# FAIL: +([0-9]+)", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"# XFAIL: +([0-9]+)", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"# XPASS: +([0-9]+)", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # autoconf
-        # 493 tests behaved as expected.
-        # 10 tests were skipped.
-        # 495: AC_FUNC_STRNLEN                                 ok
-        # 344: Erlang                                          skipped (erlang.at:30)
-        # 26: autoupdating macros recursively                 expected failure (tools.at:945)
-        match = re.search(r"^([0-9]+) tests behaved as expected", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^([0-9]+) tests were skipped", line)
-        if match and incheck:
-            total_skip += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^[0-9]+\:.*ok$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"^[0-9]+\:.*skipped \(", line)
-        if match and incheck:
-            counted_skip += 1
-            continue
-
-        match = re.search(r"^[0-9]+\:.*expected failure \(", line)
-        if match and incheck:
-            counted_xfail += 1
-            continue
-
-        # bison
-        # 470 tests were successful.
-        match = re.search(r"^([0-9]+) tests were successful", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # binutils
-        # of expected passes            1144
-        # of expected failures          57
-        # of untested testcases         1
-        # of unsupported tests          12
-        match = re.search(r"^# of expected passes.*\t([0-9]+)", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^# of expected failures.*\t([0-9]+)", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^# of unexpected failures.*\t([0-9]+)", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^# of unsupported tests.*\t([0-9]+)", line)
-        if match and incheck:
-            total_skip += convert_int(match.group(1))
-            continue
-
-        # ccache
-        # PASSED: 448 assertions, 88 tests, 10 suites
-        match = re.search(r"PASSED: [0-9]+ assertions, ([0-9]+) tests, [0-9]+ suites", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # rubygem-rack
-        # 701 tests, 2292 assertions, 0 failures, 0 errors
-        match = re.search(r"([0-9]+) tests, [0-9]+ assertions, ([0-9]+) failures, ([0-9])+ errors", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            total_fail += convert_int(match.group(3))
-            continue
-
-        # curl
-        # TESTDONE: 686 tests out of 686 reported OK: 100%
-        match = re.search(r"TESTDONE: ([0-9]+) tests out of ([0-9]+) reported OK: ", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(2))
-            total_pass += convert_int(match.group(1))
-            total_fail = convert_int(match.group(2)) - convert_int(match.group(1))
-            continue
-
-        # gcc
-        # All 4 tests passed
-        # PASS: test-strtol-16.
-        match = re.search(r"All ([0-9]+) tests passed", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^PASS\: [A-Za-z]+", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"^FAIL\: [A-Za-z]+", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        # gdbm
-        # All 22 tests were successful.
-        match = re.search(r"All ([0-9]+) tests were successful.", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # glibc
-        # 3 FAIL
-        # 2182 PASS
-        # 1 UNRESOLVED
-        # 199 XFAIL
-        # 3 XPASS
-        match = re.search(r"^\s*([0-9]+) FAIL$", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^\s*([0-9]+) PASS$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^\s*([0-9]+) XFAIL$", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^\s*([0-9]+) XPASS$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # libxml2
-        # Total 2908 tests, no errors
-        # Total: 1171 functions, 291083 tests, 0 errors
-        match = re.search(r"Total ([0-9]+) tests, no errors", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"Total: ([0-9]+) functions, ([0-9]+) tests, 0 errors", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # zlib
-        # *** zlib shared test OK ***
-        match = re.search(r"\*\*\* .* test OK \*\*\*", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        # e2fsprogs
-        # 153 tests succeeded     0 tests failed
-        match = re.search(r"([0-9]+) tests succeeded\s*([0-9]+) tests failed", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            continue
-
-        # expect
-        # all.tcl:        Total   29      Passed  29      Skipped 0       Failed  0
-        match = re.search(r".*:\s*Total\s+([0-9]+)\s+Passed\s+([0-9]+)\s+Skipped\s+([0-9]+)\s+Failed\s+([0-9]+)", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_pass += convert_int(match.group(2))
-            total_skip += convert_int(match.group(3))
-            total_fail += convert_int(match.group(4))
-            continue
-
-        # expat
-        # 100%: Checks: 50, Failed: 0
-        match = re.search(r"[0-9]+%: Checks: ([0-9]+), Failed: ([0-9]+)", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1)) - convert_int(match.group(2))
-            total_fail += convert_int(match.group(2))
-            continue
-
-        # flex
-        # Tests succeeded: 47
-        # Tests FAILED: 0
-        match = re.search(r"^Tests succeeded: ([0-9]+)", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^Tests FAILED: ([0-9]+)", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        # this one catches the generic TAP format!
-        #  perl-Capture-tiny
-        # ok 580 - tee_merged|sys|stderr|short - got STDERR
-        match = re.search(r"^ok [0-9]+ \-", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"^not ok [0-9]+ \-", line)
-        if match and incheck:
-            if re.search(r"# TODO\b", line):
-                counted_xfail += 1
-            else:
-                counted_fail += 1
-
-            continue
-
-        match = re.search(r"^ok [0-9]+$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"^not ok [0-9]+$", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        # tcpdump
-        #    0 tests failed
-        # 154 tests passed
-        match = re.search(r"^\s*([0-9]+) tests? failed$", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^\s*([0-9]+) tests? passed$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # R packages
-        # * checking top-level files ... OK
-        match = re.search(r"\* .* \.\.\. OK", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"\* .* \.\.\. PASSED\.", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"\* .* \.\.\. SKIPPED", line)
-        if match and incheck:
-            counted_skip += 1
-            continue
-
-        # python
-        # 365 tests OK.
-        # 22 tests skipped:
-        match = re.search(r"^([0-9]+) tests skipped:$", line)
-        if match and incheck:
-            total_skip += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^([0-9]+) tests OK.$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # jemalloc
-        # Test suite summary: pass: 30/33, skip: 3/33, fail: 0/33
-        match = re.search(r"Test suite summary: pass: ([0-9]+)\/([0-9]+), skip: ([0-9]+)\/([0-9]+), fail: ([0-9]+)\/([0-9]+)", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_tests += convert_int(match.group(2))
-            total_skip += convert_int(match.group(3))
-            total_fail += convert_int(match.group(5))
-            continue
-
-        # util-linux
-        #   All 160 tests PASSED
-        match = re.search(r"  All ([0-9]+) tests PASSED$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # nss
-        # cert.sh: #101: Import chain-2-serverCA-ec CA -t u,u,u for localhost.localdomain (ext.)  - PASSED
-        # Passed:             13036
-        # Failed:             6
-        # Failed with core:   0
-        # Unknown status:     0
-        match = re.search(r"^[a-z]+.sh: #[0-9]+: .*  - PASSED$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"^[a-z]+.sh: #[0-9]+: .*  - FAILED$", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        match = re.search(r"^Passed:\s+([0-9]+)$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^Failed:\s+([0-9]+)$", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^Failed with core:\s+([0-9]+)$", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        # rsync
-        #      34 passed
-        #      5 skipped
-        match = re.search(r"^\s+([0-9]+) passed$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^\s+([0-9]+) skipped$", line)
-        if match and incheck:
-            total_skip += convert_int(match.group(1))
-            continue
-
-        # mariadb
-        # 100% tests passed, 0 tests failed out of 53
-        match = re.search(r"tests passed, ([0-9]+) tests failed out of ([0-9]+)", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            total_tests += convert_int(match.group(2))
-            total_pass += convert_int(match.group(2)) - convert_int(match.group(1))
-            continue
+            rules, prefilter = rules_outside_check, any_literal_outside_check
+        if not prefilter.search(line):
+            return
+        for literal, pattern, _, action in rules:
+            if literal in line:
+                match = pattern.search(line)
+                if match:
+                    action(self.counts, match)
+                    return
+
+    def parse_log(self, log):
+        """Parse output of test logs."""
+        self.incheck = False
+        self.in_meson = False
+        with util.open_auto(log, 'r') as logf:
+            for line in logf:
+                self.parse_line(line)
+        self.finish()
+        return self.string_out()
+
+    def finish(self):
+        """Add the counts of the end of the log to the results."""
+        self.sanitize_counts()
+        self.collect_output()
+
+    def results(self):
+        """Return (name, total, pass, fail, skip, xfail) for every package counted, sorted by name."""
+        return [(key, self.testcount[key], self.testpass[key], self.testfail[key], self.testskip[key], self.testxfail[key])
+                for key in sorted(self.testcount)]
+
+    def string_out(self):
+        """Output test result counts."""
+        retstr = ""
+        for result in self.results():
+            # the name may be an empty string, which is fine since this is
+            # handled by the calling module
+            retstr += "{},{},{},{},{},{}\n".format(*result)
+
+        return retstr.strip()  # strip trailing newline
 
-        # python-runtime-tests
-        # FAILED (KNOWNFAIL=6, SKIP=18, errors=6)
-        # FAILED (failures=1)
-        # FAILED (failures=1, errors=499, skipped=48)
-        # OK (KNOWNFAIL=5, SKIP=15)
-        match = re.search(r"FAILED \(KNOWNFAIL=([0-9]+), SKIP=([0-9]+), errors=([0-9]+)\)", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(1))
-            total_skip += convert_int(match.group(2))
-            total_fail += convert_int(match.group(3))
-            continue
-
-        match = re.search(r"FAILED \(failures=([0-9]+), errors=([0-9]+), skipped=([0-9]+)\)", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(2))
-            total_skip += convert_int(match.group(3))
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"FAILED \(failures=([0-9]+), errors=([0-9]+)\)", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(2))
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"FAILED \(failures=([0-9]+)\)", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"FAILED \(errors=([0-9]+)\)", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"OK \(KNOWNFAIL=([0-9]+), SKIP=([0-9]+)\)", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(1))
-            total_skip += convert_int(match.group(2))
-            continue
-
-        # qpid-python
-        # Totals: 318 tests, 200 passed, 112 skipped, 0 ignored, 6 failed
-        match = re.search(r"Totals: ([0-9]+) tests, ([0-9]+) passed, ([0-9]+) skipped, ([0-9]+) ignored, ([0-9]+) failed", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_pass += convert_int(match.group(2))
-            total_skip += convert_int(match.group(3))
-            total_xfail += convert_int(match.group(4))
-            total_fail += convert_int(match.group(5))
-            continue
-
-        # PyYAML
-        # TESTS: 2577
-        match = re.search(r"^TESTS: ([0-9]+)$", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            continue
-
-        # sudo
-        # visudo: 7/7 tests passed; 0/7 tests failed
-        # check_symbols: 7 tests run, 0 errors, 100% success rate
-        match = re.search(r"[a-z_]+\:\s+([0-9]+)\/[0-9]+ tests passed; ([0-9]+)\/[0-9]+ tests failed", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            continue
-
-        match = re.search(r"[a-z_]+\: ([0-9]+) tests run, ([0-9]+) errors", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            total_pass += convert_int(match.group(1)) - convert_int(match.group(2))
-            continue
-
-        # R
-        # running code in 'reg-examples1.R' ... OK
-        # Status: 1 ERROR, 1 WARNING, 4 NOTEs
-        # OK: 749 SKIPPED: 4 FAILED: 2
-        match = re.search(r"running code in '.*\.R' \.\.. OK", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"Status: ([0-9]+) ERROR, ([0-9]+) WARNING, ([0-9]+) NOTEs", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"OK: ([0-9]+) SKIPPED: ([0-9]+) FAILED: ([0-9]+)", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(3))
-            total_skip += convert_int(match.group(2))
-            continue
-
-        # onig
-        # OK: // 'a'
-        match = re.search(r"^OK\: ", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        # php
-        # Number of tests : 13526              9794
-        # Tests skipped   : 3732 ( 27.6%) --------
-        # Tests warned    :    0 (  0.0%) (  0.0%)
-        # Tests failed    :   12 (  0.1%) (  0.1%)
-        # Expected fail   :   31 (  0.2%) (  0.3%)
-        # Tests passed    : 9751 ( 72.1%) ( 99.6%)
-        match = re.search(r"^Number of tests : ([0-9]+)", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^Tests skipped   :\s+([0-9]+) \(", line)
-        if match and incheck:
-            total_skip += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^Tests failed    :\s+([0-9]+) \(", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^Expected fail   :\s+([0-9]+) \(", line)
-        if match and incheck:
-            total_xfail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"^Tests passed    :\s+([0-9]+) \(", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # rubygem / rake
-        # 174 runs, 469 assertions, 0 failures, 0 errors, 0 skips
-        match = re.search(r"([0-9]+) runs, ([0-9]+) assertions, ([0-9]+) failures, ([0-9]+) errors, ([0-9]+) skips", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_fail += convert_int(match.group(3))
-            total_skip += convert_int(match.group(5))
-            continue
-
-        # cryptsetup
-        #  [OK]
-        if re.search(r" \[OK\]$", line) and incheck:
-            counted_pass += 1
-            continue
-
-        # lzo
-        #  test passed.
-        match = re.search(r" test passed.$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        # lsof
-        # LTnlink ... OK
-        # LTnfs ... ERROR!!!
-        match = re.search(r"^LT[a-zA-Z0-9]+ \.\.\. OK$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"^LT[a-zA-Z0-9]+ \.\.\. ERROR\!\!\!", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        # libaio
-        # Pass: 11  Fail: 1
-        match = re.search(r"^Pass: ([0-9]+)  Fail: ([0-9]+)$", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            continue
-
-        # gawk
-        match = re.search(r"^ALL TESTS PASSED$", line)
-        if match and incheck:
-            total_pass += 1
-            continue
-
-        # gptfdisk
-        # **SUCCESS** ...
-        match = re.search(r"^\*\*SUCCESS\*\*", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        # boost
-        # **passed** ...
-        # 8 errors detected.
-        match = re.search(r"^\*\*passed\*\*", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"([0-9]+) errors? detected\.?", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        match = re.search(r"([0-9]+) failures? detected\.?", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            continue
-
-        # make
-        # 534 Tests in 118 Categories Complete ... No Failures
-        match = re.search(r"([0-9]+) Tests in ([0-9]+) Categories Complete ... No Failures", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # icu4c ---[OK]
-        match = re.search(r"---\[OK\]", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        # libxslt
-        # Pass 1
-        match = re.search(r"^Pass [0-9]+$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        # bash
-        # < Failed 126 of 1378 Unicode tests
-        match = re.search(r"^[<,>] Failed ([0-9]+) of ([0-9]+)", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            total_tests += convert_int(match.group(2))
-            continue
-
-        # crudini
-        # Test 95 OK (line 460)
-        match = re.search(r"^Test [0-9]+ OK", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"^Test [0-9]+ (?!^OK)[A-Z]+", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        # discount
-        # Reddit-style automatic links ......................... OK
-        match = re.search(r"[A-Za-z\-\s]+ \.\.\.+ (OK|GOOD)$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"[A-Za-z\-\s]+ \.\.\.+ (?!^OK)[A-Z]+$", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        # libjpeg-turbo
-        # JPEG -> RGB Top-Down  2/1 ... Passed.
-        # JPEG -> RGB Top-Down  15/8 ... Passed.
-        # JPEG -> RGB Top-Down  7/4 ... Passed.
-        match = re.search(r"[A-Za-z0-9\ \>\<\/]+ \.\.\. Passed\.", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        # LVM2
-        # valgrind pool awareness ... fail
-        # dfa matching ... fail
-        # dfa matching ... fail
-        # dfa with non-print regex chars ... pass
-        # bitset iteration ... pass
-        # valgrind pool awareness ... fail
-        # dfa matching ... fail
-        # dfa matching ... fail
-        # dfa with non-print regex chars ... fail
-        # bitset iteration ... fail
-        match = re.search(r"[a-z\ ]+\ \.\.\.\ pass", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"[a-z\ ]+\ \.\.\.\ fail", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        # openblas
-        #  Real BLAS Test Program Results
-        #  Test of subprogram number  1             SDOT
-        #                                     ----- PASS -----
-        #  Test of subprogram number  2            SAXPY
-        #                                     ----- PASS -----
-        #  Test of subprogram number  3            SROTG
-        #                                     ----- PASS -----
-        match = re.search(r"\ \ +\-\-\-+\ PASS\ \-\-\-+", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
-
-        match = re.search(r"\ \ +\-\-\-+\ FAIL\ \-\-\-+", line)
-        if match and incheck:
-            counted_fail += 1
-            continue
-
-        # rubygem-hashie
-        # Finished in 0.07221 seconds (files took 0.28356 seconds to load)
-        # 545 examples, 0 failures, 1 pending
-        match = re.search(r"([0-9]+) examples?, ([0-9]+) failures?, ([0-9]+) pending", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            total_skip += convert_int(match.group(3))
-            continue
-
-        # rubygem-warden
-        # Finished in 0.08928 seconds (files took 0.1046 seconds to load)
-        # 215 examples, 14 failures
-        match = re.search(r"([0-9]+) examples?, ([0-9]+) failures?", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            continue
-
-        # rubygem-ansi
-        # Executed 12 tests with 7 passing, 5 errors.
-        match = re.search(r"Executed ([0-9]+) tests with ([0-9+]) passing, ([0-9]+) errors\.", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_pass += convert_int(match.group(2))
-            total_fail += convert_int(match.group(3))
-            continue
-
-        # vim
-        # Executed 9 tests
-        match = re.search(r"Executed ([0-9]+) tests$", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            continue
-
-        # rubygem-formatador
-        #   9 succeeded in 0.00375661 seconds
-        match = re.search(r"([0-9]+) succeeded in [0-9]+\.[0-9]+ seconds", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
-
-        # ./pigz -kf pigz.c ; ./pigz -t pigz.c.gz
-        # ./pigz -kfb 32 pigz.c ; ./pigz -t pigz.c.gz
-        match = re.search(r".*\.\/pigz.+(\.\/pigz).+", line)
-        if match and incheck:
-            total_pass += 2
-            continue
-        elif re.search(r".*\.\/pigz.+", line) and incheck:
-            total_pass += 1
-            continue
-
-        # netifaces
-        # Interface lo:
-        # Interface enp2s0:
-        match = re.search(r"^Interface [a-zA-Z0-9]+\:", line)
-        if match and incheck:
-            total_pass += 1
-            continue
-
-        # btrfs-progs
-        # [TEST]   001-bad-file-extent-bytenr
-        # [NOTRUN] Need to validate root privileges
-        # test failed for case
-        match = re.search(r"    \[TEST\]   .*", line)
-        if match and incheck:
-            total_pass += 1
-            continue
-
-        match = re.search(r"test failed for case.*", line)
-        if match and incheck:
-            total_fail += 1
-            total_pass = max(0, total_pass - 1)
-            continue
-
-        match = re.search(r"    \[NOTRUN\] .*", line)
-        if match and incheck:
-            total_skip += 1
-            continue
-
-        # chrpath
-        # success: chrpath changed rpath to larger path.
-        # error: chrpath unable to change rpath to larger path.
-        match = re.search(r"success\: chrpath .*", line)
-        if match and incheck:
-            total_pass += 1
-            continue
-        elif re.search(r"error: chrpath .*", line) and incheck:
-            total_fail += 1
-            continue
-        elif re.search(r"warning: chrpath .*", line) and incheck:
-            total_fail += 1
-            continue
-
-        # yajl
-        # 58/58 tests successful
-        match = re.search(r"([0-9]+)\/([0-9]+) tests successful", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_tests += convert_int(match.group(2))
-            continue
-
-        # xmlsec1
-        #     Checking required transforms                            OK
-        #     Verify existing signature                             Fail
-        #     Checking required transforms                          Skip
-        #     Checking required key data                               OK
-        match = re.search(r"^    [\w ]+\ +OK$", line)
-        if match and incheck:
-            total_pass += 1
-            continue
-        elif re.search(r"^    [\w ]+\ +Fail$", line) and incheck:
-            total_fail += 1
-            continue
-        elif re.search(r"^    [\w ]+\ +Skip$", line) and incheck:
-            total_skip += 1
-            continue
-
-        # xdg-utils
-        # TOTAL: 4 tests failed, 90 of 116 tests passed. (140 attempted)
-        match = re.search(r"TOTAL\: ([0-9]+) tests? failed\, ([0-9]+) of [0-9]+ tests? passed\. \(([0-9]+) attempted\)", line)
-        if match and incheck:
-            total_fail += convert_int(match.group(1))
-            total_pass += convert_int(match.group(2))
-            total_skip += convert_int(match.group(3)) - (convert_int(match.group(2)) + convert_int(match.group(1)))
-            continue
-
-        # slang
-        # Testing argv processing ...Ok
-        # ./utf8.sl:14:check_sprintf:Test Error
-        match = re.search(r"^Testing [\w ]+\.\.\.Ok$", line)
-        if match and incheck:
-            total_pass += 1
-            continue
-
-        match = re.search(r":Test Error", line)
-        if match and incheck:
-            total_fail += 1
-            continue
-
-        # go & golang
-        # ok  	golang.org/x/text/encoding/htmlindex	0.002s
-        # --- FAIL: TestParents (0.00s)
-        # FAIL	golang.org/x/text/internal	0.002s
-        # --- PASS: TestApp_Command (0.00s)
-        match = re.search(r"^ok\s+[\w_]+[A-Za-z0-9\.\?_\-]*", line)
-        if match and incheck:
-            total_tests += 1
-            total_pass += 1
-            continue
-
-        match = re.search(r"(---\s+)?(?<!X)FAIL:?\s*", line)
-        if match and incheck:
-            total_tests += 1
-            total_fail += 1
-            continue
 
-        match = re.search(r"---\s+PASS|PASS\s+ ", line)
-        if match and incheck:
-            total_tests += 1
-            total_pass += 1
-            continue
+def parse_log(log, pkgname=''):
+    """Parse output of test logs, returning the string_out of the counts."""
+    return TestLogCounter(pkgname).parse_log(log)
 
-        # valgrind
-        # == 5 tests, 0 stderr failures, 1 stdout failure, 0 stderrB failures, 0 stdoutB failures, 0 post failures ==
-        # == 55 tests, 48 stderr failures, 6 stdout failures, 0 stderrB failures, 0 stdoutB failures, 0 post failures ==
-        # == 125 tests, 12 stderr failures, 0 stdout failures, 0 stderrB failures, 0 stdoutB failures, 0 post failures ==
-        match = re.search(r"\=\= ([0-9]+) tests?\, ([0-9]+) stderr failures?\, ([0-9]+) stdout failures?\, "
-                          r"([0-9]+) stderrB failures?\, ([0-9]+) stdoutB failures?\, ([0-9]+) post failures? \=\=", line)
-        if match and incheck:
-            total_tests += convert_int(match.group(1))
-            total_fail += (convert_int(match.group(2)) + convert_int(match.group(3)) + convert_int(match.group(4)) + convert_int(match.group(5)) + convert_int(match.group(6)))
-            total_pass += \
-                (convert_int(match.group(1)) - (convert_int(match.group(2)) + convert_int(match.group(3)) + convert_int(match.group(4)) + convert_int(match.group(5)) + convert_int(match.group(6))))
-            continue
 
-        # zsh
-        # **************************************
-        # 46 successful test scripts, 0 failures, 1 skipped
-        # **************************************
-        match = re.search(r"([0-9]+) successful test scripts\, ([0-9]+) failures\, ([0-9]+) skipped", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            total_fail += convert_int(match.group(2))
-            total_skip += convert_int(match.group(3))
-            continue
+def package_log(path):
+    """Return the package name and build log for a package directory or a log in its results directory."""
+    if os.path.isdir(path):
+        return os.path.basename(os.path.abspath(path)), os.path.join(path, "results", "build.log")
+    log_dir = os.path.dirname(os.path.abspath(path))
+    if os.path.basename(log_dir) == "results":
+        log_dir = os.path.dirname(log_dir)
+    return os.path.basename(log_dir), path
 
-        # glog
-        # Passed 3 tests
-        match = re.search(r"Passed ([0-9]+) tests", line)
-        if match and incheck:
-            total_pass += convert_int(match.group(1))
-            continue
 
-        # hdf5
-        # Testing h5repack h5repack_szip.h5 -f dset_szip:GZIP=1                  -SKIP-
-        # Verifying h5dump output -f GZIP=1 -m 1024                             *FAILED*
-        # Testing h5repack --metadata_block_size=8192                            PASSED
-        # Verifying h5diff output h5repack_layout.h5 out-meta_long.h5repack_layo PASSED
-        match = re.search(r"^Testing .+\ +PASSED$", line)
-        if match and incheck:
-            total_pass += 1
-            continue
+def count_package(path):
+    """Return the result rows of the package directory or log at path, or an error message."""
+    package, log = package_log(path)
+    try:
+        counter = TestLogCounter(package)
+        counter.parse_log(log)
+    except OSError as e:
+        return "{}: {}".format(log, e)
+    return [dict(zip(result_fields, (package, log) + result)) for result in counter.results()]
+
+
+def count_packages(paths, jobs=None):
+    """Return the result rows of all paths, parsing the logs in a process pool.
+
+    Logs that can't be read are reported and skipped.
+    """
+    if jobs is None:
+        jobs = len(os.sched_getaffinity(0))
+    if jobs > 1 and len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(count_package, paths, chunksize=max(1, len(paths) // (jobs * 4))))
+    else:
+        results = [count_package(path) for path in paths]
 
-        match = re.search(r"^Verifying .+\ +PASSED$", line)
-        if match and incheck:
-            total_pass += 1
+    rows = []
+    for result in results:
+        if isinstance(result, str):
+            util.print_warning("Unable to parse {}".format(result))
             continue
+        rows.extend(result)
+    return sorted(rows, key=lambda row: (row["package"], row["name"], row["log"]))
 
-        match = re.search(r"^Testing .+\ +\-SKIP\-$", line)
-        if match and incheck:
-            total_skip += 1
-            continue
 
-        match = re.search(r"^Verifying .+\ +\-SKIP\-$", line)
-        if match and incheck:
-            total_skip += 1
-            continue
+def write_csv(rows, outfile):
+    """Write the result rows as CSV."""
+    writer = csv.DictWriter(outfile, fieldnames=result_fields)
+    writer.writeheader()
+    writer.writerows(rows)
 
-        # libconfig
-        # 3 tests; 3 passed, 0 failed
-        match = re.search(r"^([0-9]+) tests; ([0-9]+) passed\, ([0-9]+) failed", line)
-        if match and incheck:
-            total_tests = convert_int(match.group(1))
-            total_pass = convert_int(match.group(2))
-            total_fail = convert_int(match.group(3))
-            continue
 
-        # libogg
-        # testing page spill expansion... 0, (0),  granule:0 1, (1),  granule:4103 2, (2),  granule:5127 ok.
-        # testing max packet segments... 0, (0),  granule:0 1, (1),  granule:261127 2, (2),  granule:262151 ok.
-        # testing very large packets... 0, (0),  granule:0 1, (1),  granule:1031 2, (2), 3, (3),  granule:4103 ok.
-        # testing continuation resync in very large packets... 0, 1, 2, (2), 3, (3),  granule:4103 ok.
-        # testing zero data page (1 nil packet)... 0, (0),  granule:0 1, (1),  granule:1031 2, (2),  granule:2055 ok.
-        # Testing search for capture... ok.
-        # Testing recapture... ok.
-        match = re.search(r"^[T,t]esting .*\ ok\.$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
+def write_json(rows, outfile):
+    """Write the result rows as a JSON list."""
+    json.dump(rows, outfile, indent=2)
+    outfile.write("\n")
 
-        # libvorbis
-        #     vorbis_1ch_q-0.5_44100.ogg : ok
-        #     vorbis_2ch_q-0.5_44100.ogg : ok
-        #     ...
-        #     vorbis_7ch_q-0.5_44100.ogg : ok
-        #     vorbis_8ch_q-0.5_44100.ogg : ok
-        match = re.search(r"^\ \ \ \ vorbis_.*\.ogg\ \:\ ok$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
 
-        # pth
-        # OK - ALL TESTS SUCCESSFULLY PASSED.
-        match = re.search(r"^OK\ \-\ ALL\ TESTS\ SUCCESSFULLY\ PASSED\.$", line)
-        if match and incheck:
-            counted_pass += 1
-            continue
+def write_table(rows, path, writer):
+    """Write the result rows to path, - for standard output."""
+    if path == "-":
+        writer(rows, sys.stdout)
+        return
+    with util.open_auto(path, "w", newline="") as outfile:
+        writer(rows, outfile)
 
-    sanitize_counts()
-    collect_output()
-    return string_out()
 
+def main():
+    """Count the tests of one log, or aggregate the results of many packages."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logfile', nargs='+',
+                        help="path to log file to parse, or package directory to read results/build.log from")
+    parser.add_argument('--csv', dest='csv_file', default=None,
+                        help="write a table of the results of all packages as CSV, - for standard output")
+    parser.add_argument('--json', dest='json_file', default=None,
+                        help="write the results of all packages as JSON, - for standard output")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of logs to parse in parallel, defaults to the number of CPUs")
+    args = parser.parse_args()
 
-def string_out():
-    """Output test result counts."""
-    retstr = ""
-    for key in sorted(testcount):
-        # key may be an empty string, which is fine since this is handled by
-        # the calling module
-        retstr += "{},{},{},{},{},{}\n".format(key,
-                                               testcount[key],
-                                               testpass[key],
-                                               testfail[key],
-                                               testskip[key],
-                                               testxfail[key])
+    if len(args.logfile) == 1 and os.path.isfile(args.logfile[0]) and not (args.csv_file or args.json_file):
+        print(parse_log(args.logfile[0]))
+        return
 
-    return retstr.strip()  # strip trailing newline
+    rows = count_packages(args.logfile, args.jobs)
+    if args.json_file:
+        write_table(rows, args.json_file, write_json)
+    if args.csv_file or not args.json_file:
+        write_table(rows, args.csv_file or "-", write_csv)
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('logfile', help="path to log file to parse")
-    args = parser.parse_args()
-    result = parse_log(args.logfile)
-    print(result)
+    main()
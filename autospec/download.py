@@ -48,6 +48,29 @@ def do_curl_get_effective_url(url):
 
     return effective_url
 
+
+def do_curl_status(url):
+    """
+    Perform a GET for `url` and return the HTTP response code, or None if
+    the server could not be reached.
+    """
+    c = pycurl.Curl()
+    c.setopt(c.URL, url)
+    c.setopt(c.FOLLOWLOCATION, True)
+    c.setopt(c.CONNECTTIMEOUT, 10)
+    c.setopt(c.TIMEOUT, 600)
+    c.setopt(c.LOW_SPEED_LIMIT, 1)
+    c.setopt(c.LOW_SPEED_TIME, 10)
+    c.setopt(c.WRITEDATA, BytesIO())
+    try:
+        c.perform()
+        return c.getinfo(pycurl.RESPONSE_CODE)
+    except pycurl.error:
+        return None
+    finally:
+        c.close()
+
+
 def do_curl(url, dest=None, post=None, is_fatal=False):
     """
     Perform a curl operation for `url`.
@@ -0,0 +1,282 @@
+#!/bin/true
+#
+# elf.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Minimal ELF reader for the ABI report: file type, dynamic section
+# (SONAME, NEEDED, FLAGS_1) and the exported dynamic symbols, read with
+# struct from an mmap or an in-memory buffer instead of running file,
+# objdump, readelf and nm on every file.
+
+import mmap
+import struct
+
+ELF_MAGIC = b"\x7fELF"
+
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+ET_CORE = 4
+
+PT_DYNAMIC = 2
+PT_INTERP = 3
+PT_LOAD = 1
+
+SHT_DYNAMIC = 6
+SHT_DYNSYM = 11
+SHT_GNU_VERDEF = 0x6ffffffd
+SHT_GNU_VERSYM = 0x6fffffff
+
+SHF_EXECINSTR = 0x4
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_SONAME = 14
+DT_FLAGS_1 = 0x6ffffffb
+DF_1_PIE = 0x08000000
+
+SHN_UNDEF = 0
+SHN_LORESERVE = 0xff00
+SHN_ABS = 0xfff1
+
+STB_GLOBAL = 1
+STT_GNU_IFUNC = 10
+
+VER_NDX_GLOBAL = 1
+VERSYM_HIDDEN = 0x8000
+VER_FLG_BASE = 0x1
+
+# struct layouts for ELFCLASS32 and ELFCLASS64
+layouts = {
+    1: {"ehdr": "HHIIIIIHHHHHH", "phdr": "IIIIIIII", "shdr": "IIIIIIIIII", "sym": "IIIBBH", "dyn": "iI"},
+    2: {"ehdr": "HHIQQQIHHHHHH", "phdr": "IIQQQQQQ", "shdr": "IIQQQQIIQQ", "sym": "IBBHQQ", "dyn": "qQ"},
+}
+
+
+class ElfError(Exception):
+    """Raised when a file can't be read as ELF."""
+
+
+def is_elf(path):
+    """Return True if path is a regular file starting with the ELF magic."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == ELF_MAGIC
+    except OSError:
+        return False
+
+
+class ElfFile(object):
+    """Headers, dynamic section and dynamic symbols of an ELF object."""
+
+    def __init__(self, data):
+        """Parse the ELF object in data (bytes, bytearray or mmap)."""
+        self.raw = data
+        self.data = memoryview(data)
+        if bytes(self.data[:4]) != ELF_MAGIC or len(self.data) < 16:
+            raise ElfError("not an ELF file")
+        self.elf_class = self.data[4]
+        if self.elf_class not in layouts:
+            raise ElfError(f"unknown ELF class {self.elf_class}")
+        self.bits = 32 if self.elf_class == 1 else 64
+        self.little_endian = self.data[5] == 1
+        self.order = "<" if self.little_endian else ">"
+        self.formats = {key: struct.Struct(self.order + fmt) for key, fmt in layouts[self.elf_class].items()}
+        (self.e_type, self.e_machine, _, _, phoff, shoff, _, _,
+         phentsize, phnum, shentsize, shnum, _) = self.unpack("ehdr", 16)
+        self.segments = [self.segment(phoff + i * phentsize) for i in range(phnum)] if phoff else []
+        self.sections = [self.section(shoff + i * shentsize) for i in range(shnum)] if shoff else []
+        self.dynamic = self.read_dynamic()
+
+    @classmethod
+    def from_path(cls, path):
+        """Parse the ELF file at path through a read-only mmap."""
+        try:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as err:
+            raise ElfError(f"unable to map {path}: {err}")
+        return cls(data)
+
+    def unpack(self, kind, offset):
+        """Unpack the structure kind, or a struct format, at offset."""
+        fmt = self.formats[kind] if kind in self.formats else struct.Struct(self.order + kind)
+        if offset < 0 or offset + fmt.size > len(self.data):
+            raise ElfError(f"truncated {kind} at {offset}")
+        return fmt.unpack_from(self.data, offset)
+
+    def linked_strtab(self, link):
+        """Return the offset of the string table in section link."""
+        if link >= len(self.sections):
+            raise ElfError(f"invalid section link {link}")
+        return self.sections[link][2]
+
+    def segment(self, offset):
+        """Return (type, offset, vaddr, filesz) of the program header at offset."""
+        fields = self.unpack("phdr", offset)
+        if self.bits == 32:
+            p_type, p_offset, p_vaddr, _, p_filesz = fields[:5]
+        else:
+            p_type, _, p_offset, p_vaddr, _, p_filesz = fields[:6]
+        return p_type, p_offset, p_vaddr, p_filesz
+
+    def section(self, offset):
+        """Return (type, flags, offset, size, link, entsize) of the section header at offset."""
+        _, sh_type, sh_flags, _, sh_offset, sh_size, sh_link, _, _, sh_entsize = self.unpack("shdr", offset)
+        return sh_type, sh_flags, sh_offset, sh_size, sh_link, sh_entsize
+
+    def string(self, offset):
+        """Return the NUL terminated string at offset."""
+        if offset < 0 or offset >= len(self.data):
+            raise ElfError(f"string offset {offset} out of range")
+        end = self.raw.find(b"\0", offset)
+        if end < 0:
+            end = len(self.data)
+        return bytes(self.data[offset:end]).decode("utf-8", errors="surrogateescape")
+
+    def vaddr_offset(self, vaddr):
+        """Translate a virtual address to a file offset using the PT_LOAD segments."""
+        for p_type, p_offset, p_vaddr, p_filesz in self.segments:
+            if p_type == PT_LOAD and p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + p_offset
+        raise ElfError(f"address {vaddr:#x} is not mapped")
+
+    def read_dynamic(self):
+        """Return the (tag, value) dynamic entries and the offset of their string table."""
+        entries = []
+        strtab = None
+        table = None
+        for sh_type, _, sh_offset, sh_size, sh_link, _ in self.sections:
+            if sh_type == SHT_DYNAMIC:
+                table = (sh_offset, sh_size)
+                if sh_link < len(self.sections):
+                    strtab = self.linked_strtab(sh_link)
+                break
+        else:
+            for p_type, p_offset, _, p_filesz in self.segments:
+                if p_type == PT_DYNAMIC:
+                    table = (p_offset, p_filesz)
+                    break
+        if table is None:
+            return {"entries": entries, "strtab": None}
+        entsize = self.formats["dyn"].size
+        for offset in range(table[0], table[0] + table[1] - entsize + 1, entsize):
+            tag, value = self.unpack("dyn", offset)
+            if tag == DT_NULL:
+                break
+            entries.append((tag, value))
+            if tag == DT_STRTAB and strtab is None:
+                strtab = self.vaddr_offset(value)
+        return {"entries": entries, "strtab": strtab}
+
+    def dynamic_values(self, tag):
+        """Return the values of the dynamic entries with tag."""
+        return [value for entry_tag, value in self.dynamic["entries"] if entry_tag == tag]
+
+    def dynamic_strings(self, tag):
+        """Return the strings named by the dynamic entries with tag."""
+        if self.dynamic["strtab"] is None:
+            return []
+        return [self.string(self.dynamic["strtab"] + value) for value in self.dynamic_values(tag)]
+
+    def is_dynamic(self):
+        """Return True if the object is dynamically linked."""
+        return any(p_type in (PT_DYNAMIC, PT_INTERP) for p_type, _, _, _ in self.segments)
+
+    def soname(self):
+        """Return the DT_SONAME of the object, or None."""
+        sonames = self.dynamic_strings(DT_SONAME)
+        return sonames[0] if sonames else None
+
+    def needed(self):
+        """Return the DT_NEEDED libraries of the object, in order."""
+        return self.dynamic_strings(DT_NEEDED)
+
+    def kind(self):
+        """Return the object type as worded by file(1)."""
+        if self.e_type == ET_DYN:
+            flags = 0
+            for value in self.dynamic_values(DT_FLAGS_1):
+                flags |= value
+            return "pie executable" if flags & DF_1_PIE else "shared object"
+        return {ET_REL: "relocatable", ET_EXEC: "executable", ET_CORE: "core file"}.get(self.e_type, "unknown type")
+
+    def describe(self):
+        """Return the start of the description file(1) gives this object."""
+        linking = "dynamically linked" if self.is_dynamic() else "statically linked"
+        endian = "LSB" if self.little_endian else "MSB"
+        return f"ELF {self.bits}-bit {endian} {self.kind()}, machine {self.e_machine}, {linking}"
+
+    def version_names(self):
+        """Return {version index: name} of the versions defined by the object."""
+        names = {}
+        for sh_type, _, sh_offset, sh_size, sh_link, _ in self.sections:
+            if sh_type != SHT_GNU_VERDEF:
+                continue
+            strtab = self.linked_strtab(sh_link)
+            offset = sh_offset
+            while offset < sh_offset + sh_size:
+                _, flags, ndx, _, _, vd_aux, vd_next = self.unpack("HHHHIII", offset)
+                vda_name, _ = self.unpack("II", offset + vd_aux)
+                names[ndx] = (self.string(strtab + vda_name), bool(flags & VER_FLG_BASE))
+                if not vd_next:
+                    break
+                offset += vd_next
+        return names
+
+    def dynamic_symbols(self):
+        """Generate (name, type letter) for the defined global dynamic symbols, like nm -D --defined-only -g.
+
+        Versioned symbols are named name@@VERSION, or name@VERSION for
+        non-default versions, as binutils nm prints them.
+        """
+        versions = None
+        for index, (sh_type, _, sh_offset, sh_size, sh_link, sh_entsize) in enumerate(self.sections):
+            if sh_type != SHT_DYNSYM:
+                continue
+            strtab = self.linked_strtab(sh_link)
+            versym = None
+            for vs_type, _, vs_offset, _, vs_link, _ in self.sections:
+                if vs_type == SHT_GNU_VERSYM and vs_link == index:
+                    versym = vs_offset
+            entsize = sh_entsize or self.formats["sym"].size
+            for i in range(1, sh_size // entsize):
+                fields = self.unpack("sym", sh_offset + i * entsize)
+                if self.bits == 32:
+                    st_name, _, _, st_info, _, st_shndx = fields
+                else:
+                    st_name, st_info, _, st_shndx, _, _ = fields
+                bind = st_info >> 4
+                sym_type = st_info & 0xf
+                if st_shndx == SHN_UNDEF or bind != STB_GLOBAL:
+                    # weak and unique symbols have their own nm letters
+                    continue
+                if st_shndx == SHN_ABS:
+                    letter = "A"
+                elif st_shndx < SHN_LORESERVE and st_shndx < len(self.sections) and sym_type != STT_GNU_IFUNC \
+                        and self.sections[st_shndx][1] & SHF_EXECINSTR:
+                    letter = "T"
+                else:
+                    letter = "?"
+                name = self.string(strtab + st_name)
+                if versym is not None:
+                    if versions is None:
+                        versions = self.version_names()
+                    ver, = self.unpack("H", versym + i * 2)
+                    ver_name, base = versions.get(ver & ~VERSYM_HIDDEN, (None, False))
+                    if ver & ~VERSYM_HIDDEN > VER_NDX_GLOBAL and ver_name and not base and ver_name != name:
+                        name += ("@" if ver & VERSYM_HIDDEN else "@@") + ver_name
+                yield name, letter
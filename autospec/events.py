@@ -0,0 +1,123 @@
+#!/bin/true
+#
+# events.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Structured record of the decisions taken in every build round (buildreqs
+# added, %files content found or removed, unknown pattern matches...),
+# written as JSON lines next to the build logs.
+
+import atexit
+import contextlib
+import json
+import os
+import time
+
+# The active EventSink, events are dropped when there is none
+sink = None
+
+
+class EventSink(object):
+    """Append events as JSON lines to a file.
+
+    Every event carries the round, package, log file, log line number and
+    pattern current when it was emitted. The file is opened on the first
+    event and written in blocks, flushed at the end of every round.
+    """
+
+    def __init__(self, path, package=""):
+        """Write the events of package to path."""
+        self.path = path
+        self.package = package
+        self.file = None
+        self.round = 0
+        self.log = None
+        self.line = None
+        self.pattern = None
+
+    def emit(self, event, duration=None, **fields):
+        """Write an event of type event, with fields added to the common ones."""
+        if not self.file:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "a", encoding="utf-8", buffering=64 * 1024)
+        record = {
+            "event": event,
+            "round": self.round,
+            "package": self.package,
+            "log": self.log,
+            "line": self.line,
+            "pattern": self.pattern,
+            "duration": duration,
+            "time": round(time.time(), 3),
+        }
+        record.update(fields)
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def flush(self):
+        """Write the buffered events out."""
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        """Write the buffered events out and close the file."""
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def open_sink(path, package=""):
+    """Make an EventSink writing to path the active sink."""
+    global sink
+    close()
+    sink = EventSink(path, package)
+    atexit.register(sink.close)
+    return sink
+
+
+def close():
+    """Close the active sink."""
+    global sink
+    if sink:
+        sink.close()
+        atexit.unregister(sink.close)
+        sink = None
+
+
+def emit(event, duration=None, **fields):
+    """Write an event to the active sink, if any."""
+    if sink:
+        sink.emit(event, duration, **fields)
+
+
+def start_round(iteration):
+    """Flush the events of the previous round and tag the next ones with iteration."""
+    if sink:
+        sink.flush()
+        sink.round = iteration
+
+
+@contextlib.contextmanager
+def matching(pattern):
+    """Tag the events emitted in the block with pattern."""
+    active = sink
+    if not active:
+        yield
+        return
+    previous = active.pattern
+    active.pattern = pattern
+    try:
+        yield
+    finally:
+        active.pattern = previous
@@ -23,6 +23,7 @@ import os
 import re
 import mmap
 import subprocess
+import events
 import util
 from collections import OrderedDict
 from typing import List, Tuple
@@ -114,6 +115,7 @@ class FileManager(object):
             else:
                 self.package.must_restart += 1
 
+        events.emit("files_found", file=filename, subpackage=package)
         if not self.newfiles_printed:
             print("  New %files content found")
             self.newfiles_printed = True
@@ -1056,6 +1058,7 @@ class FileManager(object):
                 print("File no longer present in subpackage {}: {}".format(pkg, filename))
                 hit = True
         if hit:
+            events.emit("file_removed", file=filename)
             self.files_blacklist.add(filename)
             self.package.must_restart += 1
 
@@ -19,12 +19,16 @@
 # Commit to git
 #
 
+import fcntl
 import glob
+import hashlib
+import json
 import os
 import sys
 import subprocess
 import re
 import util
+import compress
 import download
 import natsort
 import fastnumbers
@@ -32,6 +36,17 @@ import validators
 from util import call, write_out, print_fatal, print_debug, print_info
 from lastversion import latest as latest_pypi
 
+# Semantic version-ish tags: optional prefix, up to four numeric components
+# and an optional pre-release/build suffix
+semver_tag_re = re.compile(r"(?:^(?:[a-zA-Z]+[0-9]?[a-zA-Z0-9]*[\-]+)?|^(?:[vV]+)?)(0|[1-9]\d*)(?:\.|\_)(0|[1-9]\d*)?(?:(?:\.|\_)(0|[1-9]\d*))?(?:(?:\.|\_)(0|[1-9]\d*))?((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*)?(?:\-((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*))?([a-zA-Z0-9\_\.\-]+)?", re.MULTILINE)
+# Date tags (20200101) and word tags (release-candidate) are not versions
+default_tag_exclude = r"(?:^\d{8,8})|(?:^[a-zA-Z]+[-_.]+[a-zA-Z]+)"
+default_tag_exclude_re = re.compile(default_tag_exclude, re.MULTILINE)
+major_tag_re = re.compile(r"^[vV](\d+$)", re.MULTILINE)
+tag_ref_re = re.compile(r"(?<=refs\/tags\/).*", re.MULTILINE)
+version_sort_key = natsort.natsort_keygen(key=lambda x: x.replace('.', '~') + 'z')
+
+
 def read_file(path):
     """Read full file at path."""
     try:
@@ -135,7 +150,7 @@ def git_describe(clone_path):
     git_describe_cmd1_result = process.stdout
 
     if git_describe_cmd1_result:
-        git_describe_cmd2_re1 = re.compile(r"(?:^(?:[a-zA-Z]+[0-9]?[a-zA-Z0-9]*[\-]+)?|^(?:[vV]+)?)(0|[1-9]\d*)(?:\.|\_)(0|[1-9]\d*)?(?:(?:\.|\_)(0|[1-9]\d*))?(?:(?:\.|\_)(0|[1-9]\d*))?((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*)?(?:\-((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*))?([a-zA-Z0-9\_\.\-]+)?", re.MULTILINE)
+        git_describe_cmd2_re1 = semver_tag_re
         git_describe_cmd2_re1_result = git_describe_cmd2_re1.search(git_describe_cmd1_result)
         if git_describe_cmd2_re1_result:
             #if util.debugging:
@@ -155,11 +170,58 @@ def git_describe(clone_path):
             return outputVersion1
 
 
-def git_ls_remote_custom_re(remote_url_cmd, clone_path, path, conf):
-    git_ls_remote_cmd1_result = ""
-    git_ls_remote_cmd1_re1_result_pre_sort = []
-    git_ls_remote_cmd1_re1_result_sorted = []
+def tag_version(match):
+    """Assemble the normalized version from a tag version regex match."""
+    version = match.group(1)
+    if match.group(2):
+        version = f"{version}.{match.group(2)}"
+    if match.group(3):
+        version = f"{version}.{match.group(3)}"
+    if match.group(4):
+        version = f"{version}.{match.group(4)}"
+    if match.group(5):
+        version = f"{version}{match.group(5)}"
+    return version
 
+
+def compile_git_re(pattern):
+    """Compile a (custom) git tag regex, aborting on invalid patterns."""
+    try:
+        return re.compile(pattern, re.MULTILINE)
+    except re.error as err:
+        print_fatal(f"Custom git regex: {pattern}")
+        print_fatal(f"Unable to create custom git regex: {err}")
+        sys.exit(1)
+
+
+def latest_tag_version(tags, version_re, exclude_re=None, normalize=False):
+    """Filter, normalize and order tags in a single pass.
+
+    Tags matching exclude_re are dropped, bare major versions (v2) become
+    v2.0 when normalize is set and the remaining tags are converted with
+    version_re. Only the highest version (in natsort order) is kept.
+    """
+    latest = ""
+    latest_key = None
+    for tag in tags:
+        if exclude_re and exclude_re.search(tag):
+            continue
+        if normalize and major_tag_re.search(tag):
+            tag = f"{tag}.0"
+        match = version_re.search(tag)
+        if not match or not match.group(1):
+            continue
+        version = tag_version(match)
+        key = version_sort_key(version)
+        # '>=' keeps the last of equal keys, as natsorted()[-1] did
+        if latest_key is None or key >= latest_key:
+            latest = version
+            latest_key = key
+    return latest
+
+
+def git_ls_remote_refs(remote_url_cmd, clone_path):
+    """Return the raw output of a git ls-remote command."""
     process = subprocess.run(
         remote_url_cmd,
         check=False,
@@ -170,163 +232,54 @@ def git_ls_remote_custom_re(remote_url_cmd, clone_path, path, conf):
         universal_newlines=True,
         cwd=clone_path,
     )
-    git_ls_remote_cmd1_result = process.stdout
+    return process.stdout
 
-    git_ls_remote_cmd1_re1_result = []
-    if git_ls_remote_cmd1_result:
-        git_ls_remote_cmd1_re1 = re.compile(r"(?<=refs\/tags\/).*", re.MULTILINE)
-        git_ls_remote_cmd1_re1_result = git_ls_remote_cmd1_re1.findall(git_ls_remote_cmd1_result)
-        #if util.debugging:
-            #if git_ls_remote_cmd1_re1_result:
-                #for r in git_ls_remote_cmd1_re1_result:
-                    #print_debug(r)
 
-        if git_ls_remote_cmd1_re1_result:
-            #if util.debugging:
-                    #print_debug(f"conf.custom_git_re: {conf.custom_git_re2}")
-            git_ls_remote_cmd1_re4_pre = r"{0}".format(conf.custom_git_re2)
-            git_ls_remote_cmd1_re4 = re.Pattern
-            try:
-                git_ls_remote_cmd1_re4 = re.compile(git_ls_remote_cmd1_re4_pre, re.MULTILINE)
-            except re.error as err:
-                    print_fatal(f"Custom git regex: {git_ls_remote_cmd1_re4.pattern}")
-                    print_fatal(f"Unable to create custom git regex: {err}")
-            for r in git_ls_remote_cmd1_re1_result:
-                git_ls_remote_cmd1_re4_result = git_ls_remote_cmd1_re4.search(r)
-                if git_ls_remote_cmd1_re4_result:
-                    #if util.debugging:
-                        #print_debug(f"{git_ls_remote_cmd1_re4_result.group(1)}.{git_ls_remote_cmd1_re4_result.group(2)}.{git_ls_remote_cmd1_re4_result.group(3)}.{git_ls_remote_cmd1_re4_result.group(4)}.{git_ls_remote_cmd1_re4_result.group(5)}.{git_ls_remote_cmd1_re4_result.group(6)}.{git_ls_remote_cmd1_re4_result.group(7)}")
-                    if git_ls_remote_cmd1_re4_result.group(1):
-                        outputVersionPre = f"{git_ls_remote_cmd1_re4_result.group(1)}"
-                    if git_ls_remote_cmd1_re4_result.group(2):
-                        outputVersionPre = f"{outputVersionPre}.{git_ls_remote_cmd1_re4_result.group(2)}"
-                    if git_ls_remote_cmd1_re4_result.group(3):
-                        outputVersionPre = f"{outputVersionPre}.{git_ls_remote_cmd1_re4_result.group(3)}"
-                    if git_ls_remote_cmd1_re4_result.group(4):
-                        outputVersionPre = f"{outputVersionPre}.{git_ls_remote_cmd1_re4_result.group(4)}"
-                    if git_ls_remote_cmd1_re4_result.group(5):
-                        outputVersionPre = f"{outputVersionPre}{git_ls_remote_cmd1_re4_result.group(5)}"
-                    #if util.debugging:
-                        #print_debug(f"outputVersionPre: {outputVersionPre}")
-                    git_ls_remote_cmd1_re1_result_pre_sort.append(outputVersionPre)
-            if git_ls_remote_cmd1_re1_result_pre_sort:
-                git_ls_remote_cmd1_re1_result_sorted = natsort.natsorted(git_ls_remote_cmd1_re1_result_pre_sort, key=lambda x: x.replace('.', '~')+'z')
-    if git_ls_remote_cmd1_re1_result_sorted:
-        return git_ls_remote_cmd1_re1_result_sorted[-1]
-    else:
+def resolve_remote_version(remote_url_cmd, clone_path, version_re, exclude_re=None, normalize=False):
+    """Get the latest tag version of a remote, using the tag index cache.
+
+    The index is keyed by the hash of the advertised refs, so it is only
+    recomputed when the remote tags actually change.
+    """
+    refs = git_ls_remote_refs(remote_url_cmd, clone_path)
+    if not refs:
         return ""
 
+    refs_hash = hashlib.sha1(refs.encode("utf-8", errors="surrogateescape")).hexdigest()
+    classifier = "\n".join([version_re.pattern, exclude_re.pattern if exclude_re else "", str(normalize)])
+    classifier_hash = hashlib.sha1(classifier.encode("utf-8")).hexdigest()
+    index_file = os.path.join(util.get_cache_dir("tags"), hashlib.sha1(remote_url_cmd.encode("utf-8")).hexdigest() + ".json")
+    try:
+        with open(index_file, "r") as index_f:
+            index = json.load(index_f)
+        if index.get("refs") == refs_hash and index.get("classifier") == classifier_hash:
+            return index.get("latest", "")
+    except (OSError, ValueError):
+        pass
+
+    latest = latest_tag_version(tag_ref_re.findall(refs), version_re, exclude_re, normalize)
+    try:
+        with open(index_file, "w") as index_f:
+            json.dump({"refs": refs_hash, "classifier": classifier_hash, "latest": latest}, index_f)
+    except OSError as err:
+        util.print_warning(f"Unable to write tag index {index_file}: {err}")
+    return latest
 
-def git_ls_remote(remote_url_cmd, clone_path, path, conf):
-    git_ls_remote_cmd1_result = ""
-    git_ls_remote_cmd1_re1_result_pre_sort = []
-    git_ls_remote_cmd1_re1_result_sorted = []
 
-    process = subprocess.run(
-        remote_url_cmd,
-        check=False,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        universal_newlines=True,
-        cwd=clone_path,
-    )
-    git_ls_remote_cmd1_result = process.stdout
+def git_ls_remote_custom_re(remote_url_cmd, clone_path, path, conf):
+    """Get the latest remote tag version using the custom_git_re2 regex."""
+    version_re = compile_git_re(r"{0}".format(conf.custom_git_re2))
+    return resolve_remote_version(remote_url_cmd, clone_path, version_re)
 
-    git_ls_remote_cmd1_re1_result = []
-    if git_ls_remote_cmd1_result:
-        git_ls_remote_cmd1_re1 = re.compile(r"(?<=refs\/tags\/).*", re.MULTILINE)
-        git_ls_remote_cmd1_re1_result = git_ls_remote_cmd1_re1.findall(git_ls_remote_cmd1_result)
-        #if util.debugging:
-            #if git_ls_remote_cmd1_re1_result:
-                #for r in git_ls_remote_cmd1_re1_result:
-                    #print_debug(r)
-
-        if git_ls_remote_cmd1_re1_result:
-            git_ls_remote_cmd1_re2_result_delete = []
-            default_re = r"(?:^\d{8,8})|(?:^[a-zA-Z]+[-_.]+[a-zA-Z]+)"
-            if conf.custom_git_re:
-                #if util.debugging:
-                    #print_debug(f"conf.custom_git_re: {conf.custom_git_re}")
-                git_ls_remote_cmd1_re2_pre = r"{default_re}|{custom_re}".format(default_re=default_re, custom_re=conf.custom_git_re)
-                git_ls_remote_cmd1_re2 = re.Pattern
-                try:
-                    git_ls_remote_cmd1_re2 = re.compile(git_ls_remote_cmd1_re2_pre, re.MULTILINE)
-                except re.error as err:
-                        print_fatal(f"Custom git regex: {git_ls_remote_cmd1_re2.pattern}")
-                        print_fatal(f"Unable to create custom git regex: {err}")
-                print_info(f"Custom git regex: {git_ls_remote_cmd1_re2.pattern}")
-            else:
-                git_ls_remote_cmd1_re2 = re.compile(default_re, re.MULTILINE)
-            #if util.debugging:
-                #print_debug("Reverse: '{git_ls_remote_cmd1_re2}':")
-            for i, r in enumerate(git_ls_remote_cmd1_re1_result):
-                git_ls_remote_cmd1_re2_result = git_ls_remote_cmd1_re2.search(r)
-                if git_ls_remote_cmd1_re2_result:
-                    #if util.debugging:
-                        #print_debug(f"Delete: {i} - {r}")
-                    git_ls_remote_cmd1_re2_result_delete.append(i)
-            for d in sorted(git_ls_remote_cmd1_re2_result_delete, reverse=True):
-                del git_ls_remote_cmd1_re1_result[d]
-            #if util.debugging:
-                #for r in git_ls_remote_cmd1_re1_result:
-                    #print_debug(r)
-
-        if git_ls_remote_cmd1_re1_result:
-            git_ls_remote_cmd1_re2_result_delete = []
-            default_re = r"^[vV](\d+$)"
-            git_ls_remote_cmd1_re2 = re.compile(default_re, re.MULTILINE)
-            for i, r in enumerate(git_ls_remote_cmd1_re1_result):
-                git_ls_remote_cmd1_re2_result = git_ls_remote_cmd1_re2.search(r)
-                if git_ls_remote_cmd1_re2_result:
-                    #if util.debugging:
-                        #print_debug(f"Modify: {i} - {r}")
-                    git_ls_remote_cmd1_re1_result[i] = f"{r}.0"
-
-        if git_ls_remote_cmd1_re1_result:
-            git_ls_remote_cmd1_re3_result_delete = []
-            git_ls_remote_cmd1_re3 = re.compile(r"(?:^(?:[a-zA-Z]+[0-9]?[a-zA-Z0-9]*[\-]+)?|^(?:[vV]+)?)(0|[1-9]\d*)(?:\.|\_)(0|[1-9]\d*)?(?:(?:\.|\_)(0|[1-9]\d*))?(?:(?:\.|\_)(0|[1-9]\d*))?((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*)?(?:\-((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*))?([a-zA-Z0-9\_\.\-]+)?", re.MULTILINE)
-            #if util.debugging:
-                #print_debug("'(?:^(?:[a-zA-Z]+[0-9]?[a-zA-Z0-9]*[\-]+)?|^(?:[vV]+)?)(0|[1-9]\d*)(?:\.|\_)(0|[1-9]\d*)?(?:(?:\.|\_)(0|[1-9]\d*))?(?:(?:\.|\_)(0|[1-9]\d*))?((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*)?(?:\-((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*))?([a-zA-Z0-9\_\.\-]+)?':")
-            for i, r in enumerate(git_ls_remote_cmd1_re1_result):
-                git_ls_remote_cmd1_re3_result = git_ls_remote_cmd1_re3.search(r)
-                if not git_ls_remote_cmd1_re3_result:
-                    #if util.debugging:
-                        #print_debug(f"Delete: {i} - {r}")
-                    git_ls_remote_cmd1_re3_result_delete.append(i)
-            for d in sorted(git_ls_remote_cmd1_re3_result_delete, reverse=True):
-                del git_ls_remote_cmd1_re1_result[d]
-            #if util.debugging:
-                #for r in git_ls_remote_cmd1_re1_result:
-                    #print_debug(r)
-
-        if git_ls_remote_cmd1_re1_result:
-            git_ls_remote_cmd1_re4 = re.compile(r"(?:^(?:[a-zA-Z]+[0-9]?[a-zA-Z0-9]*[\-]+)?|^(?:[vV]+)?)(0|[1-9]\d*)(?:\.|\_)(0|[1-9]\d*)?(?:(?:\.|\_)(0|[1-9]\d*))?(?:(?:\.|\_)(0|[1-9]\d*))?((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*)?(?:\-((?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z][0-9a-zA-Z]*))*))?([a-zA-Z0-9\_\.\-]+)?", re.MULTILINE)
-            for r in git_ls_remote_cmd1_re1_result:
-                git_ls_remote_cmd1_re4_result = git_ls_remote_cmd1_re4.search(r)
-                if git_ls_remote_cmd1_re4_result:
-                    #if util.debugging:
-                        #print_debug(f"{git_ls_remote_cmd1_re4_result.group(1)}.{git_ls_remote_cmd1_re4_result.group(2)}.{git_ls_remote_cmd1_re4_result.group(3)}.{git_ls_remote_cmd1_re4_result.group(4)}.{git_ls_remote_cmd1_re4_result.group(5)}.{git_ls_remote_cmd1_re4_result.group(6)}.{git_ls_remote_cmd1_re4_result.group(7)}")
-                    if git_ls_remote_cmd1_re4_result.group(1):
-                        outputVersionPre = f"{git_ls_remote_cmd1_re4_result.group(1)}"
-                    if git_ls_remote_cmd1_re4_result.group(2):
-                        outputVersionPre = f"{outputVersionPre}.{git_ls_remote_cmd1_re4_result.group(2)}"
-                    if git_ls_remote_cmd1_re4_result.group(3):
-                        outputVersionPre = f"{outputVersionPre}.{git_ls_remote_cmd1_re4_result.group(3)}"
-                    if git_ls_remote_cmd1_re4_result.group(4):
-                        outputVersionPre = f"{outputVersionPre}.{git_ls_remote_cmd1_re4_result.group(4)}"
-                    if git_ls_remote_cmd1_re4_result.group(5):
-                        outputVersionPre = f"{outputVersionPre}{git_ls_remote_cmd1_re4_result.group(5)}"
-                    #if util.debugging:
-                        #print_debug(f"outputVersionPre: {outputVersionPre}")
-                    git_ls_remote_cmd1_re1_result_pre_sort.append(outputVersionPre)
-            if git_ls_remote_cmd1_re1_result_pre_sort:
-                git_ls_remote_cmd1_re1_result_sorted = natsort.natsorted(git_ls_remote_cmd1_re1_result_pre_sort, key=lambda x: x.replace('.', '~')+'z')
-    if git_ls_remote_cmd1_re1_result_sorted:
-        return git_ls_remote_cmd1_re1_result_sorted[-1]
+
+def git_ls_remote(remote_url_cmd, clone_path, path, conf):
+    """Get the latest remote tag version, skipping dates and custom_git_re matches."""
+    if conf.custom_git_re:
+        exclude_re = compile_git_re(r"{default_re}|{custom_re}".format(default_re=default_tag_exclude, custom_re=conf.custom_git_re))
+        print_info(f"Custom git regex: {exclude_re.pattern}")
     else:
-        return ""
+        exclude_re = default_tag_exclude_re
+    return resolve_remote_version(remote_url_cmd, clone_path, semver_tag_re, exclude_re, normalize=True)
 
 
 def find_version_git(url, clone_path, path, conf):
@@ -446,6 +399,83 @@ def git_clone(url, path, cmd_args, clone_path, force_module, force_fullclone, is
             sys.exit(1)
 
 
+def git_mirror_path(url):
+    """Get the persistent bare mirror location for a remote url."""
+    url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    mirror_name = os.path.basename(url.rstrip("/"))
+    if mirror_name.endswith(".git"):
+        mirror_name = mirror_name[:-4]
+    return os.path.join(util.get_cache_dir("git"), f"{mirror_name}-{url_hash}.git")
+
+
+def git_mirror_update(url, mirror_path, force_fullclone):
+    """Create the bare mirror of url, or fetch only the new objects into it.
+
+    Shallow clones are replaced by a blob-less partial mirror, so only the
+    blobs of the checked out revision are ever downloaded.
+    """
+    if os.path.isdir(mirror_path):
+        print_info(f"git fetch --prune {url}")
+        call(f"git --git-dir={mirror_path} fetch --prune --tags origin")
+    else:
+        filter_arg = "" if force_fullclone is True else " --filter=blob:none"
+        print_info(f"git clone --mirror{filter_arg} {url}")
+        call(f"git clone --mirror{filter_arg} {url} {mirror_path}")
+
+
+def git_mirror_worktree(mirror_path, branch, clone_path, force_module, force_fullclone):
+    """Check out branch of the mirror as a detached worktree at clone_path."""
+    call(f"git --git-dir={mirror_path} worktree prune")
+    call(f"git --git-dir={mirror_path} worktree add --force --detach {os.path.abspath(clone_path)} {branch}")
+    if force_module is not True:
+        depth_arg = "" if force_fullclone is True else " --depth=1"
+        call(f"git submodule update --init --recursive --jobs=8{depth_arg}", cwd=clone_path)
+
+
+def remove_mirror_worktree(path, mirror_path, clone_path, is_fatal):
+    """Remove the worktree at clone_path and forget it in the mirror."""
+    remove_clone_archive(path, clone_path, is_fatal)
+    call(f"git --git-dir={mirror_path} worktree prune", check=False)
+
+
+def git_tree_id(clone_path):
+    """Return the git tree hash checked out in clone_path, or None."""
+    try:
+        process = subprocess.run(
+            "git rev-parse HEAD^{tree}",
+            check=True,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            universal_newlines=True,
+            cwd=clone_path,
+        )
+    except subprocess.CalledProcessError:
+        return None
+    return process.stdout.strip() or None
+
+
+def git_mirror_checkout(url, path, branch, clone_path, force_module, force_fullclone):
+    """Populate clone_path from the persistent mirror of url.
+
+    Returns the mirror path, or None when the mirror could not be used and a
+    fresh clone is needed instead.
+    """
+    mirror_path = git_mirror_path(url)
+    try:
+        with open(f"{mirror_path}.lock", "w") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            git_mirror_update(url, mirror_path, force_fullclone)
+            git_mirror_worktree(mirror_path, branch, clone_path, force_module, force_fullclone)
+    except subprocess.CalledProcessError as err:
+        util.print_warning(f"Unable to use git mirror {mirror_path} for {url}: {err}")
+        if os.path.isdir(mirror_path):
+            remove_mirror_worktree(path, mirror_path, clone_path, False)
+        return None
+    return mirror_path
+
+
 def git_archive_all(path, name, url, branch, force_module, force_fullclone, conf, is_fatal=True):
     """Clone package directly from a git repository."""
     cmd_args = f"{branch} {url} {name}"
@@ -465,7 +495,9 @@ def git_archive_all(path, name, url, branch, force_module, force_fullclone, conf
             absolute_url_file=f"file://{os.path.abspath(latest_pypi_source_basename)}"
             return absolute_url_file
         else:
-            git_clone(url=url, path=path, cmd_args=cmd_args, clone_path=clone_path, force_module=force_module, force_fullclone=force_fullclone, is_fatal=is_fatal)
+            mirror_path = git_mirror_checkout(url=url, path=path, branch=branch, clone_path=clone_path, force_module=force_module, force_fullclone=force_fullclone)
+            if not mirror_path:
+                git_clone(url=url, path=path, cmd_args=cmd_args, clone_path=clone_path, force_module=force_module, force_fullclone=force_fullclone, is_fatal=is_fatal)
             try:
                 outputVersion = find_version_git(url=url, clone_path=clone_path, path=path, conf=conf)
             except:
@@ -485,23 +517,24 @@ def git_archive_all(path, name, url, branch, force_module, force_fullclone, conf
                 print_debug(f"clone_path: {clone_path}")
                 print_debug(f"absolute_file_path: {absolute_file_path}")
                 print_debug(f"absolute_url_file: {absolute_url_file}")
+            if not mirror_path:
+                archive_exclude = ()
+                tree_id = None
+            else:
+                # The worktree .git is only a pointer into the mirror
+                archive_exclude = (".git",)
+                tree_id = git_tree_id(clone_path)
             try:
-                process = subprocess.run(
-                    f"tar --create --file=- {clone_path}/ | pigz -9 -p 20 > {clone_file}",
-                    check=True,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    universal_newlines=True,
-                    cwd=path,
-                )
-            except subprocess.CalledProcessError as err:
+                compress.archive_tree(clone_path, name, os.path.join(path, clone_file), exclude=archive_exclude, tree_id=tree_id)
+            except (OSError, subprocess.CalledProcessError, RuntimeError) as err:
                 remove_clone_archive(path, clone_path, is_fatal)
                 print_fatal(f"Unable to archive {clone_path} in {clone_file} from {url}: {err}")
                 sys.exit(1)
 
-            remove_clone_archive(path, clone_path, is_fatal)
+            if mirror_path:
+                remove_mirror_worktree(path, mirror_path, clone_path, is_fatal)
+            else:
+                remove_clone_archive(path, clone_path, is_fatal)
             return absolute_url_file
     else:
         if os.path.isdir(url):
@@ -521,17 +554,8 @@ def git_archive_all(path, name, url, branch, force_module, force_fullclone, conf
                 print_debug(f"absolute_file_path: {absolute_file_path}")
                 print_debug(f"absolute_url_file: {absolute_url_file}")
             try:
-                process = subprocess.run(
-                    f"tar --create --exclude=.github --exclude=.git --file=- {os.path.basename(clone_path_norm)}/ | pigz -9 -p 20 > {absolute_file_path}",
-                    check=True,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    universal_newlines=True,
-                    cwd=os.path.dirname(clone_path_norm),
-                )
-            except subprocess.CalledProcessError as err:
+                compress.archive_tree(clone_path_norm, os.path.basename(clone_path_norm), absolute_file_path, exclude=(".github", ".git"))
+            except (OSError, subprocess.CalledProcessError, RuntimeError) as err:
                 if is_fatal:
                     remove_clone_archive(path, clone_path, is_fatal)
                     print_fatal(f"Unable to archive {clone_path} in {clone_file} from {url}: {err}")
@@ -21,18 +21,33 @@
 # exact matches on hashes of the COPYING file
 #
 
+import concurrent.futures
+import hashlib
+import json
 import os
 import re
 import shlex
 import sys
+import threading
+import time
 import urllib.parse
 
 import chardet
 import download
+import srcindex
+import util
 
-from util import get_contents, get_sha1sum, print_fatal, print_warning
+from util import get_contents, print_fatal, print_warning
 
 default_license = "TO BE DETERMINED"
+# How long license server answers are reused, in seconds
+license_cache_ttl = 7 * 24 * 3600
+# Concurrent license server queries
+license_fetch_workers = 8
+# Read size when hashing candidate license files
+license_hash_chunk = 1024 * 1024
+# Hash candidate license files in a thread pool from this many files on
+license_hash_pool_min_jobs = 16
 
 licenses = []
 license_files = []
@@ -77,7 +92,7 @@ def add_license(lic, translations, blacklist):
 
 
 def decode_license(license):
-    """Try and decode the license string."""
+    """Try and decode the license string, falling back to chardet when it isn't UTF-8."""
     def try_with_charset(license, charset):
         if not charset:
             return
@@ -91,35 +106,136 @@ def decode_license(license):
                 if b'\xd2' in license and b'\xd3' in license:
                     return try_with_charset(license, 'mac_roman')
 
+    try:
+        return license.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+
     return try_with_charset(license, chardet.detect(license)['encoding'])
 
 
-def license_from_copying_hash(copying, srcdir, config, name):
-    """Add licenses based on the hash of the copying file."""
+def hash_license_candidate(copying):
+    """Return (path, sha1) for a candidate license file, or None if it can't be one.
+
+    The file is hashed in chunks; its text is only read again when it has
+    to be decoded.
+    """
+    sh = hashlib.sha1()
     try:
-        data = get_contents(copying)
+        with open(copying, "rb") as f:
+            chunk = f.read(license_hash_chunk)
+            if chunk.startswith(b'#!'):
+                # Not a license if this is a script
+                return None
+            while chunk:
+                sh.update(chunk)
+                chunk = f.read(license_hash_chunk)
     except FileNotFoundError:
         # LICENSE file is a bad symlink (qemu-4.2.0!)
-        return
+        return None
+    return copying, sh.hexdigest()
 
-    if data.startswith(b'#!'):
-        # Not a license if this is a script
-        return
 
-    data = decode_license(data)
-    if not data:
-        return
+def hash_license_candidates(copyings):
+    """Hash the candidate license files, in parallel for large trees, keeping their order."""
+    if len(copyings) < license_hash_pool_min_jobs:
+        return [c for c in map(hash_license_candidate, copyings) if c]
+    # hashlib releases the GIL while hashing, and reading is I/O bound
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        return [c for c in executor.map(hash_license_candidate, copyings) if c]
 
-    hash_sum = get_sha1sum(copying)
 
-    if config.license_fetch:
-        values = {'hash': hash_sum, 'text': data, 'package': name}
-        data = urllib.parse.urlencode(values)
-        data = data.encode('utf-8')
+def license_cache_path(server, hash_sum):
+    """Return the cache file holding the answer of server for hash_sum."""
+    server_id = hashlib.sha1(server.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(util.get_cache_dir("licenses"), f"{hash_sum}-{server_id}.json")
 
-        buffer = download.do_curl(config.license_fetch, post=data, is_fatal=True)
-        response = buffer.getvalue()
-        page = response.decode('utf-8').strip()
+
+def read_license_cache(server, hash_sum):
+    """Return the cached answer of server for hash_sum, or None if missing or expired."""
+    try:
+        with open(license_cache_path(server, hash_sum), "r") as cache_f:
+            entry = json.load(cache_f)
+        if time.time() - entry["time"] < license_cache_ttl:
+            return entry["license"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_license_cache(server, hash_sum, page):
+    """Store the answer of server for hash_sum."""
+    path = license_cache_path(server, hash_sum)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "w") as cache_f:
+            json.dump({"license": page, "time": time.time()}, cache_f)
+        os.replace(tmp_path, path)
+    except OSError as err:
+        print_warning(f"Unable to write license cache {path}: {err}")
+
+
+def query_license_server(server, hash_sum, text, name):
+    """POST one license text to the license server and return its answer."""
+    values = {'hash': hash_sum, 'text': text, 'package': name}
+    data = urllib.parse.urlencode(values)
+    data = data.encode('utf-8')
+
+    buffer = download.do_curl(server, post=data, is_fatal=True)
+    response = buffer.getvalue()
+    return response.decode('utf-8').strip()
+
+
+def fetch_license_pages(candidates, config, name):
+    """Get the license server answer for every distinct hash in candidates.
+
+    Answers are looked up in the license cache first. The remaining hashes
+    are sent to the server once each, at most license_fetch_workers at a
+    time, using the text of the first candidate with that hash. Returns a
+    dict of hash to answer; undecodable texts are left out.
+    """
+    pages = {}
+    queries = {}
+    for copying, hash_sum in candidates:
+        if hash_sum in pages or hash_sum in queries:
+            continue
+        page = read_license_cache(config.license_fetch, hash_sum)
+        if page is not None:
+            pages[hash_sum] = page
+            continue
+        text = decode_license(get_contents(copying))
+        if text:
+            queries[hash_sum] = text
+
+    if not queries:
+        return pages
+
+    workers = min(license_fetch_workers, len(queries))
+    if workers > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {hash_sum: executor.submit(query_license_server, config.license_fetch, hash_sum, text, name)
+                       for hash_sum, text in queries.items()}
+            answers = {hash_sum: future.result() for hash_sum, future in futures.items()}
+    else:
+        answers = {hash_sum: query_license_server(config.license_fetch, hash_sum, text, name)
+                   for hash_sum, text in queries.items()}
+
+    for hash_sum, page in answers.items():
+        # Unknown hashes may be entered on the server at any time, so only
+        # actual answers are kept
+        if page:
+            write_license_cache(config.license_fetch, hash_sum, page)
+        pages[hash_sum] = page
+    return pages
+
+
+def apply_license_candidate(candidate, srcdir, config, pages):
+    """Add the licenses of a candidate from the server answers in pages or the known hashes."""
+    copying, hash_sum = candidate
+    if config.license_fetch:
+        if hash_sum not in pages:
+            return
+        page = pages[hash_sum]
         if page:
             print("License     : ", page, " (server) (", hash_sum, ")")
             process_licenses(page, config.license_translations, config.license_blacklist)
@@ -143,12 +259,27 @@ def license_from_copying_hash(copying, srcdir, config, name):
     else:
         if not config.license_show:
             return
+        if not decode_license(get_contents(copying)):
+            return
         print_warning("Unknown license {0} with hash {1}".format(copying, hash_sum))
         hash_url = config.license_show % {'HASH': hash_sum}
         print_warning("Visit {0} to enter".format(hash_url))
 
 
-def scan_for_licenses(srcdir, config, pkg_name):
+def licenses_from_copying_hashes(copyings, srcdir, config, name):
+    """Add licenses based on the hashes of the copying files, in order."""
+    candidates = hash_license_candidates(copyings)
+    pages = fetch_license_pages(candidates, config, name) if config.license_fetch else {}
+    for candidate in candidates:
+        apply_license_candidate(candidate, srcdir, config, pages)
+
+
+def license_from_copying_hash(copying, srcdir, config, name):
+    """Add licenses based on the hash of the copying file."""
+    licenses_from_copying_hashes([copying], srcdir, config, name)
+
+
+def scan_for_licenses(srcdir, config, pkg_name, index=None):
     """Scan the project directory for things we can use to guess a description and summary."""
     targets = ["copyright",
                "copyright.txt",
@@ -164,11 +295,11 @@ def scan_for_licenses(srcdir, config, pkg_name):
     # look for files that start with copying or licen[cs]e (but are
     # not likely scripts) or end with licen[cs]e
     target_pat = re.compile(r"^((copying)|(licen[cs]e)|(e[dp]l-v\d+))|(licen[cs]e)(\.(txt|xml))?$")
-    for dirpath, dirnames, files in os.walk(srcdir):
+    copyings = []
+    for dirpath, dirnames, files in srcindex.walk(srcdir, index):
         for name in files:
             if name.lower() in targets or target_pat.search(name.lower()):
-                license_from_copying_hash(os.path.join(dirpath, name),
-                                          srcdir, config, pkg_name)
+                copyings.append(os.path.join(dirpath, name))
             # Also search for license texts in project trees that are
             # REUSE-compliant, or are in process of adopting this standard (for
             # example, KDE ecosystem packages). See https://reuse.software for
@@ -180,8 +311,8 @@ def scan_for_licenses(srcdir, config, pkg_name):
             # named `license` instead.
             dirbase = os.path.basename(dirpath)
             if re.search(r'^(LICENSES|license)$', dirbase) and re.search(r'\.txt$', name):
-                license_from_copying_hash(os.path.join(dirpath, name),
-                                          srcdir, config, pkg_name)
+                copyings.append(os.path.join(dirpath, name))
+    licenses_from_copying_hashes(copyings, srcdir, config, pkg_name)
 
     if not licenses:
         print_fatal(" Cannot find any license or a valid {}.license file!\n".format(pkg_name))
@@ -0,0 +1,162 @@
+#!/bin/true
+#
+# loganalyzer.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Single pass over a build log: every line is handed to a list of
+# consumers (buildreq detection, %files listing, configure misses, test
+# counts, warnings) so the log is read once per round. A log can also be
+# followed while mock is still writing it.
+
+import os
+import threading
+
+import events
+import util
+
+# Build log contents worth a warning
+warning_patterns = [
+    "march=native",
+]
+
+
+class LogConsumer(object):
+    """Receives the lines of a log from analyze_log."""
+
+    def feed(self, line):
+        """Handle a line of the log."""
+
+    def finish(self):
+        """Handle the end of the log."""
+
+
+class WarningPatterns(LogConsumer):
+    """Warn once about each of warning_patterns found in the log."""
+
+    def __init__(self, patterns=None):
+        """Look for patterns, warning_patterns by default."""
+        self.patterns = list(warning_patterns if patterns is None else patterns)
+
+    def feed(self, line):
+        """Warn about the patterns in line not seen yet."""
+        for pat in list(self.patterns):
+            if pat in line:
+                util.print_warning("Build log contains: {}".format(pat))
+                self.patterns.remove(pat)
+
+
+def analyze_log(filename, consumers):
+    """Stream the log in filename once through all consumers, then finish them in order.
+
+    The events emitted meanwhile are tagged with the log name and line number.
+    """
+    feeds = [consumer.feed for consumer in consumers]
+    sink = events.sink
+    if sink:
+        sink.log = os.path.basename(filename)
+    try:
+        with util.open_auto(filename, "r") as logf:
+            if sink:
+                for sink.line, line in enumerate(logf, 1):
+                    for feed in feeds:
+                        feed(line)
+            else:
+                for line in logf:
+                    for feed in feeds:
+                        feed(line)
+        for consumer in consumers:
+            consumer.finish()
+    finally:
+        if sink:
+            sink.log = sink.line = None
+
+
+class LogFollower(threading.Thread):
+    """Feed the lines appended to a log to consumers while it is being written.
+
+    Content already in the file when the follower is created is skipped,
+    unless the file is replaced or truncated in the meantime.
+    """
+
+    def __init__(self, filename, consumers, interval=0.2):
+        """Follow filename, polling every interval seconds."""
+        super().__init__(daemon=True)
+        self.filename = filename
+        self.consumers = consumers
+        self.interval = interval
+        self.stopped = threading.Event()
+        try:
+            st = os.stat(filename)
+            self.skip = (st.st_ino, st.st_size)
+        except OSError:
+            self.skip = None
+
+    def open_log(self):
+        """Open the log past the content to skip, or return None if it doesn't exist yet."""
+        try:
+            logf = open(self.filename, "rb")
+        except FileNotFoundError:
+            return None
+        if self.skip:
+            st = os.fstat(logf.fileno())
+            if st.st_ino == self.skip[0] and st.st_size >= self.skip[1]:
+                logf.seek(self.skip[1])
+            self.skip = None
+        return logf
+
+    def replaced(self, logf):
+        """Return True if the log at filename is no longer the file open as logf."""
+        try:
+            return os.stat(self.filename).st_ino != os.fstat(logf.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def run(self):
+        """Feed the new lines until stopped, then finish the consumers."""
+        feeds = [consumer.feed for consumer in self.consumers]
+        logf = None
+        partial = b""
+        try:
+            while True:
+                stopping = self.stopped.is_set()
+                if not logf:
+                    logf = self.open_log()
+                if logf:
+                    for data in iter(logf.readline, b""):
+                        if not data.endswith(b"\n") and not stopping:
+                            partial += data
+                            continue
+                        line = (partial + data).decode("utf-8", errors="surrogateescape")
+                        partial = b""
+                        for feed in feeds:
+                            feed(line)
+                    if self.replaced(logf):
+                        logf.close()
+                        logf = None
+                        partial = b""
+                        continue
+                if stopping:
+                    break
+                self.stopped.wait(self.interval)
+        finally:
+            if logf:
+                logf.close()
+        for consumer in self.consumers:
+            consumer.finish()
+
+    def stop(self):
+        """Read what is left of the log and wait for the consumers to finish."""
+        self.stopped.set()
+        self.join()
@@ -19,42 +19,43 @@
 import os
 import re
 
-from util import print_fatal, write_out
+import loganalyzer
+from util import print_fatal, print_warning, write_out
 
+configure_miss_pat = re.compile(r"^checking (?:for )?(.*?)\.\.\. no")
 
-def logcheck(pkg_loc):
-    """Try to discover configuration options that were automatically switched off."""
-    log = os.path.join(pkg_loc, 'results', 'build.log')
-    if not os.path.exists(log):
-        print('build log is missing, unable to perform logcheck.')
-        return
 
-    whitelist = []
-    file_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(file_dir, 'configure_whitelist')
-    with open(file_path, "r") as whitelistf:
-        for line in whitelistf:
+def load_configure_list(name):
+    """Return the set of entries in the configure_whitelist or configure_blacklist file."""
+    entries = set()
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    with open(file_path, "r") as listf:
+        for line in listf:
             if line.startswith("#"):
                 continue
-            whitelist.append(line.rstrip())
+            entries.add(line.rstrip())
+    return entries
 
-    blacklist = []
-    file_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(file_dir, 'configure_blacklist')
-    with open(file_path, "r") as blacklistf:
-        for line in blacklistf:
-            if line.startswith("#"):
-                continue
-            blacklist.append(line.rstrip())
 
-    with open(log, 'r') as logf:
-        lines = logf.readlines()
+class ConfigureMisses(loganalyzer.LogConsumer):
+    """Collect the configuration options of a build log that were automatically switched off.
+
+    With strict set, a blacklisted miss is fatal; otherwise it is only
+    reported and recorded.
+    """
 
-    pat = re.compile(r"^checking (?:for )?(.*?)\.\.\. no")
-    misses = []
-    for line in lines:
+    def __init__(self, pkg_loc, strict=True):
+        """Write the misses to pkg_loc."""
+        self.pkg_loc = pkg_loc
+        self.strict = strict
+        self.whitelist = load_configure_list('configure_whitelist')
+        self.blacklist = load_configure_list('configure_blacklist')
+        self.misses = []
+
+    def feed(self, line):
+        """Record a configure miss in line."""
         match = None
-        m = pat.search(line)
+        m = configure_miss_pat.search(line)
         if m:
             match = m.group(1)
 
@@ -64,22 +65,35 @@ def logcheck(pkg_loc):
         if "warning: format not a string literal" in line:
             match = line
 
-        if not match or match in whitelist:
-            continue
+        if not match or match in self.whitelist:
+            return
 
-        if match in blacklist:
-            print_fatal("Blacklisted configure-miss is forbidden: " + match)
-            misses.append("Blacklisted configure-miss is forbidden: " + match)
-            write_misses(pkg_loc, misses)
-            exit(1)
+        if match in self.blacklist:
+            self.misses.append("Blacklisted configure-miss is forbidden: " + match)
+            if self.strict:
+                print_fatal("Blacklisted configure-miss is forbidden: " + match)
+                write_misses(self.pkg_loc, self.misses)
+                exit(1)
+            print_warning("Blacklisted configure-miss is forbidden: " + match)
+            return
 
         print("Configure miss: " + match)
-        misses.append("Configure miss: " + match)
+        self.misses.append("Configure miss: " + match)
+
+    def finish(self):
+        """Write the configure_misses file if there were any."""
+        if self.misses:
+            write_misses(self.pkg_loc, self.misses)
 
-    if not misses:
+
+def logcheck(pkg_loc):
+    """Try to discover configuration options that were automatically switched off."""
+    log = os.path.join(pkg_loc, 'results', 'build.log')
+    if not os.path.exists(log):
+        print('build log is missing, unable to perform logcheck.')
         return
 
-    write_misses(pkg_loc, misses)
+    loganalyzer.analyze_log(log, [ConfigureMisses(pkg_loc)])
 
 
 def write_misses(pkg_loc, misses):
@@ -1,30 +1,103 @@
 #!/usr/bin/env python3
 
+import configparser
+import email.parser
 import json
 import os
-import subprocess
+import re
 import sys
-import tempfile
+import time
+import urllib.parse
 
 import download
+import toml
 import util
 
+# How long PyPI JSON API answers are reused, in seconds
+pypi_cache_ttl = 24 * 3600
+# How long pypi name lookups are reused, in seconds
+pypi_name_ttl = 30 * 24 * 3600
+pypi_miss_ttl = 24 * 3600
+# Exported PyPI index answering name lookups offline
+pypi_index_file = os.environ.get("AUTOSPEC_PYPI_INDEX")
+pypi_index = None
+requirement_name_re = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
 
-def pip_env():
-    """Generate a copy of os.environ appropriate for pip."""
-    env = os.environ.copy()
-    env["PYTHON_KEYRING_BACKEND"] = "keyring.backends.null.Keyring"
-    return env
 
+def load_pypi_index(path):
+    """Load the normalized project names of an exported PyPI index.
 
-def pkg_search(name):
-    """Query the pypi json API for name and return True if found."""
-    query = f"https://pypi.org/pypi/{name}/json/"
-    resp = download.do_curl(query)
-    if resp is not None:
-        return True
+    The file is either the JSON form of the PyPI simple index
+    ({"projects": [{"name": ...}, ...]}) or one project name per line.
+    """
+    with util.open_auto(path, "r") as ifile:
+        content = ifile.read()
+    if content.lstrip().startswith("{"):
+        names = [project["name"] for project in json.loads(content).get("projects", [])]
     else:
+        names = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+    return set(normalize_name(name) for name in names)
+
+
+def get_pypi_index():
+    """Return the names of the PyPI index file in AUTOSPEC_PYPI_INDEX, or None if not set."""
+    global pypi_index
+    if pypi_index is None and pypi_index_file:
+        try:
+            pypi_index = load_pypi_index(pypi_index_file)
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            util.print_warning(f"Unable to load pypi index {pypi_index_file}: {err}")
+            pypi_index = set()
+    return pypi_index
+
+
+def name_cache_path(name):
+    """Return the cache file of the pypi lookup of name."""
+    return os.path.join(util.get_cache_dir("pypi-names"), urllib.parse.quote(name, safe="") + ".json")
+
+
+def read_name_cache(name):
+    """Return the cached pypi lookup of name, or None if missing or expired."""
+    try:
+        with open(name_cache_path(name), "r") as cfile:
+            entry = json.load(cfile)
+        ttl = pypi_name_ttl if entry["found"] else pypi_miss_ttl
+        if time.time() - entry["time"] < ttl:
+            return entry["found"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_name_cache(name, found):
+    """Store the pypi lookup of name."""
+    path = name_cache_path(name)
+    try:
+        util.write_out(path, json.dumps({"found": found, "time": time.time()}))
+    except OSError as err:
+        util.print_warning(f"Unable to write pypi cache {path}: {err}")
+
+
+def pkg_search(name):
+    """Query the pypi json API for name and return True if found.
+
+    An index file from AUTOSPEC_PYPI_INDEX answers without any network
+    access. Otherwise answers, including misses, are cached; failures to
+    reach pypi are not.
+    """
+    index = get_pypi_index()
+    if index is not None:
+        return normalize_name(name) in index
+    found = read_name_cache(name)
+    if found is not None:
+        return found
+    status = download.do_curl_status(f"https://pypi.org/pypi/{name}/json/")
+    if status is None:
         return False
+    found = status == 200
+    if found or status == 404:
+        write_name_cache(name, found)
+    return found
 
 
 def get_pypi_name(name, miss=False):
@@ -47,72 +120,204 @@ def get_pypi_name(name, miss=False):
     return name
 
 
-def _print_command_error(cmd, proc):
-    if isinstance(cmd, list):
-        cmd = " ".join(cmd)
-    util.print_error(f"Command `{cmd}` failed:")
-    for line in proc.stderr.decode('utf-8', errors='surrogateescape').splitlines():
-        util.print_error(line)
-
-
-def get_pypi_metadata(name):
-    """Get metadata for a pypi package."""
-    show = []
-    # Create virtenv to do the pip install (needed for pip show)
-    with tempfile.TemporaryDirectory() as tdir:
-        cmd = ["virtualenv", "--no-periodic-update", tdir]
-        proc = subprocess.run(cmd, capture_output=True)
-        if proc.returncode != 0:
-            _print_command_error(cmd, proc)
-            return ""
-        cmd = f"source bin/activate && pip install {name}"
-        proc = subprocess.run(cmd, cwd=tdir, shell=True, capture_output=True,
-                              env=pip_env())
-        if proc.returncode != 0:
-            _print_command_error(cmd, proc)
-            return ""
-        cmd = f"source bin/activate &> /dev/null && pip show {name}"
-        proc = subprocess.run(cmd, cwd=tdir, shell=True, capture_output=True,
-                              env=pip_env())
-        if proc.returncode != 0:
-            _print_command_error(cmd, proc)
-            return ""
-        show = proc.stdout.decode('utf-8', errors='surrogateescape').splitlines()
-    # Parse pip show for relevent information
+def normalize_name(name):
+    """Normalize a python package name: lowercase with dashes as underscores."""
+    return name.strip().lower().replace('-', '_')
+
+
+def requirement_name(req):
+    """Return the normalized package name of a requirement, or "" if it only applies to an extra."""
+    req, _, marker = req.partition(";")
+    if "extra" in marker:
+        return ""
+    match = requirement_name_re.match(req.strip())
+    return normalize_name(match.group(0)) if match else ""
+
+
+def requirement_names(reqs):
+    """Return the normalized names of reqs, skipping extras and duplicates."""
+    names = []
+    for req in reqs:
+        name = requirement_name(req)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def pkg_info_metadata(path):
+    """Read the metadata of a PKG-INFO (or METADATA) file."""
+    try:
+        with util.open_auto(path, "r") as pfile:
+            msg = email.parser.Parser().parse(pfile, headersonly=True)
+    except OSError:
+        return {}
     metadata = {}
-    for line in show:
-        if line.startswith("Name: "):
-            # 'Name: pypi-name'
-            # normalize names -> lowercase and dash to underscore
-            metadata["name"] = line.split()[1].lower().replace('-', '_')
-        elif line.startswith("Summary: "):
-            # 'Summary: <description of the package>'
-            try:
-                metadata["summary"] = line.split(maxsplit=1)[1]
-            except IndexError:
-                # No Summary (haven't seen this case before though)
-                metadata["summary"] = ""
-        elif line.startswith("Requires: "):
-            # 'Requires: dep1, dep2
-            # normalize names -> lowercase and dash to underscore
-            try:
-                reqs = [item.strip().lower().replace('-', '_') for item in line.split(maxsplit=1)[1].split(",")]
-            except IndexError:
-                # No Requires
-                reqs = []
-            metadata["requires"] = reqs
+    if msg.get("Name"):
+        metadata["name"] = normalize_name(msg["Name"])
+    if msg.get("Summary") and msg["Summary"].strip() != "UNKNOWN":
+        metadata["summary"] = msg["Summary"].strip()
+    if msg.get("License") and msg["License"].strip() != "UNKNOWN":
+        metadata["license"] = msg["License"].strip()
+    if msg.get_all("Requires-Dist"):
+        metadata["requires"] = requirement_names(msg.get_all("Requires-Dist"))
+    return metadata
+
 
+def pyproject_metadata(path):
+    """Read the metadata of the [project] table of a pyproject.toml file."""
+    try:
+        with util.open_auto(path, "r") as pfile:
+            project = toml.loads(pfile.read()).get("project", {})
+    except (OSError, toml.TomlDecodeError):
+        return {}
+    metadata = {}
+    if isinstance(project.get("name"), str):
+        metadata["name"] = normalize_name(project["name"])
+    if isinstance(project.get("description"), str):
+        metadata["summary"] = project["description"].strip()
+    lic = project.get("license")
+    if isinstance(lic, dict):
+        lic = lic.get("text")
+    if isinstance(lic, str):
+        metadata["license"] = lic.strip()
+    if isinstance(project.get("dependencies"), list):
+        metadata["requires"] = requirement_names(project["dependencies"])
+    return metadata
+
+
+def setup_cfg_metadata(path):
+    """Read the metadata and install_requires of a setup.cfg file."""
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        parser.read(path)
+    except configparser.Error:
+        return {}
+    metadata = {}
+    if parser.get("metadata", "name", fallback=""):
+        metadata["name"] = normalize_name(parser.get("metadata", "name"))
+    for key, field in (("summary", "description"), ("license", "license")):
+        value = parser.get("metadata", field, fallback="").strip()
+        # file: and attr: values need the build backend to resolve
+        if value and not value.startswith(("file:", "attr:")):
+            metadata[key] = value
+    reqs = parser.get("options", "install_requires", fallback="")
+    if reqs:
+        metadata["requires"] = requirement_names(reqs.splitlines())
+    return metadata
+
+
+def egg_info_requires(path):
+    """Read the unconditional requirements of an egg-info requires.txt file."""
+    reqs = []
+    try:
+        with util.open_auto(path, "r") as rfile:
+            for line in rfile:
+                if line.startswith("["):
+                    # extras and environment markers follow
+                    break
+                reqs.append(line)
+    except OSError:
+        return {}
+    return {"requires": requirement_names(reqs)}
+
+
+def local_metadata_files(srcdir):
+    """Return (kind, path) for the metadata files of an extracted sdist, most authoritative first."""
+    files = []
+    for name, kind in (("PKG-INFO", "pkg_info"), ("pyproject.toml", "pyproject"), ("setup.cfg", "setup_cfg")):
+        path = os.path.join(srcdir, name)
+        if os.path.isfile(path):
+            files.append((kind, path))
+    for topdir in (srcdir, os.path.join(srcdir, "src")):
+        try:
+            names = sorted(os.listdir(topdir))
+        except OSError:
+            continue
+        for name in names:
+            egg_dir = os.path.join(topdir, name)
+            if not name.endswith(".egg-info") or not os.path.isdir(egg_dir):
+                continue
+            if os.path.isfile(os.path.join(egg_dir, "PKG-INFO")):
+                files.append(("pkg_info", os.path.join(egg_dir, "PKG-INFO")))
+            if os.path.isfile(os.path.join(egg_dir, "requires.txt")):
+                files.append(("egg_requires", os.path.join(egg_dir, "requires.txt")))
+    return files
+
+
+def get_local_metadata(srcdir):
+    """Get the metadata of an extracted sdist without installing it.
+
+    Each field is taken from the most authoritative file that has it:
+    PKG-INFO, then pyproject.toml [project], setup.cfg and egg-info.
+    """
+    readers = {"pkg_info": pkg_info_metadata,
+               "pyproject": pyproject_metadata,
+               "setup_cfg": setup_cfg_metadata,
+               "egg_requires": egg_info_requires}
+    metadata = {}
+    for kind, path in local_metadata_files(srcdir):
+        for key, value in readers[kind](path).items():
+            if value and key not in metadata:
+                metadata[key] = value
+    return metadata
+
+
+def pypi_json_metadata(name):
+    """Get the metadata of name from the PyPI JSON API, using the pypi cache."""
+    cache_file = os.path.join(util.get_cache_dir("pypi"), f"{normalize_name(name)}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_file) < pypi_cache_ttl:
+            with open(cache_file, "r") as cfile:
+                return json.load(cfile)
+    except (OSError, ValueError):
+        pass
+
+    resp = download.do_curl(f"https://pypi.org/pypi/{name}/json")
+    if resp is None:
+        return {}
+    try:
+        info = json.loads(resp.getvalue().decode('utf-8'))["info"]
+    except (ValueError, KeyError, UnicodeDecodeError):
+        return {}
+    metadata = {}
+    if info.get("name"):
+        metadata["name"] = normalize_name(info["name"])
+    if info.get("summary"):
+        metadata["summary"] = info["summary"].strip()
+    if info.get("license"):
+        metadata["license"] = info["license"].strip()
+    metadata["requires"] = requirement_names(info.get("requires_dist") or [])
+    try:
+        util.write_out(cache_file, json.dumps(metadata))
+    except OSError as err:
+        util.print_warning(f"Unable to write pypi cache {cache_file}: {err}")
+    return metadata
+
+
+def get_pypi_metadata(name, srcdir=None):
+    """Get metadata for a pypi package.
+
+    The metadata is read from the extracted sources in srcdir when they
+    carry it, otherwise from the PyPI JSON API.
+    """
+    metadata = get_local_metadata(srcdir) if srcdir else {}
+    if not metadata.get("name") and name:
+        metadata = pypi_json_metadata(name)
+    if not metadata:
+        return ""
+    metadata.setdefault("requires", [])
     return json.dumps(metadata)
 
 
 def main():
-    """Standalone pypi metadata query entry point."""
+    """Standalone pypi metadata query entry point: pypidata.py name [srcdir]."""
     pkg_name = sys.argv[1]
+    srcdir = sys.argv[2] if len(sys.argv) > 2 else None
     pypi_name = get_pypi_name(pkg_name)
     if not pypi_name:
         print(f"Couldn't find {pkg_name} in pypi")
         sys.exit(1)
-    pypi_metadata = get_pypi_metadata(pypi_name)
+    pypi_metadata = get_pypi_metadata(pypi_name, srcdir)
     print(pypi_metadata)
 
 
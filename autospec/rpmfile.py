@@ -0,0 +1,218 @@
+#!/bin/true
+#
+# rpmfile.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Streaming reader for binary RPMs: parses the lead, signature and main
+# headers, decompresses the payload and iterates over its cpio (newc)
+# members without writing anything to disk.
+
+import bz2
+import contextlib
+import gzip
+import lzma
+import os
+import stat
+import struct
+import subprocess
+
+import util
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LEAD_SIZE = 96
+LEAD_MAGIC = b"\xed\xab\xee\xdb"
+HEADER_MAGIC = b"\x8e\xad\xe8\x01"
+
+RPMTAG_PAYLOADFORMAT = 1124
+RPMTAG_PAYLOADCOMPRESSOR = 1125
+RPM_STRING_TYPE = 6
+
+CPIO_HEADER_SIZE = 110
+CPIO_MAGICS = (b"070701", b"070702")
+CPIO_TRAILER = "TRAILER!!!"
+
+# Payload compressors, by their leading bytes, for packages without the tag
+payload_magics = ((b"\x1f\x8b", "gzip"), (b"\xfd7zXZ\x00", "xz"), (b"\x28\xb5\x2f\xfd", "zstd"),
+                  (b"BZh", "bzip2"), (b"\x5d\x00\x00", "lzma"))
+
+
+class RpmError(Exception):
+    """Raised when an RPM can't be read."""
+
+
+def read_exact(stream, size):
+    """Read exactly size bytes from stream."""
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise RpmError("unexpected end of data")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_header(stream):
+    """Read an RPM header structure, returning its string tags and its size."""
+    intro = read_exact(stream, 16)
+    if intro[:4] != HEADER_MAGIC:
+        raise RpmError("bad header magic")
+    nindex, hsize = struct.unpack(">II", intro[8:16])
+    index = read_exact(stream, nindex * 16)
+    store = read_exact(stream, hsize)
+    tags = {}
+    for i in range(nindex):
+        tag, tag_type, offset, _ = struct.unpack_from(">IIII", index, i * 16)
+        if tag_type == RPM_STRING_TYPE and offset < hsize:
+            end = store.find(b"\0", offset)
+            tags[tag] = store[offset:end if end >= 0 else hsize].decode("utf-8", errors="surrogateescape")
+    return tags, 16 + nindex * 16 + hsize
+
+
+def read_headers(stream):
+    """Skip the lead and the signature of an RPM and return its main header tags."""
+    lead = read_exact(stream, LEAD_SIZE)
+    if lead[:4] != LEAD_MAGIC:
+        raise RpmError("not an RPM file")
+    _, size = read_header(stream)
+    # The signature header is padded to a multiple of 8 bytes
+    read_exact(stream, (8 - size % 8) % 8)
+    tags, _ = read_header(stream)
+    return tags
+
+
+class PeekStream(object):
+    """File-like wrapper giving back bytes already read from stream."""
+
+    def __init__(self, stream, head):
+        """Serve head before the rest of stream."""
+        self.stream = stream
+        self.head = head
+
+    def read(self, size=-1):
+        """Read up to size bytes."""
+        if self.head:
+            if size < 0:
+                data, self.head = self.head + self.stream.read(), b""
+                return data
+            data, self.head = self.head[:size], self.head[size:]
+            return data
+        return self.stream.read(size)
+
+
+@contextlib.contextmanager
+def open_payload(path):
+    """Open the decompressed cpio payload of the RPM at path as a binary stream."""
+    with open(path, "rb") as f:
+        tags = read_headers(f)
+        if tags.get(RPMTAG_PAYLOADFORMAT, "cpio") != "cpio":
+            raise RpmError(f"unsupported payload format {tags[RPMTAG_PAYLOADFORMAT]}")
+        head = f.read(6)
+        compressor = tags.get(RPMTAG_PAYLOADCOMPRESSOR)
+        if not compressor:
+            compressor = next((name for magic, name in payload_magics if head.startswith(magic)), "")
+        raw = PeekStream(f, head)
+        if compressor == "gzip":
+            with gzip.GzipFile(fileobj=raw) as payload:
+                yield payload
+        elif compressor in ("xz", "lzma"):
+            with lzma.LZMAFile(raw) as payload:
+                yield payload
+        elif compressor == "bzip2":
+            with bz2.BZ2File(raw) as payload:
+                yield payload
+        elif compressor == "zstd" and zstandard:
+            with zstandard.ZstdDecompressor().stream_reader(raw) as payload:
+                yield payload
+        elif compressor == "zstd" and util.binary_in_path("zstd"):
+            # The child reads the descriptor itself, so move the OS offset
+            # back to the payload start rather than the buffered position
+            os.lseek(f.fileno(), f.tell() - len(head), os.SEEK_SET)
+            proc = subprocess.Popen(["zstd", "-dc"], stdin=f.fileno(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                yield proc.stdout
+            finally:
+                proc.stdout.close()
+                proc.kill()
+                proc.wait()
+        else:
+            raise RpmError(f"unsupported payload compressor {compressor or 'unknown'}")
+
+
+class CpioEntry(object):
+    """A member of a cpio archive whose data is read from the archive stream."""
+
+    def __init__(self, stream, name, mode, ino, nlink, size):
+        """Describe the member name, size bytes of which follow in stream."""
+        self.stream = stream
+        self.name = name
+        self.mode = mode
+        self.ino = ino
+        self.nlink = nlink
+        self.size = size
+        self.remaining = size
+
+    def isreg(self):
+        """Return True for regular files."""
+        return stat.S_ISREG(self.mode)
+
+    def read(self, size=-1):
+        """Read up to size bytes of the member data, all of it by default."""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = read_exact(self.stream, size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def skip(self):
+        """Discard the unread member data."""
+        while self.remaining:
+            self.read(min(self.remaining, 1024 * 1024))
+
+
+def iter_cpio(stream):
+    """Generate a CpioEntry for every member of a newc cpio stream.
+
+    Member names are made absolute (./usr/lib -> /usr/lib). Data left
+    unread by the caller is skipped when the next member is requested.
+    """
+    while True:
+        header = read_exact(stream, CPIO_HEADER_SIZE)
+        if header[:6] not in CPIO_MAGICS:
+            raise RpmError("unsupported cpio format {}".format(header[:6]))
+        fields = [int(header[6 + 8 * i:14 + 8 * i], 16) for i in range(13)]
+        ino, mode, _, _, nlink, _, size, _, _, _, _, namesize, _ = fields
+        name = read_exact(stream, namesize)[:-1].decode("utf-8", errors="surrogateescape")
+        read_exact(stream, (4 - (CPIO_HEADER_SIZE + namesize) % 4) % 4)
+        if name == CPIO_TRAILER:
+            return
+        if name.startswith("."):
+            name = name[1:]
+        if not name.startswith("/"):
+            name = "/" + name
+        entry = CpioEntry(stream, name, mode, ino, nlink, size)
+        yield entry
+        entry.skip()
+        read_exact(stream, (4 - size % 4) % 4)
+
+
+def iter_rpm_files(path):
+    """Generate a CpioEntry for every member of the payload of the RPM at path."""
+    with open_payload(path) as payload:
+        yield from iter_cpio(payload)
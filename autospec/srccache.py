@@ -0,0 +1,150 @@
+#!/bin/true
+#
+# srccache.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Opt-in cache of extracted source trees, keyed by the sha1 of the archive
+# as written to the upstream file. A cached tree is materialized into the
+# working directory with reflinks where the filesystem supports them, a
+# plain copy otherwise, so repeated runs on the same tarball skip the
+# decompression. Files are never hardlinked: with --prep-only the working
+# directory is left for the user to edit, and an in-place edit must not
+# reach the cached tree.
+
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+
+import util
+from util import print_debug, print_warning
+
+size_units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(size_str):
+    """Convert a size such as 500M or 20G to bytes."""
+    size_str = size_str.strip().upper().rstrip("B")
+    unit = size_str[-1:] if size_str[-1:] in size_units else ""
+    number = size_str[:len(size_str) - len(unit)]
+    try:
+        return int(float(number) * size_units[unit])
+    except ValueError:
+        raise ValueError(f"Invalid cache size: {size_str}")
+
+
+def tree_size(path):
+    """Return the apparent size of all regular files below path."""
+    size = 0
+    for entry in util.scantree(path):
+        if entry.is_file(follow_symlinks=False):
+            size += entry.stat(follow_symlinks=False).st_size
+    return size
+
+
+def copy_tree(src, dest):
+    """Populate dest with a copy of src, sharing file data copy-on-write when possible."""
+    os.makedirs(dest, exist_ok=True)
+    for cmd in (["cp", "-a", "--reflink=always"], ["cp", "-a"]):
+        try:
+            subprocess.run(cmd + [f"{src}/.", f"{dest}/"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if util.debugging:
+                print_debug(f"Materialized {src} in {dest} with {' '.join(cmd)}")
+            return
+        except subprocess.CalledProcessError:
+            continue
+    raise OSError(f"Unable to copy {src} to {dest}")
+
+
+class SourceCache(object):
+    """Size bounded store of extracted source trees."""
+
+    def __init__(self, max_size, cache_dir=None):
+        """Set up the cache location and its size limit in bytes."""
+        self.max_size = max_size
+        self.cache_dir = cache_dir or util.get_cache_dir("sources")
+
+    def entry_path(self, sha):
+        """Return the directory holding the tree extracted from sha."""
+        return os.path.join(self.cache_dir, sha)
+
+    def meta_path(self, sha):
+        """Return the metadata file of the entry for sha."""
+        return os.path.join(self.cache_dir, f"{sha}.json")
+
+    def add(self, sha, extract):
+        """Extract an archive into a new cache entry using extract(path)."""
+        tmp_path = os.path.join(self.cache_dir, f"{sha}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        try:
+            extract(tmp_path)
+            size = tree_size(tmp_path)
+            os.rename(tmp_path, self.entry_path(sha))
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        util.write_out(self.meta_path(sha), json.dumps({"size": size}))
+
+    def entries(self):
+        """Return (last use, size, sha) for every complete entry."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r") as f:
+                    size = json.load(f)["size"]
+                entries.append((entry.stat().st_mtime, size, entry.name[:-5]))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self, keep):
+        """Remove least recently used entries, other than keep, until under the size limit."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, sha in entries:
+            if total <= self.max_size:
+                break
+            if sha == keep:
+                continue
+            if util.debugging:
+                print_debug(f"Evicting {sha} ({size} bytes) from {self.cache_dir}")
+            os.remove(self.meta_path(sha))
+            shutil.rmtree(self.entry_path(sha), ignore_errors=True)
+            total -= size
+
+    def materialize(self, sha, extract, dest):
+        """Make the tree extracted from sha appear in dest.
+
+        The archive is extracted into the cache with extract(path) on the
+        first use only. On any cache error the archive is extracted straight
+        into dest instead.
+        """
+        try:
+            with open(os.path.join(self.cache_dir, ".lock"), "w") as lock_f:
+                fcntl.flock(lock_f, fcntl.LOCK_EX)
+                if not os.path.isfile(self.meta_path(sha)):
+                    shutil.rmtree(self.entry_path(sha), ignore_errors=True)
+                    self.add(sha, extract)
+                else:
+                    os.utime(self.meta_path(sha))
+                copy_tree(self.entry_path(sha), dest)
+                self.evict(sha)
+        except OSError as err:
+            print_warning(f"Unable to use source cache {self.cache_dir}: {err}")
+            extract(dest)
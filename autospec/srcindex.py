@@ -0,0 +1,108 @@
+#!/bin/true
+#
+# srcindex.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Index of the extracted source tree, built with a single scandir
+# traversal and shared by the static analyzers (build pattern, licenses,
+# description, changelogs and tests) instead of each walking the tree.
+
+import os
+
+
+class SourceIndex(object):
+    """Directory listing of a source tree."""
+
+    def __init__(self, root):
+        """Index every entry below root."""
+        self.root = root
+        # relative dir -> (dirnames, filenames, dirnames not to descend into)
+        self.dirs = {}
+        self.scan("")
+
+    def scan(self, rel_dir):
+        """Record rel_dir and everything below it."""
+        pending = [rel_dir]
+        while pending:
+            rel_dir = pending.pop()
+            dirnames = []
+            filenames = []
+            symlinks = set()
+            try:
+                entries = list(os.scandir(os.path.join(self.root, rel_dir)))
+            except OSError:
+                # os.walk skips unreadable directories too
+                continue
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirnames.append(entry.name)
+                    if entry.is_symlink():
+                        symlinks.add(entry.name)
+                    else:
+                        pending.append(os.path.join(rel_dir, entry.name))
+                    continue
+                filenames.append(entry.name)
+            self.dirs[rel_dir] = (dirnames, filenames, symlinks)
+
+    def relpath(self, path):
+        """Return path relative to the index root, or None if outside it."""
+        rel = os.path.relpath(path, self.root)
+        if rel == ".":
+            return ""
+        if rel == ".." or rel.startswith("../") or os.path.isabs(rel):
+            return None
+        return rel
+
+    def walk(self, top, topdown=True):
+        """Generate (dirpath, dirnames, filenames) like os.walk(top, topdown)."""
+        rel = self.relpath(top)
+        if rel is None or rel not in self.dirs:
+            yield from os.walk(top, topdown=topdown)
+            return
+        yield from self._walk(top, rel, topdown)
+
+    def _walk(self, top, rel, topdown):
+        dirnames, filenames, symlinks = self.dirs[rel]
+        dirnames = list(dirnames)
+        filenames = list(filenames)
+        if topdown:
+            yield top, dirnames, filenames
+        for name in dirnames:
+            if name in symlinks:
+                continue
+            child_rel = os.path.join(rel, name)
+            if child_rel in self.dirs:
+                yield from self._walk(os.path.join(top, name), child_rel, topdown)
+        if not topdown:
+            yield top, dirnames, filenames
+
+    def listdir(self, path):
+        """Return the names of the entries in path like os.listdir."""
+        rel = self.relpath(path)
+        if rel is None or rel not in self.dirs:
+            return os.listdir(path)
+        dirnames, filenames, _ = self.dirs[rel]
+        return dirnames + filenames
+
+
+def walk(top, index=None, topdown=True):
+    """Walk top through index when one is given, else with os.walk."""
+    if index is not None:
+        return index.walk(top, topdown=topdown)
+    return os.walk(top, topdown=topdown)
@@ -105,7 +105,7 @@ class Source(object):
         """Set empty prefix for go packages (*.list)."""
         self.prefix = ''
 
-    def extract(self, base_path):
+    def extract(self, base_path, source_cache=None, sha=None):
         """Prepare extraction path and call specific extraction method."""
         if not self.prefix:
             extraction_path = os.path.join(base_path, self.subdir)
@@ -113,7 +113,10 @@ class Source(object):
             extraction_path = base_path
 
         extract_method = getattr(self, 'extract_{}'.format(self.type))
-        extract_method(extraction_path)
+        if source_cache and sha and self.type != 'go':
+            source_cache.materialize(sha, extract_method, extraction_path)
+        else:
+            extract_method(extraction_path)
 
     def extract_tar(self, extraction_path):
         """Extract tar in path."""
@@ -187,7 +190,7 @@ def convert_version(ver_str, name):
 class Content(object):
     """Detect static information about the project."""
 
-    def __init__(self, url, name, version, archives, config, base_path, giturl, download_from_git, branch, new_archives_from_git, force_module, force_fullclone):
+    def __init__(self, url, name, version, archives, config, base_path, giturl, download_from_git, branch, new_archives_from_git, force_module, force_fullclone, source_cache=None):
         """Initialize Default content settings."""
         self.name = name
         self.rawname = ""
@@ -211,6 +214,8 @@ class Content(object):
         self.force_fullclone = force_fullclone
         self.archives_from_git = new_archives_from_git
         self.gem_subdir = str()
+        self.source_cache = source_cache
+        self.sha1sums = dict()
 
     def write_upstream(self, sha, tarfile, mode="w"):
         """Write the upstream hash to the upstream file."""
@@ -222,16 +227,15 @@ class Content(object):
         full_list_src = [main_src] + archives_src
         for src in full_list_src:
             if src.destination != ':':
-                src.extract(self.base_path)
+                src.extract(self.base_path, self.source_cache, self.sha1sums.get(src.path))
 
     def check_or_get_file(self, upstream_url, tarfile, mode="w"):
         """Download tarball from url unless it is present locally."""
         tarball_path = self.config.download_path + "/" + tarfile
         if not os.path.isfile(tarball_path):
             download.do_curl(upstream_url, dest=tarball_path, is_fatal=True)
-            self.write_upstream(get_sha1sum(tarball_path), tarfile, mode)
-        else:
-            self.write_upstream(get_sha1sum(tarball_path), tarfile, mode)
+        self.sha1sums[tarball_path] = get_sha1sum(tarball_path)
+        self.write_upstream(self.sha1sums[tarball_path], tarfile, mode)
         return tarball_path
 
     def process_main_source(self, url):
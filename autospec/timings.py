@@ -0,0 +1,138 @@
+#!/bin/true
+#
+# timings.py - part of autospec
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Per-round build timings. Neither build.log nor root.log carry
+# timestamps, so the rpmbuild phase transitions are timestamped as mock
+# writes them, and the rounds are reported at the end of the build.
+
+import collections
+import json
+import os
+import time
+
+import loganalyzer
+import util
+
+# Phases shown in the timings table, other phases are only in timings.json
+table_phases = ["prep", "build", "install", "check"]
+
+
+class PhaseClock(loganalyzer.LogConsumer):
+    """Timestamp the Executing(%phase) and Child return code lines of a log as they are fed."""
+
+    def __init__(self, clock=time.monotonic):
+        """Read the time from clock."""
+        self.clock = clock
+        self.first = None
+        self.marks = []
+        self.end = None
+
+    def feed(self, line):
+        """Record the time of a phase transition in line."""
+        now = self.clock()
+        if self.first is None:
+            self.first = now
+        if line.startswith("Executing(%"):
+            phase = line[len("Executing(%"):].split(")", 1)[0]
+            self.marks.append((phase, now))
+        elif line.startswith("Child return code was"):
+            self.end = now
+
+    def phases(self):
+        """Return the seconds spent in each phase, a phase ending where the next one starts."""
+        durations = collections.OrderedDict()
+        ends = [mark[1] for mark in self.marks[1:]] + [self.end]
+        for (phase, start), end in zip(self.marks, ends):
+            if end is None or end < start:
+                continue
+            durations[phase] = durations.get(phase, 0) + end - start
+        return durations
+
+
+class BuildTimings(object):
+    """Collect the timings of every build round."""
+
+    def __init__(self, clock=time.monotonic):
+        """Read the time from clock."""
+        self.clock = clock
+        self.rounds = []
+
+    def start_round(self, iteration, short_circuit, restart_causes):
+        """Start the record of a round, restart_causes is updated until the round ends."""
+        record = {
+            "round": iteration,
+            "short_circuit": short_circuit,
+            "started": time.time(),
+            "srpm": None,
+            "mock": None,
+            "chroot_setup": None,
+            "phases": {},
+            "parse": None,
+            "restart": restart_causes,
+        }
+        self.rounds.append(record)
+        return record
+
+    def follow(self, build_log, root_log):
+        """Return (build clock, root clock, followers) for the logs of a mock run."""
+        build_clock = PhaseClock(self.clock)
+        root_clock = PhaseClock(self.clock)
+        followers = [loganalyzer.LogFollower(build_log, [build_clock]),
+                     loganalyzer.LogFollower(root_log, [root_clock])]
+        for follower in followers:
+            follower.start()
+        return build_clock, root_clock, followers
+
+    @staticmethod
+    def record_mock(record, build_clock, root_clock):
+        """Store the phase and chroot setup times seen while following a mock run."""
+        record["phases"] = dict(build_clock.phases())
+        if build_clock.first is not None and root_clock.first is not None:
+            record["chroot_setup"] = max(0, build_clock.first - root_clock.first)
+
+    def json_rounds(self):
+        """Return the rounds in a JSON serializable form."""
+        rounds = []
+        for record in self.rounds:
+            record = dict(record)
+            record["restart"] = dict(record["restart"])
+            rounds.append(record)
+        return rounds
+
+    def table(self):
+        """Return the rounds as a text table."""
+        header = ["Round", "Stage", "Srpm", "Mock", "Chroot"] + [phase.capitalize() for phase in table_phases] + ["Parse", "Restart"]
+        rows = [header]
+        for record in self.rounds:
+            values = [record["srpm"], record["mock"], record["chroot_setup"]] + [record["phases"].get(phase) for phase in table_phases] + [record["parse"]]
+            causes = ", ".join(f"{cause} ({count})" for cause, count in sorted(record["restart"].items()))
+            rows.append([str(record["round"]), record["short_circuit"] or "full"] + [format_seconds(value) for value in values] + [causes or "-"])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+    def report(self, results_dir):
+        """Print the timings table and write results/timings.json."""
+        if not self.rounds:
+            return
+        util.print_info("Build timings (seconds):")
+        print(self.table())
+        util.write_out(os.path.join(results_dir, "timings.json"), json.dumps({"rounds": self.json_rounds()}, indent=2) + "\n")
+
+
+def format_seconds(value):
+    """Format a duration for the timings table."""
+    return "-" if value is None else f"{value:.1f}"
@@ -18,16 +18,30 @@
 #
 
 import hashlib
+import io
 import os
 import re
 import shlex
 import subprocess
 import sys
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 dictionary_filename = os.path.dirname(__file__) + "/translate.dic"
 dictionary = [line.strip() for line in open(dictionary_filename, 'r')]
 os_paths = None
 debugging : bool = False
+cache_root = os.environ.get("AUTOSPEC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "autospec"))
+
+
+def get_cache_dir(subdir):
+    """Return the persistent cache directory for subdir, creating it if needed."""
+    path = os.path.join(cache_root, subdir)
+    os.makedirs(path, exist_ok=True)
+    return path
 
 
 def call_fast(command, cwd=None, check=True):
@@ -222,15 +236,57 @@ def write_out(filename, content, mode="w"):
         require_f.write(content)
 
 
+class PipeReader(io.TextIOWrapper):
+    """Text stream over the output of a decompressor process."""
+
+    def __init__(self, process):
+        """Read the stdout of process."""
+        super().__init__(process.stdout, encoding="utf-8", errors="surrogateescape")
+        self.process = process
+
+    def close(self):
+        """Close the stream and reap the process."""
+        if self.closed:
+            return
+        super().close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+def open_zst(filename):
+    """Open a zstd compressed file for reading as UTF-8 text."""
+    if zstandard:
+        raw = zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8", errors="surrogateescape")
+    if binary_in_path("zstd"):
+        process = subprocess.Popen(["zstd", "-dcq", filename], stdout=subprocess.PIPE)
+        return PipeReader(process)
+    raise OSError(f"No zstd decompressor available to read {filename}")
+
+
 def open_auto(*args, **kwargs):
     """Open a file with UTF-8 encoding.
 
     Open file with UTF-8 encoding and "surrogate" escape characters that are
-    not valid UTF-8 to avoid data corruption.
+    not valid UTF-8 to avoid data corruption. Files opened for reading are
+    decompressed on the fly when they end in .zst, and a .log that has been
+    compressed since is read from its .log.zst copy.
     """
     # 'encoding' and 'errors' are fourth and fifth positional arguments, so
     # restrict the args tuple to (file, mode, buffering) at most
     assert len(args) <= 3
     assert 'encoding' not in kwargs
     assert 'errors' not in kwargs
-    return open(*args, encoding="utf-8", errors="surrogateescape", **kwargs)
+    filename = args[0] if args else kwargs.get("file")
+    mode = args[1] if len(args) > 1 else kwargs.get("mode", "r")
+    if not isinstance(filename, str) or set(mode) & set("wax+b"):
+        return open(*args, encoding="utf-8", errors="surrogateescape", **kwargs)
+    if filename.endswith(".zst"):
+        return open_zst(filename)
+    try:
+        return open(*args, encoding="utf-8", errors="surrogateescape", **kwargs)
+    except FileNotFoundError:
+        if not filename.endswith(".log") or not os.path.isfile(filename + ".zst"):
+            raise
+        return open_zst(filename + ".zst")
@@ -0,0 +1,98 @@
+"""Micro-benchmark for buildreq.configure_ac_actions.
+
+Compares the buffered statement splitter against the previous
+character-at-a-time reader on a synthetic configure.ac and checks that
+both produce the same actions. Run with:
+
+    PYTHONPATH=autospec python3 tests/bench_configure_ac.py [statements]
+"""
+
+import os
+import re
+import sys
+import tempfile
+import timeit
+
+import buildreq
+import util
+
+
+def legacy_configure_ac_line(line, conf32):
+    """Previous configure_ac_line logic, returning actions."""
+    actions = []
+    if line.startswith('#'):
+        return actions
+    for pat, reqs in buildreq.configure_ac_pat_reqs:
+        if pat in line:
+            for req in reqs:
+                actions.append(("buildreq", req))
+    line = line.strip()
+    for style in [r"PKG_CHECK_MODULES\((.*?)\)", r"XDT_CHECK_PACKAGE\((.*?)\)"]:
+        match = re.search(style, line)
+        L = []
+        if match:
+            L = match.group(1).split(",")
+        if len(L) > 1:
+            for req in buildreq.parse_modules_list(L[1].strip()):
+                actions.append(("pkgconfig", req, conf32))
+    match = re.search(r"PKG_CHECK_EXISTS\((.*?)\)", line)
+    if match:
+        for req in buildreq.parse_modules_list(match.group(1).split(",")[0].strip()):
+            actions.append(("pkgconfig", req, conf32))
+    return actions
+
+
+def legacy_configure_ac_actions(filename, conf32):
+    """Previous parse_configure_ac reader, one character at a time."""
+    actions = []
+    buf = ""
+    depth = 0
+    f = util.open_auto(filename, "r")
+    while 1:
+        c = f.read(1)
+        if not c:
+            break
+        if c == "(":
+            depth += 1
+        if c == ")" and depth > 0:
+            depth -= 1
+        if c != "\n":
+            buf += c
+        if c == "\n" and depth == 0:
+            actions.extend(legacy_configure_ac_line(buf, conf32))
+            buf = ""
+    actions.extend(legacy_configure_ac_line(buf, conf32))
+    f.close()
+    return actions
+
+
+def write_configure_ac(path, statements):
+    """Write a configure.ac resembling a large GNU project."""
+    with open(path, "w") as f:
+        for i in range(statements):
+            f.write(f"dnl comment {i}\n")
+            f.write(f"AC_ARG_ENABLE([feature{i}],\n  [AS_HELP_STRING([--enable-feature{i}], [enable it])],\n"
+                    f"  [enable_feature{i}=$enableval], [enable_feature{i}=no])\n")
+            f.write(f"AS_IF([test \"x$enable_feature{i}\" = xyes], [\n  AC_DEFINE([FEATURE{i}], [1], [f])\n])\n")
+            if i % 10 == 0:
+                f.write(f"PKG_CHECK_MODULES(DEP{i}, [libdep{i} >= 1.{i} glib-2.0])\n")
+            if i % 25 == 0:
+                f.write(f"PKG_CHECK_EXISTS([optional{i}], [have{i}=yes], [have{i}=no])\nAC_PROG_SED\n")
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmpd:
+        path = os.path.join(tmpd, "configure.ac")
+        write_configure_ac(path, statements)
+        size = os.path.getsize(path)
+        assert legacy_configure_ac_actions(path, False) == buildreq.configure_ac_actions(path, False)
+        old = min(timeit.repeat(lambda: legacy_configure_ac_actions(path, False), number=1, repeat=3))
+        new = min(timeit.repeat(lambda: buildreq.configure_ac_actions(path, False), number=1, repeat=3))
+    print(f"configure.ac: {size} bytes, {statements} feature blocks")
+    print(f"per-character reader: {old * 1000:.1f} ms")
+    print(f"buffered splitter:    {new * 1000:.1f} ms ({old / new:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,30 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch
 import abireport
+import elf
+from test_rpmfile import build_rpm
+
+# test_dump_symbols_exit leaves get_output replaced
+real_get_output = abireport.get_output
+
+
+def loaded_library():
+    """
+    Return the path of a shared library mapped into this process, or None
+    """
+    try:
+        with open('/proc/self/maps') as maps:
+            for line in maps:
+                path = line.split()[-1]
+                if '/libc.so' in path and elf.is_elf(path):
+                    return path
+    except OSError:
+        pass
+    return None
 
 
 def mock_return(retval):
@@ -174,6 +199,154 @@ class TestAbireport(unittest.TestCase):
 
         self.assertEqual(dumpsymbols.exception.code, 1)
 
+    def test_elf_not_elf(self):
+        """
+        Test that non ELF data is rejected
+        """
+        with self.assertRaises(elf.ElfError):
+            elf.ElfFile(b'#!/bin/sh\necho not elf\n')
+        with self.assertRaises(elf.ElfError):
+            elf.ElfFile(elf.ELF_MAGIC + b'\x02\x01')
+        self.assertIsNone(abireport.get_file_magic(__file__))
+
+    @unittest.skipUnless(loaded_library() and shutil.which('nm') and shutil.which('readelf'),
+                         'needs a mapped libc and binutils')
+    @patch('abireport.get_output', real_get_output)
+    def test_elf_matches_binutils(self):
+        """
+        Test that the in-process ELF reader agrees with binutils on libc
+        """
+        path = loaded_library()
+        self.assertEqual(abireport.get_soname(path), abireport.get_soname_objdump(path))
+        self.assertEqual(abireport.get_shared_dependencies(path),
+                         abireport.get_shared_dependencies_readelf(path))
+        symbols = abireport.dump_symbols(path)
+        self.assertTrue(symbols)
+        self.assertEqual(symbols, abireport.dump_symbols_nm(path))
+        self.assertTrue(abireport.is_file_valid(os.path.realpath(path)))
+        with open(path, 'rb') as lib:
+            data = lib.read()
+        binutils_record = abireport.elf_record_binutils(data)
+        self.assertEqual({key: binutils_record[key] for key in ('soname', 'needed', 'symbols')},
+                         {key: abireport.elf_record(data)[key] for key in ('soname', 'needed', 'symbols')})
+
+    @unittest.skipUnless(loaded_library(), 'needs a mapped libc')
+    def test_examine_rpms_pool(self):
+        """
+        Test that examining files in a process pool gives the serial results
+        """
+        libc = os.path.realpath(loaded_library())
+        with open(libc, 'rb') as lib:
+            lib_data = lib.read()
+        members = [('./usr/lib64/libc.so.6', 0o100755, lib_data, 1),
+                   ('./usr/lib64/libother.so.1', 0o100755, lib_data + b'\0', 2),
+                   ('./usr/share/doc/README', 0o100644, b'not a binary', 3)]
+        results = []
+        for pool in (False, True):
+            with tempfile.TemporaryDirectory() as tmpd:
+                rpm = os.path.join(tmpd, 'pkg-lib-1.0-1.x86_64.rpm')
+                build_rpm(rpm, members)
+                with patch('abireport.abi_pool_min_jobs', 1), \
+                        patch('abireport.os.sched_getaffinity', return_value={0, 1} if pool else {0}), \
+                        patch('util.cache_root', os.path.join(tmpd, 'cache')):
+                    results.append(abireport.examine_rpms([rpm]))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([[(name, soname) for name, soname, _ in libraries] for libraries, _ in results[0]],
+                         [[('/usr/lib64/libc.so.6', 'libc.so.6')], [('/usr/lib64/libother.so.1', 'libc.so.6')]])
+        self.assertTrue(results[0][0][0][0][2])
+
+    def test_examine_rpms_binutils_fallback(self):
+        """
+        Test that ELF files the reader can't parse go to binutils and are not cached
+        """
+        data = elf.ELF_MAGIC + b'\x02\x01broken'
+        record = {'magic': 'ELF 64-bit LSB shared object, x86-64', 'soname': 'libbroken.so.1',
+                  'needed': ['libc.so.6'], 'symbols': ['broken_init']}
+        with tempfile.TemporaryDirectory() as tmpd:
+            rpm = os.path.join(tmpd, 'pkg-lib-1.0-1.x86_64.rpm')
+            build_rpm(rpm, [('./usr/lib64/libbroken.so.1', 0o100755, data, 1)])
+            with patch('util.cache_root', os.path.join(tmpd, 'cache')), \
+                    patch('abireport.elf_record_binutils', return_value=record) as binutils:
+                for _ in range(2):
+                    self.assertEqual(abireport.examine_rpms([rpm]),
+                                     [([('/usr/lib64/libbroken.so.1', 'libbroken.so.1', {'broken_init'})],
+                                       ('libbroken.so.1', {'libc.so.6'}))])
+            self.assertEqual(binutils.call_count, 2)
+            binutils.assert_called_with(data)
+
+    @unittest.skipUnless(loaded_library() and os.path.isfile('/bin/ls'), 'needs a mapped libc and /bin/ls')
+    def test_examine_abi_fallback_streams_rpms(self):
+        """
+        Test that the ABI report is read from the rpm payloads without extracting them
+        """
+        libc = os.path.realpath(loaded_library())
+        with open(libc, 'rb') as lib, open('/bin/ls', 'rb') as ls:
+            lib_data = lib.read()
+            ls_data = ls.read()
+        members = [('./usr/lib64/libc.so.6', 0o100755, b'', 1, 2),
+                   ('./usr/lib64/libc-copy.so', 0o100755, lib_data, 1, 2),
+                   ('./usr/lib64/libc.so', 0o120777, b'libc.so.6', 2),
+                   ('./usr/bin/ls', 0o100755, ls_data, 3)]
+        expected_symbols = abireport.dump_symbols(libc)
+        # like file(1), /bin/ls is a pie executable and not examined
+        expected_libs = set(abireport.get_shared_dependencies(libc)) - {'libc.so.6'}
+        cwd = os.getcwd()
+        for pool in (False, True):
+            with tempfile.TemporaryDirectory() as tmpd:
+                build_rpm(os.path.join(tmpd, 'pkg-lib-1.0-1.x86_64.rpm'), members)
+                build_rpm(os.path.join(tmpd, 'pkg-1.0-1.src.rpm'), [])
+                with patch('abireport.abi_pool_min_jobs', 1), \
+                        patch('abireport.os.sched_getaffinity', return_value={0, 1} if pool else {0}), \
+                        patch('util.cache_root', os.path.join(tmpd, 'cache')):
+                    abireport.examine_abi_fallback(tmpd, tmpd, 'pkg')
+                with open(os.path.join(tmpd, 'symbols')) as symbols:
+                    lines = symbols.read().splitlines()
+                with open(os.path.join(tmpd, 'used_libs')) as used_libs:
+                    libs = used_libs.read().splitlines()
+            self.assertEqual(os.getcwd(), cwd)
+            self.assertEqual(lines, sorted('libc.so.6:{}'.format(symbol) for symbol in expected_symbols))
+            self.assertEqual(libs, sorted(expected_libs))
+
+    @unittest.skipUnless(loaded_library(), 'needs a mapped libc')
+    def test_examine_abi_cache_and_diff(self):
+        """
+        Test that unchanged files come from the ABI cache and symbol changes are reported
+        """
+        libc = os.path.realpath(loaded_library())
+        with open(libc, 'rb') as lib:
+            members = [('./usr/lib64/libc.so.6', 0o100755, lib.read(), 1)]
+        symbols = sorted(abireport.dump_symbols(libc))
+        with tempfile.TemporaryDirectory() as tmpd:
+            results = os.path.join(tmpd, 'results')
+            os.mkdir(results)
+            build_rpm(os.path.join(results, 'pkg-lib-1.0-1.x86_64.rpm'), members)
+            with patch('util.cache_root', os.path.join(tmpd, 'cache')), \
+                    patch('abireport.util.binary_in_path', return_value=False):
+                abireport.examine_abi(tmpd, 'pkg')
+                with open(os.path.join(results, 'abi_diff.json')) as diff:
+                    self.assertEqual(json.load(diff), {'libc.so.6': {'added': symbols, 'removed': []}})
+                # drop a symbol and add one that is gone from the library
+                with open(os.path.join(tmpd, 'symbols'), 'w') as report:
+                    report.writelines('libc.so.6:{}\n'.format(symbol) for symbol in symbols[1:] + ['gone'])
+                with patch('abireport.elf_record', side_effect=AssertionError('not cached')):
+                    abireport.examine_abi(tmpd, 'pkg')
+                with open(os.path.join(results, 'abi_diff.json')) as diff:
+                    self.assertEqual(json.load(diff), {'libc.so.6': {'added': symbols[:1], 'removed': ['gone']}})
+                with open(os.path.join(tmpd, 'symbols')) as report:
+                    self.assertEqual(report.read().splitlines(), ['libc.so.6:{}'.format(symbol) for symbol in symbols])
+
+    def test_symbols_diff(self):
+        """
+        Test the per soname symbol changes
+        """
+        old = {'liba.so.1': {'a', 'b'}, 'libgone.so.1': {'x'}}
+        new = {'liba.so.1': {'b', 'c'}, 'libnew.so.1': {'y'}}
+        self.assertEqual(abireport.symbols_diff(old, new),
+                         {'liba.so.1': {'added': ['c'], 'removed': ['a']},
+                          'libgone.so.1': {'added': [], 'removed': ['x']},
+                          'libnew.so.1': {'added': ['y'], 'removed': []}})
+        self.assertEqual(abireport.symbols_diff(old, old), {})
+
 
 READELF1 = """
 
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import analysiscache
+import buildreq
+import config
+import license
+import specdescription
+import util
+
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.pkgdir = os.path.join(self.tmpdir.name, "pkg")
+        os.mkdir(self.pkgdir)
+        os.mkdir(os.path.join(self.tmpdir.name, "cache"))
+        cache_patch = patch("util.cache_root", os.path.join(self.tmpdir.name, "cache"))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        util.write_out(os.path.join(self.pkgdir, "upstream"), "abc/pkg-1.0.tar.gz\n")
+        util.write_out(os.path.join(self.pkgdir, "buildreq_add"), "zlib-dev\n")
+        self.conf = config.Config(self.pkgdir)
+        self.conf.config_files.add("buildreq_add")
+        for attr in analysiscache.license_attrs:
+            patch.object(license, attr, getattr(license, attr)).start()
+        for attr in analysiscache.description_attrs:
+            patch.object(specdescription, attr, getattr(specdescription, attr)).start()
+        self.addCleanup(patch.stopall)
+
+    def test_cache_key(self):
+        """Test that the key follows the upstream and control files."""
+        key = analysiscache.cache_key(self.conf)
+        self.assertEqual(key, analysiscache.cache_key(self.conf))
+        util.write_out(os.path.join(self.pkgdir, "buildreq_add"), "zlib-dev\nxz-dev\n")
+        changed = analysiscache.cache_key(self.conf)
+        self.assertNotEqual(key, changed)
+        util.write_out(os.path.join(self.pkgdir, "upstream"), "def/pkg-1.1.tar.gz\n")
+        self.assertNotEqual(changed, analysiscache.cache_key(self.conf))
+        os.remove(os.path.join(self.pkgdir, "upstream"))
+        self.assertIsNone(analysiscache.cache_key(self.conf))
+
+    def test_save_load(self):
+        """Test that a saved analysis is restored on a fresh run."""
+        key = analysiscache.cache_key(self.conf)
+        reqs = buildreq.Requirements("")
+        self.assertFalse(analysiscache.load(key, self.conf, reqs))
+
+        reqs.add_buildreq("cmake")
+        reqs.pypi_provides = "pkg"
+        self.conf.set_build_pattern("cmake", 1)
+        license.licenses = ["MIT"]
+        license.hashes = {"COPYING": "abc"}
+        specdescription.default_summary = "A package"
+        analysiscache.save(key, self.conf, reqs)
+
+        license.licenses = []
+        license.hashes = {}
+        specdescription.default_summary = ""
+        conf = config.Config(self.pkgdir)
+        reqs = buildreq.Requirements("")
+        with patch("analysiscache.print_info"), patch("builtins.print"):
+            self.assertTrue(analysiscache.load(key, conf, reqs))
+        self.assertIn("cmake", reqs.buildreqs)
+        self.assertEqual(reqs.pypi_provides, "pkg")
+        self.assertEqual(conf.default_pattern, "cmake")
+        self.assertEqual(license.licenses, ["MIT"])
+        self.assertEqual(license.hashes, {"COPYING": "abc"})
+        self.assertEqual(specdescription.default_summary, "A package")
+
+    def test_save_unpicklable(self):
+        """Test that an analysis that cannot be pickled is not stored, even partially."""
+        key = analysiscache.cache_key(self.conf)
+        reqs = buildreq.Requirements("")
+        reqs.add_buildreq("cmake")
+        reqs.banned = lambda: None
+        with patch("analysiscache.print_warning") as print_warning:
+            analysiscache.save(key, self.conf, reqs)
+        print_warning.assert_called_once()
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, "cache", "analysis")), [])
+        self.assertFalse(analysiscache.load(key, self.conf, buildreq.Requirements("")))
+
+
+if __name__ == '__main__':
+    unittest.main(buffer=True)
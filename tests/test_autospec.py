@@ -0,0 +1,65 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import autospec
+if not hasattr(autospec, "archives_from_git_all"):
+    # From the top of the tree the autospec directory shadows autospec.py
+    from autospec import autospec
+
+
+class TestArchivesFromGit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.package_path = self.tmpdir.name + "/"
+        self.urls = [f"https://example.com/{name}.git" for name in ("one", "two", "three")]
+        self.finished = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def git_archive_all(self, path, name, url, branch, force_module, force_fullclone, conf):
+        """Archive the entries slower the earlier they are, "two" exits."""
+        if name == "two" and branch == "fail":
+            raise SystemExit(1)
+        time.sleep(0.02 * (3 - self.urls.index(url)))
+        with self.lock:
+            self.finished.append(name)
+        return f"file://{path}{name}-1.0.tar.gz"
+
+    def archive_all(self, branches):
+        with patch.object(autospec.git, 'git_archive_all', side_effect=self.git_archive_all), \
+                patch.object(autospec, 'archives_from_git_workers', 3):
+            return autospec.archives_from_git_all(self.package_path, self.urls, branches, ["false"] * 3, ["false"] * 3, False, None)
+
+    def test_archives_from_git_order(self):
+        """Test that the archives are returned in the order of the entries"""
+        self.assertEqual(self.archive_all(["main"] * 3),
+                         [f"file://{self.package_path}{name}-1.0.tar.gz" for name in ("one", "two", "three")])
+        self.assertEqual(self.finished, ["three", "two", "one"])
+
+    def test_archives_from_git_failure(self):
+        """Test that a failing entry exits once, after the other entries are archived"""
+        with patch.object(autospec, 'print_fatal') as print_fatal, self.assertRaises(SystemExit):
+            self.archive_all(["main", "fail", "main"])
+        self.assertEqual(self.finished, ["three", "one"])
+        print_fatal.assert_called_once()
+        self.assertIn(self.urls[1], print_fatal.call_args.args[0])
+
+    def test_archives_from_git_found(self):
+        """Test that an existing archive is used without cloning"""
+        with open(os.path.join(self.package_path, "two-0.9.tar.gz"), "w"):
+            pass
+        with patch.object(autospec.git, 'git_archive_all') as git_archive_all:
+            self.assertEqual(autospec.archive_from_git(self.package_path, self.urls[1], "main", "false", "false", False, None),
+                             "file://{}".format(os.path.join(self.tmpdir.name, "two-0.9.tar.gz")))
+        git_archive_all.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True)
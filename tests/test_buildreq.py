@@ -22,6 +22,16 @@ class TestBuildreq(unittest.TestCase):
         """
         self.reqs = buildreq.Requirements("")
         self.reqs.banned_buildreqs.add('bannedreq')
+        # Keep the caches, the pypi index and pypi itself out of the tests
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        for target, value in (('buildreq.util.cache_root', self.cache_dir.name),
+                              ('buildreq.pypidata.pypi_index_file', None),
+                              ('buildreq.pypidata.pypi_index', None),
+                              ('buildreq.pypidata.pkg_search', MagicMock(return_value=False))):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def test_add_buildreq(self):
         """
@@ -808,5 +818,82 @@ find_package(different_name)
             self.assertTrue(pkg in self.reqs.requires[None])
 
 
+    def test_scan_for_configure_parallel(self):
+        """
+        Test that parsing build files in worker processes gives the same
+        result as parsing them serially.
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as tmpd:
+            open(os.path.join(tmpd, 'CMakeLists.txt'), 'w').close()
+            for i in range(8):
+                os.mkdir(os.path.join(tmpd, f'sub{i}'))
+                with open(os.path.join(tmpd, f'sub{i}', f'Find{i}.cmake'), 'w') as f:
+                    f.write(f'pkg_check_modules(A mod{i} common REQUIRED)\n')
+                with open(os.path.join(tmpd, f'sub{i}', 'configure.ac'), 'w') as f:
+                    f.write(f'PKG_CHECK_MODULES(B, [ac{i} >= 1.0])\nAC_PROG_SED\n')
+            for min_jobs in (1000, 1):
+                conf = config.Config("")
+                conf.setup_patterns()
+                reqs = buildreq.Requirements("")
+                with patch('buildreq.parse_pool_min_jobs', min_jobs), \
+                        patch('buildreq.os.sched_getaffinity', return_value={0, 1}):
+                    reqs.scan_for_configure(tmpd, "", conf)
+                results.append((reqs.buildreqs, conf.default_pattern))
+
+        self.assertEqual(results[0], results[1])
+        self.assertIn('pkgconfig(mod7)', results[0][0])
+        self.assertIn('pkgconfig(ac3)', results[0][0])
+        self.assertEqual(results[0][1], 'cmake')
+
+    def test_scan_for_configure_parse_cache(self):
+        """
+        Test that unchanged build files are replayed from the parse cache
+        instead of being parsed again.
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as tmpd:
+            src = os.path.join(tmpd, 'src')
+            os.mkdir(src)
+            os.mkdir(os.path.join(tmpd, 'cache'))
+            with open(os.path.join(src, 'CMakeLists.txt'), 'w') as f:
+                f.write('# padding\n' * 100)
+                f.write('pkg_check_modules(A cached-mod REQUIRED)\n')
+            with patch('util.cache_root', os.path.join(tmpd, 'cache')):
+                for parse_patch in (patch('buildreq.run_parse_job', wraps=buildreq.run_parse_job),
+                                    patch('buildreq.run_parse_job', side_effect=AssertionError)):
+                    conf = config.Config("")
+                    conf.setup_patterns()
+                    reqs = buildreq.Requirements("")
+                    with parse_patch:
+                        reqs.scan_for_configure(src, "", conf)
+                    results.append(reqs.buildreqs)
+
+        self.assertIn('pkgconfig(cached-mod)', results[0])
+        self.assertEqual(results[0], results[1])
+
+    def test_run_parse_jobs_python_names_not_cached(self):
+        """
+        Test that python parse jobs cache the stripped names and look up
+        the pypi names again when replaying the cache.
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as tmpd:
+            os.mkdir(os.path.join(tmpd, 'cache'))
+            reqs_txt = os.path.join(tmpd, 'requirements.txt')
+            with open(reqs_txt, 'w') as f:
+                f.write('# padding\n' * 100)
+                f.write('Some_Pkg >= 1.0\n')
+            job = ('requirements', reqs_txt)
+            with patch('util.cache_root', os.path.join(tmpd, 'cache')):
+                with patch('buildreq.pypidata.get_pypi_name', return_value=''):
+                    results.append(buildreq.run_parse_jobs([job], {}))
+                with patch('buildreq.pypidata.get_pypi_name', side_effect=lambda name, miss=False: name.lower()), \
+                        patch('buildreq.run_parse_job', side_effect=AssertionError):
+                    results.append(buildreq.run_parse_jobs([job], {}))
+
+        self.assertEqual(results[0], {job: []})
+        self.assertEqual(results[1], {job: [('buildreq_requires', 'pypi(some_pkg)', {'override': True, 'subpkg': 'python3'})]})
+
 if __name__ == '__main__':
     unittest.main(buffer=True)
@@ -0,0 +1,132 @@
+import os
+import shutil
+import socket
+import tarfile
+import tempfile
+import unittest
+import unittest.mock
+import compress
+import util
+
+real_external_compressor = compress.external_compressor
+
+
+class TestCompress(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmpdir.name, "src")
+        for path in (self.src, os.path.join(self.src, "sub"), os.path.join(self.src, ".git")):
+            os.mkdir(path)
+        util.write_out(os.path.join(self.src, "b.txt"), "b\n")
+        util.write_out(os.path.join(self.src, "sub", "a.txt"), "a\n")
+        util.write_out(os.path.join(self.src, ".git", "HEAD"), "ref\n")
+        os.symlink("b.txt", os.path.join(self.src, "link"))
+        os.mkdir(os.path.join(self.tmpdir.name, "cache"))
+        cache_patch = unittest.mock.patch("util.cache_root", os.path.join(self.tmpdir.name, "cache"))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        # Force the in-process compressors
+        external_patch = unittest.mock.patch("compress.external_compressor", return_value=None)
+        external_patch.start()
+        self.addCleanup(external_patch.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_codec_for(self):
+        """Test codec selection from the archive suffix."""
+        self.assertEqual(compress.codec_for("a-1.tar.gz"), "gzip")
+        self.assertEqual(compress.codec_for("a-1.tar.zst"), "zstd")
+        self.assertEqual(compress.codec_for("a-1.tar.xz"), "xz")
+        self.assertEqual(compress.codec_for("a-1.tgz"), "gzip")
+
+    def test_pick_level(self):
+        """Test that larger inputs get cheaper levels."""
+        self.assertEqual(compress.pick_level("gzip", 1024), 9)
+        self.assertEqual(compress.pick_level("gzip", 100 * compress.MiB), 6)
+        self.assertEqual(compress.pick_level("gzip", 1024 * compress.MiB), 4)
+        self.assertEqual(compress.pick_level("xz", 1024 * compress.MiB), 3)
+
+    def test_archive_tree_layout(self):
+        """Test member order, exclusion and normalized metadata."""
+        dest = os.path.join(self.tmpdir.name, "src-1.tar.gz")
+        self.assertTrue(compress.archive_tree(self.src, "src", dest, exclude=(".git",)))
+        with tarfile.open(dest) as tar:
+            members = tar.getmembers()
+        self.assertEqual([m.name for m in members],
+                         ["src", "src/b.txt", "src/link", "src/sub", "src/sub/a.txt"])
+        for member in members:
+            self.assertEqual(member.mtime, 0)
+            self.assertEqual(member.uid, 0)
+            self.assertEqual(member.uname, "")
+        self.assertTrue(members[2].issym())
+
+    def test_archive_tree_special_files(self):
+        """Test that FIFOs are archived and sockets skipped, as tar does."""
+        os.mkfifo(os.path.join(self.src, "sub", "fifo"))
+        sock = socket.socket(socket.AF_UNIX)
+        self.addCleanup(sock.close)
+        sock.bind(os.path.join(self.src, "sub", "sock"))
+        dest = os.path.join(self.tmpdir.name, "src-1.tar.gz")
+        with unittest.mock.patch("compress.util.print_warning") as print_warning:
+            self.assertTrue(compress.archive_tree(self.src, "src", dest, exclude=(".git",)))
+        print_warning.assert_called_once()
+        self.assertIn("sock", print_warning.call_args.args[0])
+        with tarfile.open(dest) as tar:
+            members = tar.getmembers()
+        self.assertEqual([m.name for m in members],
+                         ["src", "src/b.txt", "src/link", "src/sub", "src/sub/a.txt", "src/sub/fifo"])
+        self.assertTrue(members[5].isfifo())
+        with unittest.mock.patch("compress.util.print_warning"), \
+                unittest.mock.patch("compress.util.print_info"):
+            self.assertFalse(compress.archive_tree(self.src, "src", dest, exclude=(".git",)))
+
+    def test_archive_tree_reproducible(self):
+        """Test that unchanged trees give byte-identical archives."""
+        for suffix in (".tar.gz", ".tar.xz"):
+            dest1 = os.path.join(self.tmpdir.name, "one" + suffix)
+            dest2 = os.path.join(self.tmpdir.name, "two" + suffix)
+            compress.archive_tree(self.src, "src", dest1)
+            os.utime(os.path.join(self.src, "b.txt"), (1, 1))
+            compress.archive_tree(self.src, "src", dest2)
+            self.assertEqual(util.get_contents(dest1), util.get_contents(dest2))
+
+    def test_archive_tree_skip(self):
+        """Test that an archive of an unchanged tree is not rewritten."""
+        dest = os.path.join(self.tmpdir.name, "src-1.tar.gz")
+        self.assertTrue(compress.archive_tree(self.src, "src", dest))
+        self.assertFalse(compress.archive_tree(self.src, "src", dest))
+        util.write_out(os.path.join(self.src, "b.txt"), "changed\n")
+        self.assertTrue(compress.archive_tree(self.src, "src", dest))
+        self.assertTrue(compress.archive_tree(self.src, "src", dest, tree_id="abc"))
+        self.assertFalse(compress.archive_tree(self.src, "src", dest, tree_id="abc"))
+
+    def test_log_archiver_retention(self):
+        """Test that only the rounds beyond the last keep are compressed."""
+        with unittest.mock.patch("compress.compress_log") as compress_log, \
+                unittest.mock.patch("compress.zstandard", True):
+            archiver = compress.LogArchiver(keep=2)
+            for iteration in range(1, 5):
+                archiver.add_round([f"round{iteration}-build.log", f"round{iteration}-root.log"])
+            archiver.wait()
+        self.assertEqual([call.args[0] for call in compress_log.call_args_list],
+                         ["round1-build.log", "round1-root.log", "round2-build.log", "round2-root.log"])
+        self.assertEqual(archiver.rounds, [["round3-build.log", "round3-root.log"], ["round4-build.log", "round4-root.log"]])
+
+    @unittest.skipUnless(compress.zstandard or shutil.which("zstd"), "needs zstd")
+    def test_compress_log(self):
+        """Test that a compressed log replaces the original and reads back the same."""
+        log = os.path.join(self.tmpdir.name, "build-round1-build.log")
+        util.write_out(log, "Executing(%build)\nChild return code was: 0\n")
+        # Keep the PATH lookup of the zstd binary out of the shared cache
+        with unittest.mock.patch("compress.external_compressor", real_external_compressor), \
+                unittest.mock.patch("util.os_paths", None):
+            self.assertEqual(compress.compress_log(log), log + ".zst")
+            self.assertEqual(os.listdir(self.tmpdir.name).count("build-round1-build.log"), 0)
+            with util.open_auto(log) as logf:
+                self.assertEqual(logf.read(), "Executing(%build)\nChild return code was: 0\n")
+
+
+if __name__ == '__main__':
+    unittest.main(buffer=True)
@@ -1,3 +1,8 @@
+import csv
+import io
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import mock_open, patch
 import count
@@ -487,16 +492,60 @@ pats = [
      [6, 4, 1, 1, 0, 0, 0, 0, 0, 0]),
 ]
 
-backup_zero_test_data = count.zero_test_data
+class TestCount(unittest.TestCase):
 
-def mock_zero_test_data():
-    pass
+    def test_counter_reentrant(self):
+        """
+        Test that counters keep their results apart
+        """
+        first = count.TestLogCounter('first')
+        second = count.TestLogCounter('second')
+        with patch('count.util.open_auto', mock_open(read_data='+ make check\nRan 3 tests in 1s\n')):
+            self.assertEqual(first.parse_log('log'), 'first,3,3,0,0,0')
+        with patch('count.util.open_auto', mock_open(read_data='+ make check\nok 1 - a\nnot ok 2 - b\n')):
+            self.assertEqual(second.parse_log('log'), 'second,2,1,1,0,0')
+        self.assertEqual(first.string_out(), 'first,3,3,0,0,0')
 
+    def test_parse_log_packages(self):
+        """
+        Test that CLR-XTEST package markers split the results
+        """
+        content = ('+ make check\nRan 2 tests in 1s\nCLR-XTEST: Package: pkg-a\n'
+                   'Ran 5 tests in 1s\nFAILED (failures=1)\n')
+        with patch('count.util.open_auto', mock_open(read_data=content)):
+            self.assertEqual(count.parse_log('log', 'main'), 'pkg-a,7,6,1,0,0')
 
-class TestCount(unittest.TestCase):
+    def test_count_packages(self):
+        """
+        Test aggregating the results of package directories and logs, serially and in a pool
+        """
+        with tempfile.TemporaryDirectory() as tmpd:
+            for package, content in (('pkg-a', 'Executing(%check)\nok 1 - a\nnot ok 2 - b\n'),
+                                     ('pkg-b', '+ make check\nRan 4 tests in 1s\nOK (SKIP=1)\n')):
+                os.mkdir(os.path.join(tmpd, package))
+                os.mkdir(os.path.join(tmpd, package, 'results'))
+                with open(os.path.join(tmpd, package, 'results', 'build.log'), 'w') as log:
+                    log.write(content)
+            round_log = os.path.join(tmpd, 'pkg-b', 'results', 'round2-build.log')
+            with open(round_log, 'w') as log:
+                log.write('+ make check\n5 tests; 4 passed, 1 failed\n')
+            paths = [os.path.join(tmpd, 'pkg-a'), round_log, os.path.join(tmpd, 'pkg-b'), os.path.join(tmpd, 'missing')]
+            serial = count.count_packages(paths, jobs=1)
+            pooled = count.count_packages(paths, jobs=2)
+
+        self.assertEqual(serial, pooled)
+        self.assertEqual([(row['package'], row['total'], row['pass'], row['fail'], row['skip'], row['xfail'])
+                          for row in serial],
+                         [('pkg-a', 2, 1, 1, 0, 0), ('pkg-b', 4, 3, 0, 1, 0), ('pkg-b', 5, 4, 1, 0, 0)])
+        self.assertEqual(serial[2]['log'], round_log)
 
-    def setUp(self):
-        count.zero_test_data()
+        out = io.StringIO()
+        count.write_csv(serial, out)
+        out.seek(0)
+        self.assertEqual([row['package'] for row in csv.DictReader(out)], ['pkg-a', 'pkg-b', 'pkg-b'])
+        out = io.StringIO()
+        count.write_json(serial, out)
+        self.assertEqual(json.loads(out.getvalue()), serial)
 
 
 def test_generator(line, expected):
@@ -519,21 +568,12 @@ def test_generator(line, expected):
         """
         content = '+ make check\n' + line
         m_open = mock_open(read_data=content)
-        with patch('count.util.open_auto', m_open, create=True):
-            count.zero_test_data = mock_zero_test_data
-            count.parse_log('log')
-            count.zero_test_data = backup_zero_test_data
+        counter = count.TestLogCounter()
+        with patch('count.util.open_auto', m_open, create=True), \
+                patch.object(counter, 'zero_test_data'):
+            counter.parse_log('log')
 
-        actual = [count.total_tests,
-                  count.total_pass,
-                  count.total_fail,
-                  count.total_xfail,
-                  count.total_skip,
-                  count.counted_tests,
-                  count.counted_pass,
-                  count.counted_fail,
-                  count.counted_xfail,
-                  count.counted_skip]
+        actual = [counter.counts[field] for field in count.count_fields]
 
         self.assertEqual(actual, expected)
 
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+
+import buildreq
+import events
+import loganalyzer
+
+
+class EmitOnMatch(loganalyzer.LogConsumer):
+
+    def feed(self, line):
+        if line.startswith("missing"):
+            with events.matching(r"^missing (.*)$"):
+                events.emit("unknown_pattern", match=line.split()[1])
+
+
+class TestEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "results", "events.jsonl")
+        events.open_sink(self.path, "pkg")
+
+    def tearDown(self):
+        events.close()
+        self.tmpdir.cleanup()
+
+    def read_events(self):
+        events.sink.flush()
+        with open(self.path) as events_f:
+            return [json.loads(line) for line in events_f]
+
+    def test_emit(self):
+        """Test that events carry the round, package and pattern"""
+        events.start_round(3)
+        with events.matching("pat"):
+            events.emit("buildreq_added", req="zlib-dev")
+        events.emit("round_end", duration=1.5, success=1)
+        records = self.read_events()
+        self.assertEqual(len(records), 2)
+        self.assertEqual({key: records[0][key] for key in ("event", "round", "package", "pattern", "req", "line")},
+                         {"event": "buildreq_added", "round": 3, "package": "pkg", "pattern": "pat", "req": "zlib-dev", "line": None})
+        self.assertEqual((records[1]["pattern"], records[1]["duration"], records[1]["success"]), (None, 1.5, 1))
+
+    def test_analyze_log_lines(self):
+        """Test that events emitted while analyzing a log carry the log line"""
+        log = os.path.join(self.tmpdir.name, "build.log")
+        with open(log, "w") as logf:
+            logf.write("checking\nmissing foo\nok\nmissing bar\n")
+        loganalyzer.analyze_log(log, [EmitOnMatch()])
+        events.emit("round_end")
+        records = self.read_events()
+        self.assertEqual([(r["match"], r["log"], r["line"], r["pattern"]) for r in records[:2]],
+                         [("foo", "build.log", 2, r"^missing (.*)$"), ("bar", "build.log", 4, r"^missing (.*)$")])
+        self.assertEqual((records[2]["log"], records[2]["line"]), (None, None))
+
+    def test_add_buildreq(self):
+        """Test that new buildreqs found in the build log are recorded"""
+        reqs = buildreq.Requirements("")
+        reqs.verbose = 1
+        reqs.add_buildreq("zlib-dev")
+        reqs.add_buildreq("zlib-dev")
+        self.assertEqual([(r["event"], r["req"]) for r in self.read_events()], [("buildreq_added", "zlib-dev")])
+
+    def test_no_sink(self):
+        """Test that events are dropped without a sink"""
+        events.close()
+        events.emit("round_end")
+        with events.matching("pat"):
+            events.emit("buildreq_added")
+        with self.assertRaises(FileNotFoundError):
+            open(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True)
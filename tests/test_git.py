@@ -0,0 +1,202 @@
+import os
+import re
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import git
+
+
+def run_git(args, cwd):
+    """Run a git command in cwd and return its output."""
+    env = dict(os.environ,
+               GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com",
+               GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+    return subprocess.run(["git"] + args, cwd=cwd, env=env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          universal_newlines=True).stdout.strip()
+
+
+class TestGitMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name + "/"
+        self.work = os.path.join(self.tmpdir.name, "work")
+        os.mkdir(self.work)
+        run_git(["init", "-q", "-b", "main"], self.work)
+        self.commit("VERSION", "1.0\n")
+        run_git(["tag", "v1.0"], self.work)
+        self.commit("VERSION", "1.1\n")
+        run_git(["checkout", "-q", "-b", "dev"], self.work)
+        self.commit("DEV", "dev\n")
+        run_git(["checkout", "-q", "main"], self.work)
+        self.url = os.path.join(self.tmpdir.name, "upstream.git")
+        run_git(["clone", "-q", "--bare", self.work, self.url], self.tmpdir.name)
+        os.mkdir(os.path.join(self.tmpdir.name, "cache"))
+        os.mkdir(os.path.join(self.tmpdir.name, "cache", "git"))
+        cache_patch = patch('git.util.cache_root', os.path.join(self.tmpdir.name, "cache"))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def commit(self, name, content):
+        """Commit content as name in the work repository."""
+        with open(os.path.join(self.work, name), "w") as f:
+            f.write(content)
+        run_git(["add", name], self.work)
+        run_git(["commit", "-q", "-m", f"update {name}"], self.work)
+
+    def read(self, clone_path, name):
+        with open(os.path.join(clone_path, name)) as f:
+            return f.read()
+
+    def checkout(self, branch, name):
+        """Check out branch of the mirror in path/name and return the mirror path."""
+        return git.git_mirror_checkout(self.url, self.path, branch, self.path + name, True, False)
+
+    def test_mirror_path(self):
+        """Test that the mirror of a url is named after it, in the git cache"""
+        mirror_path = git.git_mirror_path("https://github.com/clearlinux/autospec.git/")
+        self.assertEqual(os.path.dirname(mirror_path), os.path.join(self.tmpdir.name, "cache", "git"))
+        self.assertRegex(os.path.basename(mirror_path), r"^autospec-[0-9a-f]{16}\.git$")
+        self.assertNotEqual(mirror_path, git.git_mirror_path("https://example.com/autospec.git"))
+
+    def test_mirror_created_once(self):
+        """Test that the mirror is cloned once, then only fetched into"""
+        with patch('git.call', wraps=git.call) as call:
+            mirror_path = self.checkout("main", "first")
+            self.commit("VERSION", "1.2\n")
+            run_git(["push", "-q", self.url, "main"], self.work)
+            self.assertEqual(self.checkout("main", "second"), mirror_path)
+        commands = [c.args[0] for c in call.call_args_list]
+        self.assertEqual(len([c for c in commands if " clone --mirror" in c]), 1)
+        self.assertEqual(len([c for c in commands if " fetch --prune" in c]), 1)
+        self.assertEqual(mirror_path, git.git_mirror_path(self.url))
+        self.assertEqual(self.read(self.path + "first", "VERSION"), "1.1\n")
+        self.assertEqual(self.read(self.path + "second", "VERSION"), "1.2\n")
+
+    def test_mirror_worktree_ref(self):
+        """Test that the worktree is checked out at the requested branch or tag"""
+        self.assertIsNotNone(self.checkout("v1.0", "tag"))
+        self.assertIsNotNone(self.checkout("dev", "branch"))
+        self.assertEqual(self.read(self.path + "tag", "VERSION"), "1.0\n")
+        self.assertNotIn("DEV", os.listdir(self.path + "tag"))
+        self.assertEqual(self.read(self.path + "branch", "DEV"), "dev\n")
+        self.assertEqual(git.git_tree_id(self.path + "tag"), run_git(["rev-parse", "v1.0^{tree}"], self.url))
+        self.assertEqual(git.git_tree_id(self.path + "branch"), run_git(["rev-parse", "dev^{tree}"], self.url))
+
+    def test_mirror_update_fails(self):
+        """Test that a mirror that cannot be cloned falls back to a fresh clone"""
+        self.url = os.path.join(self.tmpdir.name, "missing.git")
+        with patch('git.util.print_warning') as print_warning:
+            self.assertIsNone(self.checkout("main", "clone"))
+        print_warning.assert_called_once()
+        self.assertNotIn("clone", os.listdir(self.tmpdir.name))
+
+    def test_mirror_worktree_fails(self):
+        """Test that a failed checkout of an existing mirror leaves no worktree behind"""
+        mirror_path = self.checkout("main", "first")
+        with patch('git.util.print_warning') as print_warning:
+            self.assertIsNone(self.checkout("no-such-branch", "clone"))
+        print_warning.assert_called_once()
+        self.assertNotIn("clone", os.listdir(self.tmpdir.name))
+        self.assertEqual(run_git(["worktree", "list", "--porcelain"], mirror_path).count("worktree "), 2)
+
+    def test_git_tree_id_not_a_repository(self):
+        """Test that no tree id is returned outside of a git checkout"""
+        self.assertIsNone(git.git_tree_id(self.tmpdir.name))
+
+
+def ls_remote(*tags):
+    """Return git ls-remote output advertising tags."""
+    return "".join(f"{i:040x}\trefs/tags/{tag}\n" for i, tag in enumerate(tags))
+
+
+class TestGitTags(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.tmpdir.name, "tags"))
+        cache_patch = patch('git.util.cache_root', self.tmpdir.name)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def latest(self, tags, **kwargs):
+        return git.latest_tag_version(tags, git.semver_tag_re, **kwargs)
+
+    def resolve(self, refs, **kwargs):
+        """Resolve the latest version of a remote advertising refs."""
+        with patch('git.git_ls_remote_refs', return_value=refs):
+            return git.resolve_remote_version("git ls-remote --tags https://example.com/pkg.git", None,
+                                              git.semver_tag_re, **kwargs)
+
+    def test_tag_version(self):
+        """Test that the version is assembled from the matched tag components"""
+        self.assertEqual(git.tag_version(git.semver_tag_re.search("v1.2.3.4")), "1.2.3.4")
+        self.assertEqual(git.tag_version(git.semver_tag_re.search("pkg-2_5")), "2.5")
+        self.assertEqual(git.tag_version(git.semver_tag_re.search("v1.0rc1")), "1.0rc1")
+
+    def test_latest_tag_version_order(self):
+        """Test that tags are ordered as versions, not as strings"""
+        self.assertEqual(self.latest(["v1.9", "v1.10", "v1.2"]), "1.10")
+        self.assertEqual(self.latest(["1.2.3", "1.2.3.1", "1.2"]), "1.2.3.1")
+        self.assertEqual(self.latest(["1.0rc1", "1.0"]), "1.0")
+        self.assertEqual(self.latest(["2.0-beta", "1.9"]), "2.0")
+        self.assertEqual(self.latest(["latest", "stable"]), "")
+        self.assertEqual(self.latest([]), "")
+
+    def test_latest_tag_version_exclude(self):
+        """Test that tags matching exclude_re are skipped"""
+        tags = ["v1.0", "20201231.1", "release-candidate-3.0"]
+        self.assertEqual(self.latest(tags), "20201231.1")
+        self.assertEqual(self.latest(tags, exclude_re=git.default_tag_exclude_re), "1.0")
+        self.assertEqual(self.latest(["v1.0", "v3.0-rc1"], exclude_re=re.compile("rc")), "1.0")
+
+    def test_latest_tag_version_normalize(self):
+        """Test that bare major version tags are only versions when normalized"""
+        self.assertEqual(self.latest(["v1.0", "v2"]), "1.0")
+        self.assertEqual(self.latest(["v1.0", "v2"], normalize=True), "2.0")
+        self.assertEqual(self.latest(["v1.0", "2"], normalize=True), "1.0")
+
+    def test_resolve_remote_version(self):
+        """Test that the latest version of the advertised tags is returned"""
+        self.assertEqual(self.resolve(ls_remote("v1.0", "v1.0^{}", "v1.1", "v2"), normalize=True), "2.0")
+        self.assertEqual(self.resolve(""), "")
+
+    def test_resolve_remote_version_cache(self):
+        """Test that the tag index is only recomputed when the refs or the classification change"""
+        refs = ls_remote("v1.0", "v1.1", "20201231.1")
+        with patch('git.latest_tag_version', wraps=git.latest_tag_version) as latest:
+            self.assertEqual(self.resolve(refs), "20201231.1")
+            self.assertEqual(self.resolve(refs), "20201231.1")
+            self.assertEqual(latest.call_count, 1)
+            self.assertEqual(self.resolve(refs, exclude_re=git.default_tag_exclude_re), "1.1")
+            self.assertEqual(latest.call_count, 2)
+            self.assertEqual(self.resolve(refs, exclude_re=git.default_tag_exclude_re), "1.1")
+            self.assertEqual(latest.call_count, 2)
+            refs = ls_remote("v1.0", "v1.1", "v1.2")
+            self.assertEqual(self.resolve(refs, exclude_re=git.default_tag_exclude_re), "1.2")
+            self.assertEqual(latest.call_count, 3)
+
+    def test_resolve_remote_version_bad_index(self):
+        """Test that an unreadable tag index is recomputed and rewritten"""
+        refs = ls_remote("v1.0", "v1.1")
+        self.assertEqual(self.resolve(refs), "1.1")
+        index, = os.listdir(os.path.join(self.tmpdir.name, "tags"))
+        with open(os.path.join(self.tmpdir.name, "tags", index), "w") as index_f:
+            index_f.write("{")
+        with patch('git.latest_tag_version', wraps=git.latest_tag_version) as latest:
+            self.assertEqual(self.resolve(refs), "1.1")
+            self.assertEqual(self.resolve(refs), "1.1")
+        self.assertEqual(latest.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True)
@@ -1,8 +1,11 @@
 from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO, StringIO
 import os
 import tempfile
+import threading
 import unittest
+import urllib.parse
 from unittest.mock import patch, mock_open, MagicMock
 
 import pycurl
@@ -12,11 +15,22 @@ import download
 import license
 import util
 
+# the server tests below replace pycurl.Curl in place
+real_curl = pycurl.Curl
+
 
 class TestLicense(unittest.TestCase):
 
     def setUp(self):
         license.licenses = []
+        license.license_files = []
+        license.hashes = dict()
+        # keep license server answers out of the user cache
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        cache_patch = patch('util.cache_root', self.tmpdir.name)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
 
     def test_add_license(self):
         """
@@ -63,6 +77,31 @@ class TestLicense(unittest.TestCase):
         license.license_from_copying_hash('tests/COPYING_TEST', '', conf, '')
         self.assertIn('GPL-3.0', license.licenses)
 
+    def test_license_from_copying_hash_no_decode(self):
+        """
+        Test that a known hash is matched without reading the whole file into
+        memory or running charset detection
+        """
+        conf = config.Config("")
+        conf.setup_patterns()
+        with patch('license.get_contents', wraps=util.get_contents) as m_contents, \
+                patch('license.chardet.detect') as m_detect:
+            license.license_from_copying_hash('tests/COPYING_TEST', '', conf, '')
+
+        self.assertIn('GPL-3.0', license.licenses)
+        m_contents.assert_not_called()
+        m_detect.assert_not_called()
+
+    def test_decode_license(self):
+        """
+        Test that UTF-8 text skips charset detection and other text does not
+        """
+        with patch('license.chardet.detect', return_value={'encoding': 'ISO-8859-1'}) as m_detect:
+            self.assertEqual(license.decode_license('Copyright \u00a9'.encode('utf-8')), 'Copyright \u00a9')
+            m_detect.assert_not_called()
+            self.assertEqual(license.decode_license(b'Copyright \xa9'), 'Copyright \u00a9')
+            m_detect.assert_called_once()
+
     def test_license_from_copying_hash_no_license_show(self):
         """
         Test license_from_copying_hash with invalid hash and no license_show
@@ -71,7 +110,7 @@ class TestLicense(unittest.TestCase):
         conf = config.Config("")
         conf.setup_patterns()
         # remove the hash from license_hashes
-        del(conf.license_hashes[license.get_sha1sum('tests/COPYING_TEST')])
+        del(conf.license_hashes[util.get_sha1sum('tests/COPYING_TEST')])
         conf.license_show = "license.show.url"
         license.license_from_copying_hash('tests/COPYING_TEST', '', conf, '')
 
@@ -189,6 +228,57 @@ class TestLicense(unittest.TestCase):
         # unset the manual mock
         download.pycurl.Curl = pycurl.Curl
 
+    def test_licenses_from_copying_hashes_license_server(self):
+        """
+        Test that license server queries are made once per distinct hash, run
+        concurrently, and are answered from the cache on the next scan
+        """
+        queries = []
+
+        class LicenseHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                fields = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                queries.append(fields['hash'][0])
+                answer = 'MIT' if 'MIT' in fields['text'][0] else ''
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(answer.encode('utf-8'))
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), LicenseHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        curl_patch = patch('download.pycurl.Curl', real_curl)
+        curl_patch.start()
+        self.addCleanup(curl_patch.stop)
+
+        conf = config.Config("")
+        conf.license_fetch = 'http://127.0.0.1:{}/hash.cgi'.format(server.server_address[1])
+        srcdir = self.tmpdir.name
+        copyings = []
+        for name, content in (('a', 'MIT license\n'), ('b', 'MIT license\n'), ('c', 'Mystery license\n')):
+            os.mkdir(os.path.join(srcdir, name))
+            copyings.append(os.path.join(srcdir, name, 'COPYING'))
+            util.write_out(copyings[-1], content)
+
+        with redirect_stdout(StringIO()):
+            license.licenses_from_copying_hashes(copyings, srcdir, conf, 'pkg')
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(license.licenses, ['MIT'])
+        self.assertEqual(license.license_files, ['a/COPYING', 'b/COPYING'])
+
+        # only the unanswered hash is asked again
+        with redirect_stdout(StringIO()):
+            license.licenses_from_copying_hashes(copyings, srcdir, conf, 'pkg')
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(queries[2], util.get_sha1sum(copyings[2]))
+
     def test_scan_for_licenses(self):
         """
         Test scan_for_licenses in temporary directory with valid license file
@@ -210,6 +300,37 @@ class TestLicense(unittest.TestCase):
 
         self.assertIn('GPL-3.0', license.licenses)
 
+    def test_scan_for_licenses_parallel(self):
+        """
+        Test that hashing candidates in a thread pool gives the same results,
+        in the same order, as hashing them one at a time
+        """
+        conf = config.Config("")
+        conf.setup_patterns()
+        conf.license_show = "license.show.url/%(HASH)s"
+        srcdir = os.path.join(self.tmpdir.name, 'src')
+        os.mkdir(srcdir)
+        for i in range(20):
+            os.mkdir(os.path.join(srcdir, 'vendor{}'.format(i)))
+            if i % 3:
+                content = util.get_contents('tests/COPYING_TEST')
+            else:
+                content = 'Vendored license {}\n'.format(i).encode('utf-8')
+            with open(os.path.join(srcdir, 'vendor{}'.format(i), 'LICENSE'), 'wb') as f:
+                f.write(content)
+        util.write_out(os.path.join(srcdir, 'vendor0', 'LICENSE.sh'), '#!/bin/sh\n')
+
+        results = []
+        for min_jobs in (len(os.listdir(srcdir)) + 10, 1):
+            license.licenses = []
+            out = StringIO()
+            with patch('license.license_hash_pool_min_jobs', min_jobs), redirect_stdout(out):
+                license.scan_for_licenses(srcdir, conf, '')
+            results.append((license.licenses, out.getvalue()))
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][0], ['GPL-3.0'])
+
     def test_scan_for_licenses_none(self):
         """
         Test scan_for_licenses in temporary directory with no matching files.
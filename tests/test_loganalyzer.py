@@ -0,0 +1,129 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import check
+import loganalyzer
+import logcheck
+
+BUILD_LOG = """\
+Executing(%build): /bin/sh -e /var/tmp/rpm-tmp.build
+checking for foo... no
+checking for gcc option to accept ISO C89... none required
+checking whether double complex BLAS can be used... no
+gcc -O2 -march=native -c foo.c
+gcc -O2 -march=native -c bar.c
+Executing(%check): /bin/sh -e /var/tmp/rpm-tmp.check
+============ 3 failed, 10 passed, 2 skipped in 0.12s ============
+Child return code was: 0
+"""
+
+
+class CountLines(loganalyzer.LogConsumer):
+
+    def __init__(self):
+        self.lines = 0
+        self.seen = []
+        self.finished = False
+
+    def feed(self, line):
+        self.lines += 1
+        self.seen.append(line)
+
+    def finish(self):
+        self.finished = True
+
+
+class TestLogAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmpdir.name, "build.log")
+        with open(self.log, "w") as logf:
+            logf.write(BUILD_LOG)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, name):
+        with open(os.path.join(self.tmpdir.name, name)) as f:
+            return f.read()
+
+    def test_analyze_log(self):
+        """Test that every consumer sees the log in the same pass"""
+        lines = CountLines()
+        warnings = loganalyzer.WarningPatterns()
+        misses = logcheck.ConfigureMisses(self.tmpdir.name, strict=False)
+        tests = check.TestResults(self.tmpdir.name)
+        with patch('loganalyzer.util.print_warning') as print_warning:
+            loganalyzer.analyze_log(self.log, [lines, warnings, misses, tests])
+
+        self.assertEqual(lines.lines, 9)
+        self.assertTrue(lines.finished)
+        print_warning.assert_called_once_with("Build log contains: march=native")
+        self.assertEqual(self.read("configure_misses"),
+                         "Blacklisted configure-miss is forbidden: whether double complex BLAS can be used\n"
+                         "Configure miss: foo")
+        self.assertIn("Total : 15\nPass : 10\nFail : 3\nSkip : 2\n", self.read("testresults"))
+
+    def test_logcheck_blacklisted(self):
+        """Test that standalone logcheck stops on a blacklisted miss"""
+        os.mkdir(os.path.join(self.tmpdir.name, "results"))
+        os.rename(self.log, os.path.join(self.tmpdir.name, "results", "build.log"))
+        with patch('logcheck.print_fatal'), self.assertRaises(SystemExit):
+            logcheck.logcheck(self.tmpdir.name)
+        self.assertEqual(self.read("configure_misses"),
+                         "Blacklisted configure-miss is forbidden: whether double complex BLAS can be used\n"
+                         "Configure miss: foo")
+
+    def test_load_configure_list(self):
+        """Test that the configure lists are loaded as sets"""
+        blacklist = logcheck.load_configure_list("configure_blacklist")
+        self.assertIsInstance(blacklist, set)
+        self.assertIn("whether double complex BLAS can be used", blacklist)
+
+    def test_warning_patterns_same_line(self):
+        """Test that every pattern on a line is warned about, once"""
+        warnings = loganalyzer.WarningPatterns(["march=native", "-O0", "-Werror"])
+        with patch('loganalyzer.util.print_warning') as print_warning:
+            warnings.feed("gcc -march=native -O0 -c foo.c\n")
+        self.assertEqual([call.args[0] for call in print_warning.call_args_list],
+                         ["Build log contains: march=native", "Build log contains: -O0"])
+        self.assertEqual(warnings.patterns, ["-Werror"])
+        with patch('loganalyzer.util.print_warning') as print_warning:
+            warnings.feed("gcc -march=native -O0 -c bar.c\n")
+        print_warning.assert_not_called()
+
+    def test_log_follower(self):
+        """Test that a followed log is fed from where it was when following started"""
+        lines = CountLines()
+        follower = loganalyzer.LogFollower(self.log, [lines], interval=0.01)
+        follower.start()
+        with open(self.log, "a") as logf:
+            logf.write("Executing(%install)\n")
+            logf.flush()
+            logf.write("partial")
+            logf.flush()
+            time.sleep(0.05)
+            logf.write(" line\nlast")
+        follower.stop()
+        self.assertEqual(lines.seen, ["Executing(%install)\n", "partial line\n", "last"])
+        self.assertTrue(lines.finished)
+
+    def test_log_follower_new_file(self):
+        """Test that a log created after following started is read from its start"""
+        lines = CountLines()
+        new_log = os.path.join(self.tmpdir.name, "root.log")
+        follower = loganalyzer.LogFollower(new_log, [lines], interval=0.01)
+        follower.start()
+        time.sleep(0.03)
+        with open(new_log, "w") as logf:
+            logf.write("INFO: chroot init\n")
+        follower.stop()
+        self.assertEqual(lines.seen, ["INFO: chroot init\n"])
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True)
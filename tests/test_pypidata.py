@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+import pypidata
+import toml
+import util
+
+# test_buildreq replaces toml.loads in place
+real_toml_loads = toml.loads
+
+
+class TestPypidata(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.srcdir = os.path.join(self.tmpdir.name, "src")
+        os.mkdir(self.srcdir)
+        os.mkdir(os.path.join(self.tmpdir.name, "cache"))
+        cache_patch = patch("util.cache_root", os.path.join(self.tmpdir.name, "cache"))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        toml_patch = patch("pypidata.toml.loads", real_toml_loads)
+        toml_patch.start()
+        self.addCleanup(toml_patch.stop)
+
+    def test_requirement_names(self):
+        """Test requirement name extraction, skipping extras."""
+        reqs = ["Foo-Bar>=1.0", "baz ; python_version < '3.8'", "qux[socks]", "pytest; extra == 'test'", "foo-bar"]
+        self.assertEqual(pypidata.requirement_names(reqs), ["foo_bar", "baz", "qux"])
+
+    def test_get_local_metadata_pkg_info(self):
+        """Test that PKG-INFO fields win over pyproject.toml and setup.cfg."""
+        util.write_out(os.path.join(self.srcdir, "PKG-INFO"),
+                       "Metadata-Version: 2.1\nName: My-Pkg\nSummary: A package\n"
+                       "Requires-Dist: requests (>=2)\nRequires-Dist: sphinx; extra == \"docs\"\n\nlong description\n")
+        util.write_out(os.path.join(self.srcdir, "pyproject.toml"),
+                       "[project]\nname = \"other\"\nlicense = {text = \"MIT\"}\ndependencies = [\"six\"]\n")
+        self.assertEqual(pypidata.get_local_metadata(self.srcdir),
+                         {"name": "my_pkg", "summary": "A package", "requires": ["requests"], "license": "MIT"})
+
+    def test_get_local_metadata_setup_cfg(self):
+        """Test metadata from setup.cfg and egg-info requires.txt."""
+        util.write_out(os.path.join(self.srcdir, "setup.cfg"),
+                       "[metadata]\nname = cfg-pkg\ndescription = From setup.cfg\nlicense = file: LICENSE\n")
+        os.mkdir(os.path.join(self.srcdir, "cfg_pkg.egg-info"))
+        util.write_out(os.path.join(self.srcdir, "cfg_pkg.egg-info", "requires.txt"),
+                       "attrs>=19\nSix\n\n[test]\npytest\n")
+        self.assertEqual(pypidata.get_local_metadata(self.srcdir),
+                         {"name": "cfg_pkg", "summary": "From setup.cfg", "requires": ["attrs", "six"]})
+
+    def test_get_pypi_metadata_json_fallback(self):
+        """Test the PyPI JSON fallback and its cache."""
+        info = {"info": {"name": "Remote-Pkg", "summary": "Remote", "license": "BSD",
+                         "requires_dist": ["idna", "chardet; extra == 'all'"]}}
+        with patch("pypidata.download.do_curl", return_value=BytesIO(json.dumps(info).encode("utf-8"))) as m_curl:
+            first = pypidata.get_pypi_metadata("remote_pkg", self.srcdir)
+            second = pypidata.get_pypi_metadata("remote_pkg", self.srcdir)
+        m_curl.assert_called_once_with("https://pypi.org/pypi/remote_pkg/json")
+        self.assertEqual(first, second)
+        self.assertEqual(json.loads(first),
+                         {"name": "remote_pkg", "summary": "Remote", "license": "BSD", "requires": ["idna"]})
+
+    def test_get_pypi_metadata_missing(self):
+        """Test that an unknown package gives no metadata."""
+        with patch("pypidata.download.do_curl", return_value=None):
+            self.assertEqual(pypidata.get_pypi_metadata("missing", self.srcdir), "")
+
+
+    def test_get_pypi_name_cache(self):
+        """Test that name lookups, including misses, are cached."""
+        status = {"pypi_foo": 404, "foo": 200, "bar": 404}
+        with patch("pypidata.download.do_curl_status", side_effect=lambda url: status[url.split("/")[4]]) as m_status:
+            self.assertEqual(pypidata.get_pypi_name("pypi-foo"), "foo")
+            self.assertEqual(pypidata.get_pypi_name("bar", miss=True), "")
+            self.assertEqual(m_status.call_count, 3)
+            self.assertEqual(pypidata.get_pypi_name("pypi-foo"), "foo")
+            self.assertEqual(pypidata.get_pypi_name("bar", miss=True), "")
+            self.assertEqual(m_status.call_count, 3)
+
+    def test_get_pypi_name_unreachable(self):
+        """Test that failures to reach pypi are not cached."""
+        with patch("pypidata.download.do_curl_status", return_value=None) as m_status:
+            self.assertEqual(pypidata.get_pypi_name("foo", miss=True), "")
+            self.assertEqual(pypidata.get_pypi_name("foo", miss=True), "")
+        self.assertEqual(m_status.call_count, 2)
+
+    def test_get_pypi_name_index(self):
+        """Test lookups answered by an exported index file."""
+        index_file = os.path.join(self.tmpdir.name, "index.json")
+        util.write_out(index_file, json.dumps({"projects": [{"name": "Foo-Bar"}, {"name": "baz"}]}))
+        with patch("pypidata.pypi_index_file", index_file), patch("pypidata.pypi_index", None), \
+                patch("pypidata.download.do_curl_status") as m_status:
+            self.assertEqual(pypidata.get_pypi_name("python-foo-bar"), "foo_bar")
+            self.assertEqual(pypidata.get_pypi_name("qux", miss=True), "")
+        m_status.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main(buffer=True)
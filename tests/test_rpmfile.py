@@ -0,0 +1,117 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import tempfile
+import unittest
+import unittest.mock
+import rpmfile
+
+
+def cpio_member(name, mode, data=b"", ino=1, nlink=1):
+    """Return a newc cpio member."""
+    name = name.encode("utf-8") + b"\0"
+    fields = [ino, mode, 0, 0, nlink, 0, len(data), 0, 0, 0, 0, len(name), 0]
+    header = b"070701" + b"".join(b"%08x" % field for field in fields)
+    member = header + name
+    member += b"\0" * ((4 - len(member) % 4) % 4)
+    return member + data + b"\0" * ((4 - len(data) % 4) % 4)
+
+
+def rpm_header(tags):
+    """Return an RPM header structure holding the string tags."""
+    index = b""
+    store = b""
+    for tag, value in tags.items():
+        index += struct.pack(">IIII", tag, rpmfile.RPM_STRING_TYPE, len(store), 1)
+        store += value.encode("utf-8") + b"\0"
+    return rpmfile.HEADER_MAGIC + b"\0" * 4 + struct.pack(">II", len(tags), len(store)) + index + store
+
+
+def build_rpm(path, members, compressor="xz", tag=True):
+    """Write a minimal binary RPM whose payload holds the (name, mode, data, ino, nlink) members."""
+    cpio = b"".join(cpio_member(*member) for member in members) + cpio_member(rpmfile.CPIO_TRAILER, 0)
+    if compressor == "gzip":
+        payload = gzip.compress(cpio)
+    elif compressor == "zstd":
+        payload = subprocess.run(["zstd", "-q", "-c"], input=cpio, stdout=subprocess.PIPE, check=True).stdout
+    else:
+        payload = lzma.compress(cpio)
+    signature = rpm_header({})
+    signature += b"\0" * ((8 - len(signature) % 8) % 8)
+    tags = {rpmfile.RPMTAG_PAYLOADFORMAT: "cpio"}
+    if tag:
+        tags[rpmfile.RPMTAG_PAYLOADCOMPRESSOR] = compressor
+    lead = rpmfile.LEAD_MAGIC + b"\0" * (rpmfile.LEAD_SIZE - 4)
+    with open(path, "wb") as rpm:
+        rpm.write(lead + signature + rpm_header(tags) + payload)
+
+
+FILE = stat.S_IFREG | 0o644
+MEMBERS = [("./usr", stat.S_IFDIR | 0o755, b"", 1),
+           ("./usr/share/doc/pkg/README", FILE, b"hello\n", 2),
+           ("./usr/lib64/libfoo.so", stat.S_IFLNK | 0o777, b"libfoo.so.1", 3),
+           ("./usr/bin/a", FILE, b"", 4, 2),
+           ("./usr/bin/b", FILE, b"linked data", 4, 2)]
+
+
+class TestRpmfile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rpm = os.path.join(self.tmpdir.name, "pkg-1.0-1.x86_64.rpm")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_members(self):
+        return [(entry.name, entry.isreg(), entry.nlink, entry.read())
+                for entry in rpmfile.iter_rpm_files(self.rpm)]
+
+    def test_iter_rpm_files(self):
+        """Test that payload members are streamed with absolute names"""
+        for compressor in ("xz", "gzip"):
+            build_rpm(self.rpm, MEMBERS, compressor)
+            self.assertEqual(self.read_members(),
+                             [("/usr", False, 1, b""),
+                              ("/usr/share/doc/pkg/README", True, 1, b"hello\n"),
+                              ("/usr/lib64/libfoo.so", False, 1, b"libfoo.so.1"),
+                              ("/usr/bin/a", True, 2, b""),
+                              ("/usr/bin/b", True, 2, b"linked data")])
+
+    @unittest.skipUnless(shutil.which("zstd"), "needs zstd")
+    def test_iter_rpm_files_zstd(self):
+        """Test that zstd payloads are streamed through the zstd binary"""
+        for tag in (True, False):
+            build_rpm(self.rpm, MEMBERS, "zstd", tag=tag)
+            with unittest.mock.patch("rpmfile.zstandard", None), \
+                    unittest.mock.patch("rpmfile.util.binary_in_path", return_value=True):
+                self.assertEqual([name for name, _, _, _ in self.read_members()],
+                                 ["/usr", "/usr/share/doc/pkg/README", "/usr/lib64/libfoo.so", "/usr/bin/a", "/usr/bin/b"])
+                self.assertEqual(self.read_members()[1][3], b"hello\n")
+
+    def test_iter_rpm_files_partial_reads(self):
+        """Test that data left unread is skipped"""
+        build_rpm(self.rpm, MEMBERS, "gzip", tag=False)
+        names = []
+        for entry in rpmfile.iter_rpm_files(self.rpm):
+            names.append(entry.name)
+            entry.read(1)
+        self.assertEqual(names[-1], "/usr/bin/b")
+
+    def test_not_an_rpm(self):
+        """Test that other files are rejected"""
+        with open(self.rpm, "wb") as rpm:
+            rpm.write(b"\0" * 200)
+        with self.assertRaises(rpmfile.RpmError):
+            list(rpmfile.iter_rpm_files(self.rpm))
+        with self.assertRaises(rpmfile.RpmError):
+            rpmfile.read_headers(io.BytesIO(rpmfile.LEAD_MAGIC))
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True)
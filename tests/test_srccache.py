@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+import srccache
+import util
+
+
+class TestSourceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+        os.mkdir(self.cache_dir)
+        self.extracted = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def extract(self, content):
+        def extract_f(path):
+            self.extracted.append(path)
+            os.mkdir(os.path.join(path, "pkg-1.0"))
+            util.write_out(os.path.join(path, "pkg-1.0", "configure.ac"), content)
+        return extract_f
+
+    def test_parse_size(self):
+        """Test conversion of human readable cache sizes."""
+        self.assertEqual(srccache.parse_size("1024"), 1024)
+        self.assertEqual(srccache.parse_size("2K"), 2048)
+        self.assertEqual(srccache.parse_size("1.5g"), 1536 * 1024 * 1024)
+        self.assertEqual(srccache.parse_size("20GB"), 20 * 1024 ** 3)
+        with self.assertRaises(ValueError):
+            srccache.parse_size("lots")
+
+    def test_materialize(self):
+        """Test that an archive is only extracted on first use."""
+        cache = srccache.SourceCache(1024 ** 2, self.cache_dir)
+        for run in ("run1", "run2"):
+            dest = os.path.join(self.tmpdir.name, run)
+            cache.materialize("abc", self.extract("AC_INIT\n"), dest)
+            with open(os.path.join(dest, "pkg-1.0", "configure.ac")) as f:
+                self.assertEqual(f.read(), "AC_INIT\n")
+        self.assertEqual(len(self.extracted), 1)
+
+    def test_materialize_private_copy(self):
+        """Test that editing a materialized tree leaves the cache entry alone."""
+        cache = srccache.SourceCache(1024 ** 2, self.cache_dir)
+        dest = os.path.join(self.tmpdir.name, "workingdir")
+        cache.materialize("abc", self.extract("AC_INIT\n"), dest)
+        with open(os.path.join(dest, "pkg-1.0", "configure.ac"), "a") as f:
+            f.write("AC_OUTPUT\n")
+        with open(os.path.join(cache.entry_path("abc"), "pkg-1.0", "configure.ac")) as f:
+            self.assertEqual(f.read(), "AC_INIT\n")
+
+    def test_evict(self):
+        """Test that least recently used entries are evicted first."""
+        cache = srccache.SourceCache(20, self.cache_dir)
+        cache.materialize("old", self.extract("x" * 10), os.path.join(self.tmpdir.name, "a"))
+        os.utime(cache.meta_path("old"), (1, 1))
+        cache.materialize("new", self.extract("y" * 15), os.path.join(self.tmpdir.name, "b"))
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), [".lock", "new", "new.json"])
+
+
+if __name__ == '__main__':
+    unittest.main(buffer=True)
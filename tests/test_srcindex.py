@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+import srcindex
+import util
+
+
+class TestSourceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        for path in ("pkg-1.0", "pkg-1.0/src", "pkg-1.0/tests", "pkg-1.0/src/deep"):
+            os.mkdir(os.path.join(self.root, path))
+        for path, content in (("pkg-1.0/configure.ac", "AC_INIT\n"),
+                              ("pkg-1.0/COPYING", "GPL\n"),
+                              ("pkg-1.0/src/main.c", "int main;\n"),
+                              ("pkg-1.0/src/deep/Util.C", ""),
+                              ("pkg-1.0/tests/test.c", "")):
+            util.write_out(os.path.join(self.root, path), content)
+        os.symlink("src", os.path.join(self.root, "pkg-1.0", "srclink"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def normalize(self, walk):
+        return [(dirpath, sorted(dirnames), sorted(files)) for dirpath, dirnames, files in walk]
+
+    def test_walk_matches_os_walk(self):
+        """Test that walking the index yields what os.walk yields."""
+        index = srcindex.SourceIndex(self.root)
+        top = os.path.join(self.root, "pkg-1.0")
+        for topdown in (True, False):
+            self.assertEqual(sorted(self.normalize(index.walk(top, topdown=topdown))),
+                             sorted(self.normalize(os.walk(top, topdown=topdown))))
+        self.assertEqual(sorted(index.listdir(top)), sorted(os.listdir(top)))
+
+    def test_walk_prune(self):
+        """Test that pruning dirnames in a top-down walk is honoured."""
+        index = srcindex.SourceIndex(self.root)
+        seen = []
+        for dirpath, dirnames, _ in index.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d != "tests"]
+            seen.append(os.path.relpath(dirpath, self.root))
+        self.assertEqual(sorted(seen), [".", "pkg-1.0", "pkg-1.0/src", "pkg-1.0/src/deep"])
+
+    def test_outside_index(self):
+        """Test that paths outside of the index are read from the filesystem."""
+        index = srcindex.SourceIndex(os.path.join(self.root, "pkg-1.0", "src"))
+        top = os.path.join(self.root, "pkg-1.0")
+        self.assertIsNone(index.relpath(top))
+        self.assertEqual(sorted(self.normalize(index.walk(top))), sorted(self.normalize(os.walk(top))))
+        self.assertEqual(sorted(index.listdir(top)), sorted(os.listdir(top)))
+
+if __name__ == '__main__':
+    unittest.main(buffer=True)
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import timings
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimings(unittest.TestCase):
+
+    def test_phase_clock(self):
+        """Test that phases last from their Executing line to the next transition"""
+        clock = FakeClock()
+        phase_clock = timings.PhaseClock(clock)
+        for now, line in [(1, "Mock Version: 2.9\n"),
+                          (2, "Executing(%prep): /bin/sh -e /var/tmp/rpm-tmp.1\n"),
+                          (5, "Executing(%build): /bin/sh -e /var/tmp/rpm-tmp.2\n"),
+                          (25, "Executing(%install): /bin/sh -e /var/tmp/rpm-tmp.3\n"),
+                          (30, "Child return code was: 0\n")]:
+            clock.now = now
+            phase_clock.feed(line)
+        self.assertEqual(phase_clock.first, 1)
+        self.assertEqual(dict(phase_clock.phases()), {"prep": 3, "build": 20, "install": 5})
+
+    def test_report(self):
+        """Test the timings table and timings.json"""
+        clock = FakeClock()
+        build_timings = timings.BuildTimings(clock)
+        causes = {"buildreq added": 2}
+        record = build_timings.start_round(1, None, causes)
+        build_clock = timings.PhaseClock(clock)
+        root_clock = timings.PhaseClock(clock)
+        root_clock.feed("DEBUG util.py:446:  Mock Version: 2.9\n")
+        clock.now = 12
+        build_clock.feed("Executing(%prep): /bin/sh\n")
+        clock.now = 13.25
+        build_clock.feed("Child return code was: 1\n")
+        timings.BuildTimings.record_mock(record, build_clock, root_clock)
+        record["mock"] = 14
+        record["parse"] = 0.5
+
+        table = build_timings.table().splitlines()
+        self.assertEqual(table[0].split(), ["Round", "Stage", "Srpm", "Mock", "Chroot", "Prep", "Build", "Install", "Check", "Parse", "Restart"])
+        self.assertEqual(table[1].split(), ["1", "full", "-", "14.0", "12.0", "1.2", "-", "-", "-", "0.5", "buildreq", "added", "(2)"])
+
+        with tempfile.TemporaryDirectory() as tmpd, patch("timings.util.print_info"), patch("builtins.print"):
+            build_timings.report(tmpd)
+            with open(os.path.join(tmpd, "timings.json")) as timings_f:
+                rounds = json.load(timings_f)["rounds"]
+        self.assertEqual(rounds[0]["phases"], {"prep": 1.25})
+        self.assertEqual(rounds[0]["chroot_setup"], 12)
+        self.assertEqual(rounds[0]["restart"], {"buildreq added": 2})
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True)
@@ -1,3 +1,4 @@
+import io
 import subprocess
 import os
 import tempfile
@@ -64,5 +65,27 @@ class TestUtil(unittest.TestCase):
             self.assertTrue(util.binary_in_path('testbin'))
             self.assertEqual(util.os_paths, [tmpd])
 
+    def test_open_auto_zst(self):
+        """
+        Test that .zst files and compressed logs are read through open_zst
+        """
+        with tempfile.TemporaryDirectory() as tmpd:
+            log = os.path.join(tmpd, "build-round1-build.log")
+            util.write_out(log + ".zst", "")
+            with unittest.mock.patch("util.open_zst", return_value=io.StringIO("line\n")) as open_zst:
+                self.assertEqual(util.open_auto(log + ".zst").read(), "line\n")
+                open_zst.assert_called_with(log + ".zst")
+                open_zst.reset_mock()
+                util.open_auto(log, "r")
+                open_zst.assert_called_with(log + ".zst")
+                open_zst.reset_mock()
+                util.write_out(log, "plain\n")
+                with util.open_auto(log) as logf:
+                    self.assertEqual(logf.read(), "plain\n")
+                with self.assertRaises(FileNotFoundError):
+                    util.open_auto(os.path.join(tmpd, "missing.txt"))
+                open_zst.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main(buffer=True)